@@ -2,17 +2,25 @@
 NutriVision AI - Production Application
 """
 import streamlit as st
-from PIL import Image
+import base64
+import hashlib
 import time
-import json
+import uuid
+from collections import deque
 from datetime import datetime
 
 # Core imports
 from config import Config
-from prompts import DETAILED_NUTRITION_PROMPT, CHAT_SYSTEM_PROMPT
-from utils.api_client import call_qubrid_api, call_qubrid_api_stream
-from utils.image_processor import encode_image_to_base64
-from utils.parser import parse_nutrition_data
+from utils.api_client import call_qubrid_api, call_qubrid_api_stream, get_client
+from utils.image_processor import encode_upload, open_thumbnail, encode_preview
+from utils.analysis import analyze_image
+from utils.chat_context import ChatContext
+from utils.intent_router import answer_locally
+from utils.answer_cache import get_answer_cache, replay_stream
+from utils.history_store import get_history_store
+from utils.session_store import get_session_store
+from utils.rate_limiter import request_context, PRIORITY_ANALYSIS, PRIORITY_CHAT
+from utils.metrics import StreamTimer, get_metrics, start_metrics_server
 from utils.styles import get_custom_css
 
 # UI Components
@@ -20,11 +28,13 @@ from utils.ui_components import (
     display_macro_row, 
     display_health_bar, 
     display_metrics_footer,
-    format_analysis_report
+    format_analysis_report,
+    content_key,
+    dish_title_html,
+    macro_row_html,
+    health_bar_html
 )
 
-Config.validate()
-
 st.set_page_config(
     page_title=Config.PAGE_TITLE,
     page_icon=Config.PAGE_ICON,
@@ -32,15 +42,53 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def init_api_client():
+    """Validate configuration, create the shared pooled client once per server and pre-open connections"""
+    Config.validate()
+    client = get_client()
+    client.warm_up()
+    return client
+
+try:
+    init_api_client()
+except ValueError as e:
+    # Not cached, so fixing .env and rerunning recovers without a restart
+    st.error(f"⚠️ Configuration error: {e}")
+    st.stop()
+
+@st.cache_resource
+def init_metrics_server():
+    """Expose /metrics once per server when NUTRIVISION_METRICS_PORT is set"""
+    if Config.METRICS_PORT:
+        return start_metrics_server(Config.METRICS_PORT, Config.METRICS_HOST)
+    return None
+
+init_metrics_server()
+metrics = get_metrics()
+session_store = get_session_store()
+
 # Initialize Session State
 if 'analyzed' not in st.session_state:
     st.session_state.analyzed = False
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
-if 'nutrition_data' not in st.session_state:
-    st.session_state.nutrition_data = {}
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex    # Owner of this session's blobs in the session store
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = Config.HISTORY_USER
+if 'history_cursor' not in st.session_state:
+    st.session_state.history_cursor = None     # Keyset cursor of the history page shown (None: newest)
+    st.session_state.history_back = deque(maxlen=Config.HISTORY_BACK_PAGES)     # Cursors of the newer pages
+
+# The analysis, the chat transcript and the rendered report live in the memory-capped session
+# store, not in st.session_state. A session it evicted while idle starts over from the upload
+session_id = st.session_state.session_id
+if st.session_state.analyzed and not session_store.has(session_id, "nutrition"):
+    st.session_state.analyzed = False
+messages = session_store.get_json(session_id, "messages", [])
+
+def add_message(role: str, content: str):
+    messages.append({"role": role, "content": content})
+    session_store.put_json(session_id, "messages", messages)
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -55,23 +103,62 @@ with st.sidebar:
     uploaded_file = st.file_uploader("Drag & drop or browse", type=["jpg", "jpeg", "png"])
     
     if uploaded_file:
-        image = Image.open(uploaded_file)
-        # --- FIX APPLIED HERE (Line 60) ---
-        st.image(image, caption="Uploaded Image", use_container_width=True)
+        raw_bytes = uploaded_file.getvalue()
+        upload_digest = hashlib.sha1(raw_bytes).hexdigest()
+        
+        # Everything derived from the upload is computed once per distinct file content. Only the
+        # compressed bytes are kept, in the memory-capped session store (re-encoded if it evicted them)
+        if (st.session_state.get('upload_digest') != upload_digest
+                or not session_store.has(session_id, "encoded")
+                or not session_store.has(session_id, "preview")):
+            # encode_upload records the "decode" and "encode" stages itself
+            encoded = encode_upload(raw_bytes)
+            with metrics.span("thumbnail"):
+                thumbnail = open_thumbnail(raw_bytes, Config.PREVIEW_MAX_EDGE)
+                session_store.put(session_id, "preview", encode_preview(thumbnail))
+            session_store.put(session_id, "encoded", base64.b64decode(encoded["base64"]))
+            st.session_state.image_encoding = {k: v for k, v in encoded.items() if k != "base64"}
+            st.session_state.upload_digest = upload_digest
         
-        if 'last_uploaded' not in st.session_state or st.session_state.last_uploaded != uploaded_file.name:
-            st.session_state.uploaded_image = image
-            st.session_state.image_base64 = encode_image_to_base64(image)
-            st.session_state.last_uploaded = uploaded_file.name
+        # Reruns re-send the small cached thumbnail, not the multi-megabyte original
+        preview_bytes = session_store.get(session_id, "preview")
+        st.image(preview_bytes, caption="Uploaded Image", use_container_width=True)
+        
+        if 'image_encoding' in st.session_state:
+            enc = st.session_state.image_encoding
+            quality = f"q{enc['quality']}" if enc['quality'] else enc.get('path', '')
+            st.caption(f"📦 {enc['width']}×{enc['height']} {enc['format']} {quality} · {enc['bytes']/1024:.0f} KB · {enc['encode_ms']:.0f} ms")
             
     st.markdown("---")
-    if st.session_state.history:
-        st.markdown("### 📜 Recent History")
-        for i, item in enumerate(reversed(st.session_state.history)):
-            if i >= 3: break
-            st.caption(f"🕒 {item['time']} - {item['dish']}")
+    if Config.HISTORY_ENABLED:
+        # One indexed page per rerun: session memory stays constant however long the history grows
+        history = get_history_store()
+        cursor = st.session_state.history_cursor
+        meals, next_cursor = history.recent(st.session_state.user_id, Config.HISTORY_PAGE_SIZE, cursor)
+        if meals:
+            st.markdown("### 📜 Recent History")
+            for item in meals:
+                when = datetime.fromtimestamp(item['created_at']).strftime("%d %b %H:%M")
+                st.caption(f"🕒 {when} - {item['dish_name']} · {item['calories']:.0f} kcal")
+            newer_col, older_col = st.columns(2)
+            back = st.session_state.history_back
+            if newer_col.button("◀ Newer", disabled=cursor is None, use_container_width=True):
+                # Past the bounded back-stack, "Newer" returns to the newest page
+                st.session_state.history_cursor = back.pop() if back else None
+                st.rerun()
+            if older_col.button("Older ▶", disabled=next_cursor is None, use_container_width=True):
+                back.append(cursor)
+                st.session_state.history_cursor = next_cursor
+                st.rerun()
+            
+            totals = history.totals(st.session_state.user_id)
+            for label, row in (("Today", totals['day']), ("This week", totals['week'])):
+                if row:
+                    st.caption(f"📊 {label}: {row['meals']} meals · {row['calories']:.0f} kcal · "
+                               f"P {row['protein']:.0f}g · C {row['carbs']:.0f}g · F {row['fat']:.0f}g (per-100g basis)")
 
     if st.button("🔄 Reset App", type="secondary", use_container_width=True):
+        session_store.drop(st.session_state.session_id)
         st.session_state.clear()
         st.rerun()
 
@@ -102,25 +189,57 @@ else:
             
             with st.spinner("🔍 Analyzing nutritional content..."):
                 try:
-                    # 1. Call API for Analysis (Strict JSON Mode)
-                    messages = [{"role": "user", "content": DETAILED_NUTRITION_PROMPT, "image": st.session_state.image_base64}]
+                    # 1. Analyze (Strict JSON Mode), served from the content cache when the image was seen before
+                    render_field = None
+                    if enable_stream:
+                        # Render each field as soon as its JSON value is complete
+                        partial = {}
+                        title_slot, macro_slot, health_slot = st.empty(), st.empty(), st.empty()
+                        
+                        def show_field(key, value):
+                            partial[key] = value
+                            if key == 'dish_name':
+                                title_slot.markdown(dish_title_html(value), unsafe_allow_html=True)
+                            elif key in ('calories', 'protein', 'carbs', 'fat'):
+                                with macro_slot.container():
+                                    display_macro_row(partial)
+                            elif key == 'health_score':
+                                with health_slot.container():
+                                    display_health_bar(value if isinstance(value, int) else 0)
+
+                        render_field = show_field
                     
+                    # The base64 string and the decoded preview (for near-duplicate hashing) are rebuilt here
+                    # from the stored bytes and released once the analysis returns
+                    # Under quota pressure the call queues (analysis ahead of chat) and the wait is shown
+                    queue_slot = st.empty()
                     start_time = time.time()
-                    # We typically don't stream the JSON analysis because we need to parse it all at once
-                    response_text = call_qubrid_api(messages) 
+                    with request_context(PRIORITY_ANALYSIS, on_wait=lambda s: queue_slot.info(f"⏳ High demand: queued for about {s:.0f}s")):
+                        data, response_text = analyze_image(
+                            session_store.get_base64(st.session_state.session_id, "encoded"),
+                            open_thumbnail(preview_bytes, Config.PREVIEW_MAX_EDGE),
+                            on_field=render_field
+                        )
+                    queue_slot.empty()
                     end_time = time.time()
                     
-                    # 2. Parse Data
-                    data = parse_nutrition_data(response_text)
-                    st.session_state.nutrition_data = data
+                    # 2. Store Data (the chat context serializes it once per analysis)
+                    session_store.put_json(session_id, "nutrition", data)
+                    st.session_state.analysis_key = content_key(data)
+                    st.session_state.chat_context = ChatContext(data)
                     st.session_state.analyzed = True
                     
-                    # 3. Stats & History
-                    st.session_state.last_stats = (len(response_text)//4, end_time-start_time, (len(response_text)//4)/(end_time-start_time))
-                    st.session_state.history.append({
-                        "time": datetime.now().strftime("%H:%M"),
-                        "dish": data.get('dish_name', 'Unknown')
-                    })
+                    # 3. Stats & History (a cache hit costs no tokens; real counts when the API reports usage)
+                    usage = get_client().last_usage if response_text and not enable_stream else None
+                    if usage and usage.get('completion_tokens') is not None:
+                        tokens = usage['completion_tokens']
+                    else:
+                        tokens = len(response_text)//4 if response_text else 0
+                    st.session_state.last_stats = (tokens, end_time-start_time, tokens/max(end_time-start_time, 1e-6))
+                    if Config.HISTORY_ENABLED and 'error' not in data:
+                        get_history_store().add(st.session_state.user_id, data)
+                        st.session_state.history_cursor = None
+                        st.session_state.history_back.clear()
                     
                     st.rerun()
                     
@@ -129,64 +248,110 @@ else:
 
     # --- RESULTS DISPLAY ---
     if st.session_state.analyzed:
-        data = st.session_state.nutrition_data
+        data = session_store.get_json(session_id, "nutrition", {})
+        render_start = time.perf_counter()
+        
+        # Rendered fragments are rebuilt only when the analysis or the theme changes,
+        # not on every chat message or widget interaction
+        render_key = (st.session_state.get('analysis_key'), theme)
+        rendered = session_store.get_json(session_id, "rendered")
+        if rendered is None or st.session_state.get('render_key') != render_key:
+            rendered = {
+                'title': dish_title_html(data.get('dish_name', 'Unknown Dish')),
+                'macros': macro_row_html(data),
+                'health': health_bar_html(data.get('health_score', 0)),
+                'report': format_analysis_report(data),
+            }
+            session_store.put_json(session_id, "rendered", rendered)
+            st.session_state.render_key = render_key
         
         # 1. Dish Title
-        dish_name = data.get('dish_name', 'Unknown Dish')
-        st.markdown(f"""
-        <div class="dish-title-card">
-            <h2 class="dish-name">🍽️ {dish_name}</h2>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(rendered['title'], unsafe_allow_html=True)
         
         # 2. Nutrition Cards (RESTORED HERE)
-        display_macro_row(data)
-        display_health_bar(data.get('health_score', 0))
+        st.markdown(rendered['macros'], unsafe_allow_html=True)
+        st.markdown(rendered['health'], unsafe_allow_html=True)
         
         # 3. Detailed Report
         with st.expander("📋 View Full Analysis Report", expanded=True):
-            report = format_analysis_report(data)
-            st.markdown(report)
+            st.markdown(rendered['report'])
+        metrics.observe("ui_render", time.perf_counter() - render_start)
             
         # 4. Stats Footer
         if hasattr(st.session_state, 'last_stats'):
             tokens, duration, tps = st.session_state.last_stats
-            display_metrics_footer(tokens, duration, tps)
+            display_metrics_footer(tokens, duration, tps, st.session_state.get('last_chat_stats'))
             
         # 5. Chat Interface
         st.markdown("---")
         st.markdown("### 💬 Ask Follow-Up Questions")
         
-        for msg in st.session_state.messages:
+        for msg in messages:
             cls = "chat-message-user" if msg['role'] == 'user' else "chat-message-ai"
             st.markdown(f'<div class="{cls}">{msg["content"]}</div>', unsafe_allow_html=True)
             
         if prompt := st.chat_input("Ask about this food..."):
-            st.session_state.messages.append({"role": "user", "content": prompt})
+            add_message("user", prompt)
             st.rerun()
 
 # --- CHAT GENERATION LOGIC ---
-if st.session_state.analyzed and st.session_state.messages and st.session_state.messages[-1]['role'] == 'user':
-    with st.spinner("Thinking..."):
-        # Create a clean context for the chat
-        # We inject the parsed data so the AI knows what it's talking about
-        data_context = json.dumps(st.session_state.nutrition_data, indent=2)
-        system_msg = CHAT_SYSTEM_PROMPT.format(nutrition_data=data_context)
+if st.session_state.analyzed and messages and messages[-1]['role'] == 'user':
+    nutrition_data = session_store.get_json(session_id, "nutrition", {})
+    # Factual questions (macros, dietary flags, allergens, score) are answered from the data directly
+    if Config.CHAT_LOCAL_ANSWERS:
+        local_answer = answer_locally(messages[-1]['content'], nutrition_data)
+        if local_answer is not None:
+            add_message("assistant", local_answer)
+            st.session_state.last_chat_stats = None
+            st.rerun()
+    
+    # Create a clean context for the chat
+    # We inject the parsed data so the AI knows what it's talking about,
+    # keeping the history under the token budget
+    if 'chat_context' not in st.session_state:
+        st.session_state.chat_context = ChatContext(nutrition_data)
+    api_messages = st.session_state.chat_context.build_messages(messages)
+    
+    # Another session may already have asked an equivalent question about the same dish
+    answer_cache = get_answer_cache() if Config.ANSWER_CACHE_ENABLED else None
+    cached_answer = None
+    if answer_cache is not None:
+        cached_answer = answer_cache.lookup(nutrition_data, messages)
         
-        # Build message history for the API
-        api_messages = [{"role": "system", "content": system_msg}]
+    full_response = ""
+    # TTFT/ITL describe the model: time spent queued for quota is left out
+    timer = StreamTimer()
+    queue_slot = st.empty()
+    try:
+        with request_context(PRIORITY_CHAT, on_wait=lambda s: queue_slot.info(f"⏳ High demand: queued for about {s:.0f}s"),
+                             on_admitted=timer.exclude):
+            if enable_stream:
+                # Render chunks as they arrive, throttled to Config.CHAT_REDRAW_HZ (0 or less: every chunk)
+                bubble = st.empty()
+                bubble.markdown('<div class="chat-message-ai">…</div>', unsafe_allow_html=True)
+                redraw_interval = 1.0 / Config.CHAT_REDRAW_HZ if Config.CHAT_REDRAW_HZ > 0 else 0.0
+                last_draw = 0.0
+                # A cached answer is replayed as a stream so the UI behaves the same
+                chunks = replay_stream(cached_answer) if cached_answer is not None else call_qubrid_api_stream(api_messages)
+                for chunk in chunks:
+                    now = timer.tick()
+                    full_response += chunk
+                    if now - last_draw >= redraw_interval:
+                        bubble.markdown(f'<div class="chat-message-ai">{full_response}▌</div>', unsafe_allow_html=True)
+                        last_draw = now
+                bubble.markdown(f'<div class="chat-message-ai">{full_response}</div>', unsafe_allow_html=True)
+            else:
+                with st.spinner("Thinking..."):
+                    full_response = cached_answer if cached_answer is not None else (call_qubrid_api(api_messages) or "")
+                    timer.tick()
         
-        # Add conversation history
-        for msg in st.session_state.messages:
-            api_messages.append(msg)
-            
-        # Call API (Streamed)
-        full_response = ""
-        try:
-            for chunk in call_qubrid_api_stream(api_messages):
-                full_response += chunk
-            
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-            st.rerun()
-        except Exception as e:
-            st.error(f"Chat Error: {e}")
+        queue_slot.empty()
+        
+        if answer_cache is not None and cached_answer is None:
+            answer_cache.store(nutrition_data, messages, full_response)
+        # A replayed cached answer says nothing about model latency
+        st.session_state.last_chat_stats = timer.summary() if cached_answer is None else None
+        add_message("assistant", full_response)
+        st.rerun()
+    except Exception as e:
+        st.error(f"Chat Error: {e}")
@@ -0,0 +1,347 @@
+"""
+NutriVision AI - Headless Batch Analysis
+
+Analyzes every image in a directory (or listed in a manifest) and appends one
+JSON line per image to an output file. Safe to interrupt and re-run: completed
+images are skipped using a checkpoint stored next to the output. The
+checkpoint remembers which inputs it covered: if the directory or manifest
+changed in between, the run stops instead of resuming against shifted
+indices (start a new output file in that case). With --retry-errors the
+retried images replace their earlier error records once the run finishes.
+
+Usage:
+    python batch.py --input photos/ --output results.jsonl
+    python batch.py --manifest paths.txt --output results.jsonl --concurrency 32
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import Config
+from prompts import DETAILED_NUTRITION_PROMPT
+from utils.async_client import AsyncQubridClient
+from utils.food_reference import get_food_reference
+from utils.image_processor import encode_upload
+from utils.parser import parse_nutrition_data
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+# ---------------------------------------------------------------- inputs
+
+def iter_directory(root: str) -> Iterator[str]:
+    """Walk a directory tree in a stable (sorted) order, one level in memory at a time"""
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except OSError as e:
+        print(f"Skipping {root}: {e}", file=sys.stderr)
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_directory(entry.path)
+        elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+            yield entry.path
+
+def iter_manifest(path: str) -> Iterator[str]:
+    """Read image paths from a text file (one per line) or JSONL (objects with a "path" key)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line).get("path", "")
+            if line:
+                yield line
+
+
+# ---------------------------------------------------------------- checkpointing
+
+class CheckpointMismatch(Exception):
+    """The inputs no longer enumerate the way they did when the checkpoint was written"""
+
+
+def _chain(digest: str, path: str) -> str:
+    """Extend a running digest of the input list by one path"""
+    return hashlib.sha256(f"{digest}\0{path}".encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """
+    Resume state kept in constant memory.
+
+    Inputs are numbered in their (deterministic) enumeration order. The
+    checkpoint stores a watermark below which every index is finished; only
+    indices completed out of order above the watermark are held (with their
+    paths), and that map never exceeds the in-flight window.
+
+    A running digest of the paths below the watermark is stored too, and
+    every index is checked against its path while the inputs are enumerated
+    again, so images added, removed or renamed between runs stop the resume
+    instead of silently shifting which images count as done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0
+        self.digest = ""                       # Chain of the paths below the watermark
+        self.done_above: Dict[int, str] = {}   # Index -> path, completed above the watermark
+        self._expected: Optional[Tuple[int, str]] = None   # (watermark, digest) saved by the last run
+        self._seen = ""
+
+    def load(self, output_path: str, retry_errors: bool):
+        # Retrying errors means errored indices below the watermark must run again,
+        # so rebuild from the output alone (memory then grows with the result count)
+        verifiable = True
+        if os.path.exists(self.path) and not retry_errors:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.watermark = int(state.get("watermark", 0))
+            self.digest = state.get("digest", "")
+            if self.watermark and not self.digest:
+                verifiable = False
+                print("Checkpoint predates input verification; assuming the inputs are unchanged", file=sys.stderr)
+
+        # Records past the watermark were written after the last checkpoint save
+        if os.path.exists(output_path):
+            with open(output_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn final line from an interrupted run
+                    index = record.get("index", -1)
+                    if index >= self.watermark and (record.get("status") == "ok" or not retry_errors):
+                        self.done_above[index] = record.get("path", "")
+        self._advance()
+        if verifiable and self.watermark:
+            self._expected = (self.watermark, self.digest)
+
+    def is_done(self, index: int, path: str) -> bool:
+        """
+        Whether an input needs no work, verifying it is the input recorded at that index
+
+        Raises:
+            CheckpointMismatch: If the inputs changed since the checkpoint was written
+        """
+        if self._expected is not None and index < self._expected[0]:
+            self._seen = _chain(self._seen, path)
+            if index == self._expected[0] - 1 and self._seen != self._expected[1]:
+                raise CheckpointMismatch(
+                    f"the first {self._expected[0]} inputs differ from the run that wrote {self.path}"
+                )
+            return True
+        done = self.done_above.get(index)
+        if done is None:
+            return index < self.watermark
+        if done != path:
+            raise CheckpointMismatch(f"input #{index} is {path}, but the output has a result for {done}")
+        return True
+
+    def check_count(self, count: int):
+        """After enumeration: inputs the checkpoint covered must not have disappeared"""
+        if self._expected is not None and count < self._expected[0]:
+            raise CheckpointMismatch(f"{count} inputs now, but {self.path} covers {self._expected[0]}")
+
+    def mark(self, index: int, path: str):
+        self.done_above[index] = path
+        self._advance()
+
+    def _advance(self):
+        while self.watermark in self.done_above:
+            self.digest = _chain(self.digest, self.done_above.pop(self.watermark))
+            self.watermark += 1
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "digest": self.digest, "saved_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+
+def compact_output(path: str):
+    """
+    Keep only the last record per index (a retried image supersedes its earlier error)
+
+    Holds one line number per result in memory, like --retry-errors itself.
+    """
+    last: Dict[int, int] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            try:
+                last[json.loads(line)["index"]] = number
+            except (ValueError, KeyError, TypeError):
+                continue
+    keep = set(last.values())
+    tmp_path = f"{path}.tmp"
+    with open(path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        for number, line in enumerate(src):
+            if number in keep:
+                dst.write(line if line.endswith("\n") else line + "\n")
+    os.replace(tmp_path, path)
+
+
+# ---------------------------------------------------------------- pipeline
+
+def _preprocess(path: str) -> Tuple[str, Dict]:
+    """Runs in a worker process: read and encode one image"""
+    with open(path, "rb") as f:
+        raw_bytes = f.read()
+    encoded = encode_upload(raw_bytes)
+    image_base64 = encoded.pop("base64")
+    return image_base64, encoded
+
+def _terminate_torn_line(out):
+    """Make sure appended records start on a fresh line after an interrupted write"""
+    if out.tell() == 0:
+        return
+    out.seek(out.tell() - 1)
+    if out.read(1) != "\n":
+        out.write("\n")
+
+class BatchRunner:
+    """Streams inputs through the process pool and the async client with a bounded window"""
+
+    def __init__(self, output_path: str, concurrency: int, workers: Optional[int], retry_errors: bool):
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.workers = workers
+        self.retry_errors = retry_errors
+        # Enough queued work to keep both the pool and the network busy
+        self.window = concurrency * 2
+
+        self.checkpoint = Checkpoint(f"{output_path}.ckpt")
+        self.stats = {"ok": 0, "error": 0, "skipped": 0}
+        self._started = 0.0
+        self._last_report = 0.0
+        self._since_save = 0
+
+    async def run(self, paths: Iterator[str]):
+        self.checkpoint.load(self.output_path, self.retry_errors)
+        self._started = self._last_report = time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.window)
+        pending = set()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool, \
+                open(self.output_path, "a+", encoding="utf-8") as out:
+            _terminate_torn_line(out)
+            async with AsyncQubridClient(max_concurrency=self.concurrency) as client:
+                count = 0
+                try:
+                    for index, path in enumerate(paths):
+                        count = index + 1
+                        if self.checkpoint.is_done(index, path):
+                            self.stats["skipped"] += 1
+                            continue
+                        await slots.acquire()
+                        task = asyncio.ensure_future(self._process(loop, pool, client, out, index, path))
+                        task.add_done_callback(lambda _: slots.release())
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                except CheckpointMismatch:
+                    # Results of a changed input list would be filed under the wrong indices
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    raise
+
+                if pending:
+                    await asyncio.gather(*pending)
+                self.checkpoint.check_count(count)
+
+        self.checkpoint.save()
+        if self.retry_errors:
+            compact_output(self.output_path)
+        self._report(final=True)
+
+    async def _process(self, loop, pool, client: AsyncQubridClient, out, index: int, path: str):
+        start = time.perf_counter()
+        record = {"index": index, "path": path}
+        try:
+            image_base64, encoding = await loop.run_in_executor(pool, _preprocess, path)
+            messages = [{"role": "user", "content": DETAILED_NUTRITION_PROMPT, "image": image_base64}]
+            response_text = await client.complete(messages)
+            data = parse_nutrition_data(response_text or "")
+            if "error" in data:
+                record.update(status="error", error=f"Parsing failed: {data['error']}")
+            else:
+                if Config.REFERENCE_ENABLED:
+                    check = get_food_reference().validate(data)
+                    if check is not None and check["flags"]:
+                        data["reference_check"] = check
+                record.update(status="ok", data=data, encoding=encoding)
+        except Exception as e:
+            record.update(status="error", error=str(e))
+        record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        # Single event-loop thread: writes never interleave
+        out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        out.flush()
+        self.stats[record["status"]] += 1
+        self.checkpoint.mark(index, path)
+
+        self._since_save += 1
+        if self._since_save >= 50:
+            self._since_save = 0
+            os.fsync(out.fileno())
+            self.checkpoint.save()
+        self._report()
+
+    def _report(self, final: bool = False):
+        now = time.perf_counter()
+        if not final and now - self._last_report < 5:
+            return
+        self._last_report = now
+        done = self.stats["ok"] + self.stats["error"]
+        elapsed = max(now - self._started, 1e-6)
+        error_rate = self.stats["error"] / done if done else 0.0
+        prefix = "Done" if final else "Progress"
+        print(
+            f"{prefix}: {done} processed ({self.stats['ok']} ok, {self.stats['error']} errors, "
+            f"{self.stats['skipped']} skipped) | {done / elapsed:.2f} images/s | "
+            f"error rate {error_rate:.1%} | {elapsed:.0f}s",
+            file=sys.stderr,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch nutrition analysis for image directories")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory of images (walked recursively)")
+    source.add_argument("--manifest", help="Text/JSONL file listing image paths")
+    parser.add_argument("--output", required=True, help="Append-only JSONL results file")
+    parser.add_argument("--concurrency", type=int, default=Config.ASYNC_MAX_CONCURRENCY,
+                        help="Concurrent API requests")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Image preprocessing processes (default: CPU count)")
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="Re-run images whose previous result was an error (rescans all results, "
+                             "then keeps only the latest record per image)")
+    args = parser.parse_args(argv)
+
+    Config.validate()
+
+    paths = iter_directory(args.input) if args.input else iter_manifest(args.manifest)
+    runner = BatchRunner(args.output, args.concurrency, args.workers, args.retry_errors)
+    try:
+        asyncio.run(runner.run(paths))
+    except CheckpointMismatch as e:
+        print(f"Cannot resume: {e}. Use a new --output file for the changed inputs.", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        runner.checkpoint.save()
+        print("Interrupted, progress saved. Re-run the same command to resume.", file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
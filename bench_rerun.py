@@ -0,0 +1,151 @@
+"""
+NutriVision AI - Rerun Cost Benchmark
+
+Streamlit re-executes app.py on every interaction. This measures the
+server-side work one rerun does on the results page, before and after
+memoization:
+
+    before  reopen the upload with Image.open, hand the full-size image to
+            st.image (re-encoded for the browser), rebuild the CSS string,
+            the macro/health HTML and the markdown report
+    after   hash the upload bytes, look up the cached thumbnail preview and
+            the fragments memoized per (analysis, theme)
+
+The st.* calls themselves are not executed; st.image's handling of a PIL
+image is approximated by downscaling to the maximum content width and
+re-encoding it, which is what the browser payload costs.
+
+Usage:
+    python bench_rerun.py
+    python bench_rerun.py --image photo.jpg --reruns 50
+"""
+import argparse
+import hashlib
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from config import Config
+from utils.image_processor import open_thumbnail, encode_preview
+from utils.parser import NUTRITION_ADAPTER
+from utils.styles import get_custom_css
+from utils.ui_components import (
+    content_key,
+    dish_title_html,
+    format_analysis_report,
+    health_bar_html,
+    macro_row_html,
+    _macro_row_html,
+)
+
+# Streamlit's maximum content width at 2x pixel density
+BROWSER_MAX_WIDTH = 1460
+
+SAMPLE_DATA = {
+    "dish_name": "Grilled Chicken Caesar Salad",
+    "calories": 470, "protein": 38, "carbs": 18, "fat": 27, "fiber": 4, "sugar": 3,
+    "health_score": 72,
+    "dietary": {"vegan": False, "vegetarian": False, "keto_friendly": True, "gluten_free": False,
+                "dairy_free": False, "high_protein": True},
+    "health_insights": ["High in protein", "Dressing adds most of the fat", "Add whole grains for fiber"],
+    "allergens": ["dairy", "gluten", "egg"],
+}
+
+
+def synthetic_photo(width: int = 4032, height: int = 3024) -> bytes:
+    """Phone-camera-sized JPEG with enough texture to compress like a real photo"""
+    channels = [Image.effect_noise((width // 4, height // 4), sigma).resize((width, height)) for sigma in (30, 45, 60)]
+    buffered = BytesIO()
+    Image.merge("RGB", channels).save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+def rerun_before(raw_bytes: bytes, data: dict, theme: str) -> int:
+    """Per-rerun work of the unmemoized app; returns the image bytes sent to the browser"""
+    image = Image.open(BytesIO(raw_bytes))
+    image.load()
+    if image.width > BROWSER_MAX_WIDTH:
+        image = image.resize((BROWSER_MAX_WIDTH, round(image.height * BROWSER_MAX_WIDTH / image.width)))
+    buffered = BytesIO()
+    image.convert("RGB").save(buffered, format="JPEG", quality=100)
+
+    get_custom_css.__wrapped__(theme)
+    dish_title_html(data.get("dish_name", "Unknown Dish"))
+    _macro_row_html.__wrapped__(*(str(data.get(k, 0)) for k in ("calories", "protein", "carbs", "fat")))
+    health_bar_html.__wrapped__(data.get("health_score", 0))
+    format_analysis_report(data)
+    return buffered.tell()
+
+def rerun_after(raw_bytes: bytes, data: dict, theme: str, state: dict) -> int:
+    """Per-rerun work of the memoized app (state plays the role of st.session_state)"""
+    digest = hashlib.sha1(raw_bytes).hexdigest()
+    if state.get("upload_digest") != digest:
+        state["preview_bytes"] = encode_preview(open_thumbnail(raw_bytes, Config.PREVIEW_MAX_EDGE))
+        state["upload_digest"] = digest
+        state["analysis_key"] = content_key(data)
+    # st.image(bytes) hashes the payload to register it with the media file manager
+    hashlib.md5(state["preview_bytes"]).digest()
+
+    get_custom_css(theme)
+    render_key = (state["analysis_key"], theme)
+    if state.get("render_key") != render_key:
+        state["rendered"] = {
+            "title": dish_title_html(data.get("dish_name", "Unknown Dish")),
+            "macros": macro_row_html(data),
+            "health": health_bar_html(data.get("health_score", 0)),
+            "report": format_analysis_report(data),
+        }
+        state["render_key"] = render_key
+    return len(state["preview_bytes"])
+
+
+def _time(fn, reruns: int):
+    samples = []
+    sent = 0
+    for _ in range(reruns):
+        start = time.perf_counter()
+        sent = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, sent
+
+def _summary(label: str, samples, sent: int) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"{label:<8} mean {statistics.mean(samples):8.2f} ms | p95 {p95:8.2f} ms | "
+            f"image payload {sent / 1024:8.1f} KB/rerun")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-rerun wall time before/after render memoization")
+    parser.add_argument("--image", help="Photo to use (default: synthetic 12MP JPEG)")
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--theme", choices=("Light", "Dark"), default="Light")
+    args = parser.parse_args(argv)
+    NUTRITION_ADAPTER.validate_python(SAMPLE_DATA)     # The benchmark renders what a real analysis would hold
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            raw_bytes = f.read()
+    else:
+        raw_bytes = synthetic_photo()
+    print(f"Upload: {len(raw_bytes) / 1024:.0f} KB, {args.reruns} reruns, theme {args.theme}")
+
+    before, before_sent = _time(lambda: rerun_before(raw_bytes, SAMPLE_DATA, args.theme), args.reruns)
+    state = {}
+    first_start = time.perf_counter()
+    rerun_after(raw_bytes, SAMPLE_DATA, args.theme, state)
+    first_ms = (time.perf_counter() - first_start) * 1000
+    after, after_sent = _time(lambda: rerun_after(raw_bytes, SAMPLE_DATA, args.theme, state), args.reruns)
+
+    print(_summary("before", before, before_sent))
+    print(_summary("after", after, after_sent))
+    print(f"after: first run (cache fill) {first_ms:.2f} ms | speedup "
+          f"{statistics.mean(before) / max(statistics.mean(after), 1e-9):.0f}x per rerun")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+NutriVision AI - Streaming Decoder Benchmark
+
+Measures client CPU time per 1,000 streamed tokens for:
+
+    legacy    requests' iter_lines splitting, then per line a UTF-8 decode,
+              a "data: " check and a full json.loads of the chunk
+    decoder   SSEDecoder on the raw reads plus event_delta, which slices the
+              delta text out of the common chunk shape without json.loads
+    coalesce  decoder output merged into chunks of at least --coalesce chars
+              (fewer, larger strings for the UI to handle)
+
+The body is a synthetic OpenAI-style stream shaped like the mock server's,
+cut into reads either one event at a time (chunked transfer, as received
+from a token-by-token server) or in fixed --read-size blocks.
+
+Usage:
+    python bench_sse.py
+    python bench_sse.py --tokens 20000 --read-size 1400 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Iterable, Iterator, List
+
+from utils.sse import SSEDecoder, SSE_DONE, event_delta, coalesce
+
+WORDS = ("protein", " carbs", " fat", " fiber", " per", " 100", "g", ",", " grilled", " chicken",
+         " salad", " café", " —", " about", " 470", " kcal", ".", "\n", " \"quoted\"", " the")
+
+
+def synthetic_stream(tokens: int) -> List[bytes]:
+    """One SSE event per token (as sent by the server), ending with [DONE]"""
+    events = []
+    for i in range(tokens):
+        chunk = {
+            "id": "chatcmpl-9f2c1e0b",
+            "object": "chat.completion.chunk",
+            "created": 1718000000,
+            "model": "Qwen/Qwen3-VL-30B-A3B-Instruct",
+            "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)]}, "finish_reason": None}],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+def reads(events: List[bytes], read_size: int) -> List[bytes]:
+    if read_size <= 0:
+        return events
+    body = b"".join(events)
+    return [body[i:i + read_size] for i in range(0, len(body), read_size)]
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """requests.Response.iter_lines for an already-received body"""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+def decode_legacy(chunks: List[bytes]) -> List[str]:
+    out = []
+    for line in _iter_lines(chunks):
+        if not line:
+            continue
+        decoded = line.decode("utf-8").rstrip("\r\n")
+        if not decoded.startswith("data: "):
+            continue
+        payload = decoded[6:]
+        if payload.strip() == "[DONE]":
+            break
+        try:
+            chunk = json.loads(payload)
+        except json.JSONDecodeError:
+            continue
+        if "choices" in chunk and len(chunk["choices"]) > 0:
+            content = chunk["choices"][0].get("delta", {}).get("content", "")
+            if content:
+                out.append(content)
+    return out
+
+def _deltas(chunks: List[bytes]) -> Iterator[str]:
+    decoder = SSEDecoder()
+    for raw in chunks:
+        for event in decoder.feed(raw):
+            content = event_delta(event)
+            if content is SSE_DONE:
+                return
+            if content:
+                yield content
+
+def decode_new(chunks: List[bytes]) -> List[str]:
+    return list(_deltas(chunks))
+
+def decode_coalesced(chunks: List[bytes], max_chars: int) -> List[str]:
+    return list(coalesce(_deltas(chunks), max_chars))
+
+
+def _cpu_ms_per_1k(fn, tokens: int, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        samples.append((time.process_time() - start) * 1000 / (tokens / 1000))
+    return statistics.median(samples), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CPU per 1k streamed tokens: legacy line parser vs SSEDecoder")
+    parser.add_argument("--tokens", type=int, default=10000)
+    parser.add_argument("--read-size", type=int, default=0, help="Bytes per read (0: one read per event)")
+    parser.add_argument("--coalesce", type=int, default=32, help="Chars per coalesced chunk")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    chunks = reads(synthetic_stream(args.tokens), args.read_size)
+    print(f"{args.tokens} tokens, {sum(map(len, chunks)) / 1024:.0f} KB in {len(chunks)} reads, "
+          f"median of {args.repeat} runs")
+
+    legacy_ms, legacy_out = _cpu_ms_per_1k(lambda: decode_legacy(chunks), args.tokens, args.repeat)
+    new_ms, new_out = _cpu_ms_per_1k(lambda: decode_new(chunks), args.tokens, args.repeat)
+    merged_ms, merged_out = _cpu_ms_per_1k(lambda: decode_coalesced(chunks, args.coalesce), args.tokens, args.repeat)
+
+    if "".join(new_out) != "".join(legacy_out) or "".join(merged_out) != "".join(legacy_out):
+        print("ERROR: decoders disagree on the streamed text")
+        return 1
+    for label, ms, out in (("legacy", legacy_ms, legacy_out), ("decoder", new_ms, new_out),
+                           ("coalesce", merged_ms, merged_out)):
+        print(f"{label:<9} {ms:7.3f} ms CPU / 1k tokens | {len(out):6d} chunks yielded")
+    print(f"decoder speedup {legacy_ms / max(new_ms, 1e-9):.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+NutriVision AI - Import-Time Budget Check
+
+Imports each core module in a fresh interpreter with `python -X importtime`
+and fails if the import takes longer than its budget, or if it drags in a
+module it must not depend on (Streamlit for the analysis core, python-dotenv
+for config, which now loads .env on first use).
+
+tests/test_import_time.py runs the same check under pytest; this script is
+the command-line entry point for checking single modules or a slow machine.
+
+Usage:
+    python check_import_time.py
+    python check_import_time.py --runs 5 --scale 2      # Slow CI machine
+    python check_import_time.py utils.parser utils.api_client
+"""
+import argparse
+import subprocess
+import sys
+from typing import List, Optional, Set, Tuple
+
+# Cumulative import time ceilings in milliseconds. Raise one deliberately
+# (in the same change) when a module gains a heavy dependency.
+BUDGETS_MS = {
+    "config": 5,
+    "prompts": 10,                 # hashlib, for the prompt version
+    "utils": 5,
+    "utils.stream_parser": 30,     # json, re and typing account for nearly all of it
+    "utils.metrics": 35,
+    "utils.schemas": 250,          # pydantic
+    "utils.parser": 300,
+    "utils.api_client": 250,       # requests
+    "utils.image_processor": 150,  # Pillow
+    "utils.analysis": 500,
+}
+
+# Third-party packages each module needs to import at all (the test skips a module without them)
+REQUIRES = {
+    "utils.schemas": ("pydantic",),
+    "utils.parser": ("pydantic",),
+    "utils.api_client": ("requests",),
+    "utils.image_processor": ("PIL",),
+    "utils.analysis": ("pydantic", "requests", "PIL"),
+}
+
+CORE_FORBIDDEN = ("streamlit",)
+FORBIDDEN = {name: CORE_FORBIDDEN for name in BUDGETS_MS}
+FORBIDDEN["config"] = CORE_FORBIDDEN + ("dotenv",)
+FORBIDDEN["utils"] = CORE_FORBIDDEN + ("requests", "pydantic", "PIL")
+
+
+def _importtime(code: str) -> List[Tuple[str, int, bool]]:
+    """Run code under -X importtime; returns (module, cumulative us, is top level) per import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else "unknown error")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level after the separator space
+        entries.append((name.strip(), int(cumulative_us), not name[1:].startswith(" ")))
+    return entries
+
+def measure(module: str, startup: Set[str]) -> Tuple[float, List[str]]:
+    """
+    Import a module once in a clean interpreter
+
+    Returns:
+        (milliseconds spent importing it, names of every module it imported)
+    """
+    entries = [entry for entry in _importtime(f"import {module}") if entry[0] not in startup]
+    total_us = sum(cumulative for _, cumulative, top_level in entries if top_level)
+    return total_us / 1000, [name for name, _, _ in entries]
+
+def check(modules: List[str], runs: int, scale: float) -> bool:
+    # Modules the interpreter imports before running any code are not charged
+    startup = {name for name, _, _ in _importtime("pass")}
+    ok = True
+    for module in modules:
+        budget = BUDGETS_MS[module] * scale
+        try:
+            samples = [measure(module, startup) for _ in range(runs)]
+        except RuntimeError as e:
+            print(f"ERROR {module}: import failed ({e})")
+            ok = False
+            continue
+
+        # Best of N: the minimum is the least noisy estimate of the true cost
+        best_ms = min(ms for ms, _ in samples)
+        imported = samples[0][1]
+        leaked = [name for name in FORBIDDEN.get(module, ()) if _imports(imported, name)]
+
+        status = "ok"
+        if best_ms > budget:
+            status = "SLOW"
+            ok = False
+        if leaked:
+            status = "LEAK"
+            ok = False
+        detail = f" imports {', '.join(leaked)}" if leaked else ""
+        print(f"{status:<5} {module:<24} {best_ms:7.1f} ms  (budget {budget:.0f} ms){detail}")
+    return ok
+
+def _imports(imported: List[str], name: str) -> bool:
+    return any(module == name or module.startswith(name + ".") for module in imported)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Enforce import-time budgets for the core modules")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all budgeted modules)")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per module; the fastest counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget (slow machines)")
+    args = parser.parse_args(argv)
+
+    unknown = [m for m in args.modules if m not in BUDGETS_MS]
+    if unknown:
+        parser.error(f"No budget for: {', '.join(unknown)}")
+    return 0 if check(args.modules or list(BUDGETS_MS), args.runs, args.scale) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,72 @@
 """Configuration management for NutriVision AI"""
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+_env_loaded = False
+
+def load_env():
+    """Load .env into the process environment (once, on first use of a setting)"""
+    global _env_loaded
+    if not _env_loaded:
+        _env_loaded = True
+        from dotenv import load_dotenv
+        load_dotenv()
+
+def _flag(value: str) -> bool:
+    return value.lower() == "true"
+
+class _Env:
+    """
+    Config attribute read from the environment the first time it is accessed.
+
+    Importing config therefore has no side effects; the resolved value
+    replaces the descriptor, so later reads are plain attribute lookups
+    and assignments (e.g. in scripts) still override it.
+    """
+
+    def __init__(self, name: str, default=None, cast=None):
+        self.name = name
+        self.default = default
+        self.cast = cast
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, obj, owner):
+        load_env()
+        value = os.getenv(self.name, self.default)
+        if value is not None and self.cast is not None:
+            value = self.cast(value)
+        setattr(owner, self.attr, value)
+        return value
 
 class Config:
     """Application configuration"""
     
     # API Configuration
-    API_KEY = os.getenv("QUBRID_API_KEY")
-    MODEL_NAME = os.getenv("QUBRID_MODEL")
-    API_ENDPOINT = os.getenv("QUBRID_API_ENDPOINT")
+    API_KEY = _Env("QUBRID_API_KEY")
+    MODEL_NAME = _Env("QUBRID_MODEL")
+    API_ENDPOINT = _Env("QUBRID_API_ENDPOINT")
     
     # App Configuration
     PAGE_TITLE = "NutriVision AI - Food Nutrition Analyzer"
     PAGE_ICON = "🍽️"
+    CHAT_REDRAW_HZ = _Env("NUTRIVISION_CHAT_REDRAW_HZ", "15", float)  # Max UI updates/sec while streaming (0: every chunk)
+    
+    # Chat Context Budget
+    CHAT_CONTEXT_TOKENS = _Env("NUTRIVISION_CHAT_CONTEXT_TOKENS", "3000", int)
+    CHAT_SUMMARY_TOKENS = _Env("NUTRIVISION_CHAT_SUMMARY_TOKENS", "400", int)
+    CHAT_MIN_RECENT_MESSAGES = 4   # Always sent verbatim
+    CHAT_LOCAL_ANSWERS = _Env("NUTRIVISION_CHAT_LOCAL_ANSWERS", "true", _flag)  # Answer factual follow-ups without the model
+    
+    # Chat Answer Cache (shared across sessions, matched by question similarity)
+    ANSWER_CACHE_ENABLED = _Env("NUTRIVISION_ANSWER_CACHE_ENABLED", "true", _flag)
+    ANSWER_CACHE_THRESHOLD = _Env("NUTRIVISION_ANSWER_CACHE_THRESHOLD", "0.8", float)   # TF-IDF cosine, 0-1
+    ANSWER_CACHE_ITEMS = _Env("NUTRIVISION_ANSWER_CACHE_ITEMS", "2048", int)
+    ANSWER_CACHE_TTL_SECONDS = _Env("NUTRIVISION_ANSWER_CACHE_TTL_SECONDS", str(24 * 3600), int)
+    ANSWER_REPLAY_CHUNKS = 4       # A cached answer is shown in this many pieces, without delay
+    
+    METRICS_PORT = _Env("NUTRIVISION_METRICS_PORT", "0", int)        # 0 disables the /metrics endpoint
+    METRICS_HOST = _Env("NUTRIVISION_METRICS_HOST", "127.0.0.1")     # 0.0.0.0 exposes it to the network
     
     # API Settings
     MAX_TOKENS = 4096
@@ -24,6 +75,97 @@ class Config:
     PRESENCE_PENALTY = 0
     TIMEOUT = 60
     
+    # Deadlines & Retries
+    CONNECT_TIMEOUT = _Env("QUBRID_CONNECT_TIMEOUT", "5", float)
+    READ_TIMEOUT = _Env("QUBRID_READ_TIMEOUT", str(TIMEOUT), float)
+    OVERALL_DEADLINE = _Env("QUBRID_OVERALL_DEADLINE", "90", float)     # Across all retries
+    STREAM_IDLE_TIMEOUT = _Env("QUBRID_STREAM_IDLE_TIMEOUT", "20", float)  # Max gap between chunks
+    MAX_RETRIES = _Env("QUBRID_MAX_RETRIES", "2", int)
+    RETRY_BACKOFF_BASE = 0.5
+    RETRY_BACKOFF_MAX = 8.0
+    RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+    
+    # Hedged Requests (non-streaming only)
+    HEDGE_ENABLED = _Env("QUBRID_HEDGE_ENABLED", "false", _flag)
+    HEDGE_QUANTILE = 0.95
+    HEDGE_WINDOW = 200          # Latency samples kept for the quantile
+    HEDGE_MIN_SAMPLES = 20      # Below this, HEDGE_DEFAULT_DELAY is used
+    HEDGE_DEFAULT_DELAY = 8.0
+    HEDGE_MIN_DELAY = 1.0
+    
+    # Connection Pool Settings
+    POOL_CONNECTIONS = _Env("QUBRID_POOL_CONNECTIONS", "4", int)   # Distinct hosts kept pooled
+    POOL_MAXSIZE = _Env("QUBRID_POOL_MAXSIZE", "16", int)          # Keep-alive sockets per host
+    POOL_BLOCK = _Env("QUBRID_POOL_BLOCK", "false", _flag)
+    POOL_WARMUP = _Env("QUBRID_POOL_WARMUP", "2", int)             # Connections opened at startup
+    ASYNC_MAX_CONCURRENCY = _Env("QUBRID_ASYNC_MAX_CONCURRENCY", "32", int)  # In-flight requests per event loop
+    
+    # Image Encoding Settings
+    IMAGE_ENCODE_MODE = _Env("NUTRIVISION_IMAGE_ENCODE_MODE", "adaptive")   # "adaptive" or "lossless"
+    IMAGE_MAX_EDGE = _Env("NUTRIVISION_IMAGE_MAX_EDGE", "1280", int)        # Beyond this the model downsamples anyway
+    IMAGE_TARGET_BYTES = _Env("NUTRIVISION_IMAGE_TARGET_BYTES", str(200 * 1024), int)
+    IMAGE_FORMAT = _Env("NUTRIVISION_IMAGE_FORMAT", "JPEG")                 # "JPEG" or "WEBP"
+    PREVIEW_MAX_EDGE = 480        # Sidebar preview / near-duplicate hashing thumbnail
+    IMAGE_MIN_QUALITY = 40
+    IMAGE_MAX_QUALITY = 90
+    
+    # Structured Output (opt-in): JSON Schema sent as response_format, deterministic sampling
+    STRUCTURED_OUTPUT = _Env("NUTRIVISION_STRUCTURED_OUTPUT", "false", _flag)
+    ANALYSIS_TEMPERATURE = 0.0
+    ANALYSIS_TOP_P = 1.0
+    
+    # Re-request only unparseable fields instead of re-running the whole analysis
+    PARSE_FOLLOWUP_ENABLED = _Env("NUTRIVISION_PARSE_FOLLOWUP", "true", _flag)
+    
+    # Nutrition Reference Table (local macro lookups and sanity checks)
+    REFERENCE_ENABLED = _Env("NUTRIVISION_REFERENCE_ENABLED", "true", _flag)
+    REFERENCE_PATH = _Env("NUTRIVISION_REFERENCE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "food_reference.csv"))
+    REFERENCE_MATCH_THRESHOLD = 0.7     # Trigram coverage of both names (the smaller one), 0-1
+    REFERENCE_TOLERANCE = 2.5           # Flag values more than this factor from the reference
+    
+    # Analysis Cache Settings
+    CACHE_ENABLED = _Env("NUTRIVISION_CACHE_ENABLED", "true", _flag)
+    CACHE_DIR = _Env("NUTRIVISION_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "nutrivision"))
+    CACHE_MEMORY_ITEMS = _Env("NUTRIVISION_CACHE_MEMORY_ITEMS", "256", int)
+    CACHE_DISK_MAX_BYTES = _Env("NUTRIVISION_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024), int)
+    CACHE_TTL_SECONDS = _Env("NUTRIVISION_CACHE_TTL_SECONDS", str(7 * 24 * 3600), int)
+    
+    # Session Payload Store (image blobs kept outside st.session_state)
+    SESSION_MEMORY_BYTES = _Env("NUTRIVISION_SESSION_MEMORY_BYTES", str(128 * 1024 * 1024), int)  # Resident cap, all sessions
+    SESSION_IDLE_SECONDS = _Env("NUTRIVISION_SESSION_IDLE_SECONDS", "1800", int)
+    SESSION_SPILL_MIN_BYTES = 16 * 1024     # Smaller blobs always stay in memory
+    
+    # Meal History (SQLite, survives resets and restarts)
+    HISTORY_ENABLED = _Env("NUTRIVISION_HISTORY_ENABLED", "true", _flag)
+    HISTORY_DB = _Env("NUTRIVISION_HISTORY_DB", os.path.join(os.path.expanduser("~"), ".local", "share", "nutrivision", "history.db"))
+    HISTORY_USER = _Env("NUTRIVISION_HISTORY_USER", "local")     # Owner of entries recorded by this app
+    HISTORY_PAGE_SIZE = 3       # Sidebar "Recent History" entries per page
+    HISTORY_BACK_PAGES = 20     # Newer-page cursors remembered while paging back through history
+    
+    # Streaming Decoder
+    STREAM_READ_BYTES = 512         # Read size for non-chunked SSE bodies
+    STREAM_COALESCE_CHARS = _Env("NUTRIVISION_STREAM_COALESCE_CHARS", "0", int)   # 0: yield every delta
+    STREAM_COALESCE_MS = _Env("NUTRIVISION_STREAM_COALESCE_MS", "0", float)
+    
+    # Client-Side Rate Limiting (0 = unlimited until the server advertises limits)
+    RATE_LIMIT_ENABLED = _Env("NUTRIVISION_RATE_LIMIT_ENABLED", "true", _flag)
+    RATE_LIMIT_RPS = _Env("NUTRIVISION_RATE_LIMIT_RPS", "0", float)
+    RATE_LIMIT_TPM = _Env("NUTRIVISION_RATE_LIMIT_TPM", "0", float)
+    RATE_LIMIT_MAX_WAIT = _Env("NUTRIVISION_RATE_LIMIT_MAX_WAIT", "120", float)   # Longer queues are refused
+    RATE_LIMIT_BURST_SECONDS = 2.0      # Request bucket capacity, in seconds of rate
+    RATE_LIMIT_IMAGE_TOKENS = 1000      # Estimated prompt tokens per image
+    RATE_LIMIT_OUTPUT_ESTIMATE = 800    # Estimated completion tokens, corrected from reported usage
+    
+    # Single-Flight (identical concurrent analyses share one API call)
+    SINGLE_FLIGHT_ENABLED = _Env("NUTRIVISION_SINGLE_FLIGHT_ENABLED", "true", _flag)
+    SINGLE_FLIGHT_CROSS_PROCESS = _Env("NUTRIVISION_SINGLE_FLIGHT_CROSS_PROCESS", "true", _flag)  # flock under CACHE_DIR
+    
+    # Near-Duplicate Lookup Settings
+    PHASH_ENABLED = _Env("NUTRIVISION_PHASH_ENABLED", "true", _flag)
+    PHASH_THRESHOLD = _Env("NUTRIVISION_PHASH_THRESHOLD", "6", int)   # Max differing bits of 64
+    PHASH_SEGMENTS = 4
+    PHASH_MAX_ENTRIES = _Env("NUTRIVISION_PHASH_MAX_ENTRIES", "100000", int)   # Oldest hashes are dropped beyond this
+    
     @staticmethod
     def validate():
         """Validate required configuration"""
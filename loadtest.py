@@ -0,0 +1,216 @@
+"""
+NutriVision AI - Load Generator
+
+Drives utils.api_client.QubridClient from N concurrent simulated users and
+reports throughput, error rate, p50/p95/p99 end-to-end latency and (for
+streaming runs) time-to-first-token. Point it at the local mock server, or
+at a staging endpoint via the usual QUBRID_* settings.
+
+Usage:
+    python loadtest.py --mock --users 32 --duration 30
+    python loadtest.py --mock --mock-args "--error-rate 0.05 --ttft exp:0.8" --stream
+    python loadtest.py --users 8 --requests 20 --mode chat     # Uses Config.API_ENDPOINT
+"""
+import argparse
+import json
+import random
+import shlex
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+from prompts import DETAILED_NUTRITION_PROMPT
+from utils.api_client import QubridClient
+from utils.metrics import StreamTimer
+
+CHAT_QUESTIONS = [
+    "Is this dish good for weight loss?",
+    "How much protein does it have compared to a chicken breast?",
+    "What could I swap to make it lower in carbs?",
+    "Is it safe for someone with a nut allergy?",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def synthetic_image(kilobytes: int) -> str:
+    """Base64 stand-in of roughly the size of an encoded upload (JPEG magic prefix)"""
+    return "/9j/" + "A" * max(kilobytes * 1024 * 4 // 3 - 4, 0)
+
+
+class LoadTest:
+    """Closed-loop load: each user thread sends its next request when the previous one finishes"""
+
+    def __init__(self, client: QubridClient, mode: str, stream: bool, image_base64: str,
+                 think_time: float = 0.0):
+        self.client = client
+        self.mode = mode
+        self.stream = stream
+        self.image_base64 = image_base64
+        self.think_time = think_time
+
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.completion_chars = 0
+        self._lock = threading.Lock()
+
+    def _messages(self, rng: random.Random) -> List[Dict]:
+        if self.mode == "analysis":
+            return [{"role": "user", "content": DETAILED_NUTRITION_PROMPT, "image": self.image_base64}]
+        return [
+            {"role": "system", "content": "You are a nutrition assistant."},
+            {"role": "user", "content": rng.choice(CHAT_QUESTIONS)},
+        ]
+
+    def _one_request(self, rng: random.Random):
+        messages = self._messages(rng)
+        start = time.perf_counter()
+        ttft = None
+        try:
+            if self.stream:
+                timer = StreamTimer()
+                chars = 0
+                for chunk in self.client.stream(messages):
+                    timer.tick()
+                    chars += len(chunk)
+                ttft = timer.ttft
+            else:
+                chars = len(self.client.complete(messages) or "")
+        except Exception as e:
+            key = str(getattr(e, "status_code", None) or type(e).__name__)
+            with self._lock:
+                self.errors[key] = self.errors.get(key, 0) + 1
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.completion_chars += chars
+            if ttft is not None:
+                self.ttfts.append(ttft)
+
+    def _user(self, user_id: int, stop_at: float, requests: Optional[int]):
+        rng = random.Random(user_id)
+        sent = 0
+        while time.perf_counter() < stop_at and (requests is None or sent < requests):
+            self._one_request(rng)
+            sent += 1
+            if self.think_time:
+                time.sleep(rng.expovariate(1 / self.think_time))
+
+    def run(self, users: int, duration: float, requests: Optional[int], ramp_up: float = 0.0) -> Dict:
+        """
+        Run the test and return the report
+
+        Args:
+            users: Concurrent simulated users
+            duration: Stop issuing new requests after this many seconds
+            requests: Optional per-user request cap (the run ends early when all users hit it)
+            ramp_up: Seconds over which user start times are spread
+        """
+        start = time.perf_counter()
+        stop_at = start + duration
+        threads = []
+        for user_id in range(users):
+            thread = threading.Thread(target=self._user, args=(user_id, stop_at, requests), daemon=True)
+            threads.append(thread)
+            thread.start()
+            if ramp_up and users > 1:
+                time.sleep(ramp_up / (users - 1))
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - start, users)
+
+    def report(self, elapsed: float, users: int) -> Dict:
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+        ok = len(latencies)
+        failed = sum(self.errors.values())
+        total = ok + failed
+        return {
+            "users": users,
+            "mode": self.mode,
+            "stream": self.stream,
+            "elapsed_s": elapsed,
+            "requests": total,
+            "ok": ok,
+            "errors": dict(self.errors),
+            "error_rate": failed / total if total else 0.0,
+            "throughput_rps": ok / elapsed if elapsed else 0.0,
+            "tokens_per_s": self.completion_chars / 4 / elapsed if elapsed else 0.0,
+            "latency_s": {f"p{int(q * 100)}": percentile(latencies, q) for q in (0.5, 0.95, 0.99)},
+            "ttft_s": {f"p{int(q * 100)}": percentile(ttfts, q) for q in (0.5, 0.95, 0.99)} if ttfts else None,
+            "hedges_sent": self.client.hedges_sent,
+            "hedges_won": self.client.hedges_won,
+        }
+
+
+def _format_quantiles(values: Optional[Dict]) -> str:
+    if not values:
+        return "n/a"
+    return "  ".join(f"{name} {value * 1000:.0f}ms" if value is not None else f"{name} n/a"
+                     for name, value in values.items())
+
+def print_report(report: Dict):
+    print(f"Users: {report['users']} | mode: {report['mode']}{' (stream)' if report['stream'] else ''} "
+          f"| {report['elapsed_s']:.1f}s")
+    print(f"Requests: {report['requests']} ({report['ok']} ok) | error rate {report['error_rate']:.1%} "
+          f"{report['errors'] or ''}")
+    print(f"Throughput: {report['throughput_rps']:.2f} req/s | ~{report['tokens_per_s']:.0f} tokens/s")
+    print(f"Latency: {_format_quantiles(report['latency_s'])}")
+    if report["stream"]:
+        print(f"TTFT:    {_format_quantiles(report['ttft_s'])}")
+    if report["hedges_sent"]:
+        print(f"Hedges: {report['hedges_sent']} sent, {report['hedges_won']} won")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Qubrid client")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to keep sending requests")
+    parser.add_argument("--requests", type=int, default=None, help="Per-user request cap")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds to spread user start times over")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--mode", choices=("analysis", "chat"), default="analysis")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming endpoint (reports TTFT)")
+    parser.add_argument("--image-kb", type=int, default=120, help="Size of the synthetic image payload")
+    parser.add_argument("--mock", action="store_true", help="Start a local mock server in-process")
+    parser.add_argument("--mock-args", default="", help='Options for the mock, e.g. "--error-rate 0.05"')
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.mock:
+        from mock_server import build_parser, settings_from_args, start_mock_server
+        mock_args = build_parser().parse_args(shlex.split(args.mock_args))
+        server, endpoint = start_mock_server(settings_from_args(mock_args), port=0)
+        client = QubridClient(api_key="mock", endpoint=endpoint, model=Config.MODEL_NAME or "mock",
+                              pool_maxsize=max(args.users, Config.POOL_MAXSIZE))
+    else:
+        Config.validate()
+        client = QubridClient(pool_maxsize=max(args.users, Config.POOL_MAXSIZE))
+
+    load_test = LoadTest(client, args.mode, args.stream, synthetic_image(args.image_kb), args.think_time)
+    try:
+        report = load_test.run(args.users, args.duration, args.requests, args.ramp_up)
+    finally:
+        client.close()
+        if server is not None:
+            server.shutdown()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+NutriVision AI - Local Mock Qubrid Server
+
+Stand-in for the Qubrid chat-completions endpoint, for load tests and for
+exercising retries, streaming and JSON repair without spending API credits.
+Serves both the blocking response shape (choices[0].message.content) and the
+SSE stream (data: {...} lines terminated by data: [DONE]).
+
+Requests carrying an image get a NutritionData JSON answer; text-only requests
+get a chat answer. Timing and failures are configurable:
+
+    --ttft          Delay before the first token (distribution spec, seconds)
+    --tps           Generation speed in tokens/second
+    --error-rate    Fraction of requests answered with an HTTP error
+    --malformed-rate  Fraction of analysis answers with broken JSON
+    --disconnect-rate Fraction of streams cut off mid-answer
+
+Distribution specs: "fixed:0.3", "uniform:0.2,1.5", "lognormal:0.6,0.5"
+(median, sigma) or "exp:0.5" (mean).
+
+Usage:
+    python mock_server.py --port 8089 --ttft lognormal:0.6,0.5 --tps 40 --error-rate 0.02
+    QUBRID_API_ENDPOINT=http://127.0.0.1:8089/v1/chat/completions streamlit run app.py
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+SAMPLE_DISHES = [
+    {
+        "dish_name": "Grilled Chicken Caesar Salad",
+        "calories": 470, "protein": 38, "carbs": 18, "fat": 27, "fiber": 4, "sugar": 3,
+        "health_score": 70,
+        "dietary": {"vegan": False, "vegetarian": False, "keto_friendly": True, "gluten_free": False,
+                    "dairy_free": False, "high_protein": True},
+        "health_insights": ["High in protein", "Dressing adds most of the fat"],
+        "allergens": ["dairy", "gluten", "egg"],
+    },
+    {
+        "dish_name": "Vegetable Biryani",
+        "calories": 620, "protein": 14, "carbs": 98, "fat": 19, "fiber": 8, "sugar": 7,
+        "health_score": 60,
+        "dietary": {"vegan": False, "vegetarian": True, "keto_friendly": False, "gluten_free": True,
+                    "dairy_free": False, "high_protein": False},
+        "health_insights": ["Good fiber from vegetables", "Large carbohydrate portion"],
+        "allergens": ["dairy", "nuts"],
+    },
+    {
+        "dish_name": "Avocado Toast with Poached Egg",
+        "calories": 390, "protein": 15, "carbs": 34, "fat": 22, "fiber": 9, "sugar": 3,
+        "health_score": 80,
+        "dietary": {"vegan": False, "vegetarian": True, "keto_friendly": False, "gluten_free": False,
+                    "dairy_free": True, "high_protein": False},
+        "health_insights": ["Healthy monounsaturated fats", "Balanced breakfast"],
+        "allergens": ["gluten", "egg"],
+    },
+]
+
+CHAT_WORDS = (
+    "this dish fits a balanced diet when eaten in moderate portions and paired with "
+    "vegetables protein keeps you full longer while the fat mostly comes from the "
+    "dressing so a lighter sauce would cut calories noticeably"
+).split()
+
+MALFORMED_KINDS = ("fence", "single_quotes", "trailing_comma", "truncate", "prose")
+
+ERROR_BODIES = {
+    400: "Bad request",
+    429: "Rate limit exceeded",
+    500: "Internal server error",
+    502: "Bad gateway",
+    503: "Service unavailable",
+    504: "Gateway timeout",
+}
+
+
+def parse_distribution(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    Turn a "kind:params" spec into a sampler of non-negative seconds
+
+    Args:
+        spec: fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exp:MEAN
+        rng: Random source shared by the server
+
+    Returns:
+        Zero-argument sampling function
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(",") if v]
+    except ValueError:
+        raise ValueError(f"Invalid distribution parameters: {spec}")
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(max(values[0], 1e-6))
+        return lambda: rng.lognormvariate(mu, values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown distribution spec: {spec}")
+
+
+@dataclass
+class MockSettings:
+    """Behaviour knobs of the mock server"""
+    ttft: str = "lognormal:0.5,0.4"
+    tps: float = 60.0
+    chat_tokens: int = 120
+    error_rate: float = 0.0
+    error_codes: str = "429,500,503"
+    retry_after: Optional[float] = 1.0
+    malformed_rate: float = 0.0
+    disconnect_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+class MockQubrid:
+    """Generates answers and decides, per request, which faults to inject"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.sample_ttft = parse_distribution(settings.ttft, self.rng)
+        self.error_codes = [int(code) for code in settings.error_codes.split(",") if code]
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "malformed": 0, "disconnects": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def roll(self, rate: float) -> bool:
+        return rate > 0 and self.rng.random() < rate
+
+    def pick_error(self) -> Optional[int]:
+        if self.error_codes and self.roll(self.settings.error_rate):
+            return self.rng.choice(self.error_codes)
+        return None
+
+    def answer(self, payload: Dict) -> str:
+        """Response text for a request: analysis JSON for images, prose otherwise"""
+        if not _has_image(payload.get("messages", [])):
+            words = [self.rng.choice(CHAT_WORDS) for _ in range(self.settings.chat_tokens)]
+            return " ".join(words).capitalize() + "."
+
+        text = json.dumps(self.rng.choice(SAMPLE_DISHES), indent=2)
+        if self.roll(self.settings.malformed_rate):
+            self.count("malformed")
+            text = _corrupt(text, self.rng.choice(MALFORMED_KINDS), self.rng)
+        return text
+
+    def tokens(self, text: str) -> List[str]:
+        # ~4 characters per token, the same heuristic the app uses
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def _has_image(messages: List[Dict]) -> bool:
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+def _corrupt(text: str, kind: str, rng: random.Random) -> str:
+    """Reproduce the JSON defects seen in real model output"""
+    if kind == "fence":
+        return f"Here is the analysis:\n```json\n{text}\n```"
+    if kind == "single_quotes":
+        return text.replace('"', "'").replace("true", "True").replace("false", "False")
+    if kind == "trailing_comma":
+        return text.replace("\n  ]", ",\n  ]").replace("\n}", ",\n}")
+    if kind == "truncate":
+        return text[:rng.randint(len(text) // 3, len(text) - 2)]
+    return f"Sure! {text}\nLet me know if you need anything else."
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # Keep-alive, like the real endpoint
+    mock: MockQubrid = None
+
+    def do_HEAD(self):
+        # Used by QubridClient.warm_up
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "Request body is not valid JSON"})
+            return
+
+        mock = self.mock
+        mock.count("requests")
+        ttft = mock.sample_ttft()
+
+        status = mock.pick_error()
+        if status is not None:
+            mock.count("errors")
+            time.sleep(min(ttft, 1.0))
+            headers = {}
+            if status in (429, 503) and mock.settings.retry_after is not None:
+                headers["Retry-After"] = str(mock.settings.retry_after)
+            self._send_json(status, {"error": ERROR_BODIES.get(status, "Injected error")}, headers)
+            return
+
+        text = mock.answer(payload)
+        tokens = mock.tokens(text)
+        usage = {
+            "prompt_tokens": length // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": length // 4 + len(tokens),
+        }
+        if payload.get("stream"):
+            mock.count("streamed")
+            self._stream(tokens, ttft)
+        else:
+            time.sleep(ttft + len(tokens) / mock.settings.tps)
+            self._send_json(200, {
+                "id": f"mock-{mock.stats['requests']}",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _stream(self, tokens: List[str], ttft: float):
+        mock = self.mock
+        cut_at = None
+        if mock.roll(mock.settings.disconnect_rate):
+            mock.count("disconnects")
+            cut_at = mock.rng.randint(0, max(len(tokens) - 1, 0))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(ttft)
+        interval = 1 / mock.settings.tps
+        try:
+            for i, token in enumerate(tokens):
+                if i == cut_at:
+                    self.close_connection = True
+                    return   # No terminating chunk: the client sees a broken stream
+                if i:
+                    time.sleep(interval)
+                event = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True   # Client gave up (timeout or cancelled hedge)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a load test's output
+
+
+def validate_sample_dishes():
+    """
+    Check the canned analyses against NutritionData, so a schema change breaks
+    the mock at startup instead of turning every load-test answer into a parse error
+
+    Raises:
+        pydantic.ValidationError: If a sample no longer matches the schema
+    """
+    from utils.parser import NUTRITION_ADAPTER
+    for dish in SAMPLE_DISHES:
+        NUTRITION_ADAPTER.validate_python(dish)
+
+
+def start_mock_server(settings: MockSettings, port: int = 0, host: str = "127.0.0.1"):
+    """
+    Run the mock server on a daemon thread
+
+    Args:
+        settings: Behaviour knobs
+        port: TCP port (0 picks a free one)
+        host: Interface to bind
+
+    Returns:
+        (server, endpoint URL)
+    """
+    validate_sample_dishes()
+    handler = type("MockHandler", (_MockHandler,), {"mock": MockQubrid(settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-qubrid", daemon=True)
+    thread.start()
+    endpoint = f"http://{host}:{server.server_address[1]}/v1/chat/completions"
+    return server, endpoint
+
+
+def build_parser() -> argparse.ArgumentParser:
+    defaults = MockSettings()
+    parser = argparse.ArgumentParser(description="Local mock of the Qubrid chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", default=defaults.ttft, help="Time-to-first-token distribution")
+    parser.add_argument("--tps", type=float, default=defaults.tps, help="Tokens per second")
+    parser.add_argument("--chat-tokens", type=int, default=defaults.chat_tokens,
+                        help="Length of chat answers")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-codes", default=defaults.error_codes,
+                        help="Comma-separated HTTP statuses to inject")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after,
+                        help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--malformed-rate", type=float, default=defaults.malformed_rate)
+    parser.add_argument("--disconnect-rate", type=float, default=defaults.disconnect_rate)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        ttft=args.ttft,
+        tps=args.tps,
+        chat_tokens=args.chat_tokens,
+        error_rate=args.error_rate,
+        error_codes=args.error_codes,
+        retry_after=args.retry_after,
+        malformed_rate=args.malformed_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = settings_from_args(args)
+    server, endpoint = start_mock_server(settings, args.port, args.host)
+    print(f"Mock Qubrid API listening on {endpoint}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served: {server.RequestHandlerClass.mock.stats}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
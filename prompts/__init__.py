@@ -1,3 +1,17 @@
-from .nutrition_prompt import DETAILED_NUTRITION_PROMPT, CHAT_SYSTEM_PROMPT
+from .nutrition_prompt import (
+    DETAILED_NUTRITION_PROMPT,
+    STRUCTURED_NUTRITION_PROMPT,
+    CHAT_SYSTEM_PROMPT,
+    MISSING_FIELDS_PROMPT,
+    ANALYSIS_PROMPT_VERSION,
+    STRUCTURED_PROMPT_VERSION,
+)
 
-__all__ = ['DETAILED_NUTRITION_PROMPT', 'CHAT_SYSTEM_PROMPT']
+__all__ = [
+    'DETAILED_NUTRITION_PROMPT',
+    'STRUCTURED_NUTRITION_PROMPT',
+    'CHAT_SYSTEM_PROMPT',
+    'MISSING_FIELDS_PROMPT',
+    'ANALYSIS_PROMPT_VERSION',
+    'STRUCTURED_PROMPT_VERSION',
+]
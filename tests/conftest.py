@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# Settings come from their defaults (plus the test's own environment), never a developer's .env
+config._env_loaded = True
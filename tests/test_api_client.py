@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from utils.api_client import build_payload
+from utils.chat_context import ChatContext
+
+
+def test_chat_payload_keeps_system_roles():
+    context = ChatContext({"dish_name": "Ramen", "calories": 436}, budget_tokens=10_000)
+    transcript = [
+        {"role": "user", "content": "Is it healthy?"},
+        {"role": "assistant", "content": "Moderately, the broth is salty."},
+        {"role": "user", "content": "How much protein?"},
+    ]
+    payload = build_payload(context.build_messages(transcript), stream=False)
+
+    roles = [m["role"] for m in payload["messages"]]
+    assert roles == ["system", "user", "assistant", "user"]
+    assert "Ramen" in payload["messages"][0]["content"][0]["text"]
+
+
+def test_image_goes_with_the_user_message():
+    payload = build_payload([{"role": "user", "content": "Analyze", "image": "iVBORw0KGgo"}], stream=True)
+    content = payload["messages"][0]["content"]
+    assert [part["type"] for part in content] == ["text", "image_url"]
+    assert content[1]["image_url"]["url"].startswith("data:image/png;base64,")
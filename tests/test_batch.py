@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("pydantic")
+
+from batch import Checkpoint, CheckpointMismatch, compact_output
+
+
+def _write(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _finished_run(tmp_path, paths):
+    output = tmp_path / "out.jsonl"
+    _write(output, [{"index": i, "path": p, "status": "ok"} for i, p in enumerate(paths)])
+    checkpoint = Checkpoint(str(tmp_path / "out.jsonl.ckpt"))
+    checkpoint.load(str(output), retry_errors=False)
+    checkpoint.save()
+    return output
+
+
+def test_resume_with_the_same_inputs_skips_them(tmp_path):
+    paths = ["a.jpg", "b.jpg", "c.jpg"]
+    output = _finished_run(tmp_path, paths)
+    checkpoint = Checkpoint(str(tmp_path / "out.jsonl.ckpt"))
+    checkpoint.load(str(output), retry_errors=False)
+    assert all(checkpoint.is_done(i, p) for i, p in enumerate(paths))
+    assert not checkpoint.is_done(3, "d.jpg")
+
+
+def test_inserted_input_stops_the_resume(tmp_path):
+    output = _finished_run(tmp_path, ["a.jpg", "c.jpg"])
+    checkpoint = Checkpoint(str(tmp_path / "out.jsonl.ckpt"))
+    checkpoint.load(str(output), retry_errors=False)
+    checkpoint.is_done(0, "a.jpg")
+    with pytest.raises(CheckpointMismatch):
+        checkpoint.is_done(1, "b.jpg")
+
+
+def test_out_of_order_result_is_checked_against_its_path(tmp_path):
+    output = tmp_path / "out.jsonl"
+    _write(output, [{"index": 2, "path": "c.jpg", "status": "ok"}])
+    checkpoint = Checkpoint(str(tmp_path / "out.jsonl.ckpt"))
+    checkpoint.load(str(output), retry_errors=False)
+    assert not checkpoint.is_done(0, "a.jpg")
+    with pytest.raises(CheckpointMismatch):
+        checkpoint.is_done(2, "b.jpg")
+
+
+def test_removed_inputs_are_detected(tmp_path):
+    output = _finished_run(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    checkpoint = Checkpoint(str(tmp_path / "out.jsonl.ckpt"))
+    checkpoint.load(str(output), retry_errors=False)
+    checkpoint.is_done(0, "a.jpg")
+    with pytest.raises(CheckpointMismatch):
+        checkpoint.check_count(1)
+
+
+def test_compact_output_keeps_the_latest_record_per_index(tmp_path):
+    output = tmp_path / "out.jsonl"
+    _write(output, [
+        {"index": 0, "path": "a.jpg", "status": "error"},
+        {"index": 1, "path": "b.jpg", "status": "ok"},
+        {"index": 0, "path": "a.jpg", "status": "ok"},
+    ])
+    compact_output(str(output))
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(r["index"], r["status"]) for r in records] == [(1, "ok"), (0, "ok")]
@@ -0,0 +1,35 @@
+import pytest
+
+from utils.food_reference import FoodReference
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return FoodReference()
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Pepperoni Pizza Slice", "pepperoni pizza"),
+    ("Pizza margherita", "margherita pizza"),
+    ("Caesar salad with chicken", "chicken caesar salad"),
+    ("Chocolate chip cookie", "chocolate chip cookies"),
+    ("Salmon, grilled", "grilled salmon"),
+])
+def test_matches_variants_of_a_reference_name(reference, name, expected):
+    assert reference.lookup(name)["name"] == expected
+
+
+@pytest.mark.parametrize("name", [
+    "Banana bread",
+    "Pineapple",
+    "Sweet potato fries",
+    "Steak and fries",
+    "Vegan pizza",
+    "Cauliflower pizza crust",
+])
+def test_short_reference_name_inside_a_different_dish_does_not_match(reference, name):
+    assert reference.lookup(name) is None
+
+
+def test_exact_name_scores_one(reference):
+    assert reference.match("French Fries")[1] == 1.0
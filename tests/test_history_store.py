@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+from utils.history_store import HistoryStore
+
+MEAL = {"dish_name": "Ramen", "calories": 436, "protein": 18, "carbs": 60, "fat": 14, "fiber": 3, "sugar": 4,
+        "health_score": 55}
+THREADS = 8
+MEALS_PER_THREAD = 5
+
+
+@pytest.mark.parametrize("path", [":memory:", "file"])
+def test_concurrent_writes_from_other_threads_are_all_visible(tmp_path, path):
+    store = HistoryStore(str(tmp_path / "history.db") if path == "file" else path)
+    start = threading.Barrier(THREADS)
+    errors = []
+
+    def add():
+        try:
+            start.wait()     # Every writer starts at once, so transactions overlap
+            for _ in range(MEALS_PER_THREAD):
+                store.add("alice", MEAL)
+        except Exception as e:     # Collected: an exception in a thread would not fail the test
+            errors.append(e)
+
+    threads = [threading.Thread(target=add) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    total = THREADS * MEALS_PER_THREAD
+    meals, _ = store.recent("alice", total + 1)
+    assert len(meals) == total
+    assert store.totals("alice")["day"]["meals"] == total
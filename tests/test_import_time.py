@@ -0,0 +1,18 @@
+import importlib.util
+import os
+
+import pytest
+
+from check_import_time import BUDGETS_MS, REQUIRES, check
+
+# Slow CI machines can widen every budget, e.g. NUTRIVISION_IMPORT_BUDGET_SCALE=2
+SCALE = float(os.getenv("NUTRIVISION_IMPORT_BUDGET_SCALE", "1"))
+
+
+@pytest.mark.parametrize("module", list(BUDGETS_MS))
+def test_import_stays_within_budget(module):
+    missing = [name for name in REQUIRES.get(module, ()) if importlib.util.find_spec(name) is None]
+    if missing:
+        pytest.skip(f"{module} needs {', '.join(missing)}")
+    # check() prints the measurement and returns False on a budget overrun or a forbidden import
+    assert check([module], runs=5, scale=SCALE)
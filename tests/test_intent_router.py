@@ -0,0 +1,51 @@
+import pytest
+
+from utils.intent_router import answer_locally, classify_intent
+
+DATA = {
+    "dish_name": "Margherita Pizza",
+    "calories": 266, "protein": 11, "carbs": 33, "fat": 10, "fiber": 2, "sugar": 3.6,
+    "health_score": 55,
+    "dietary": {"vegan": False, "vegetarian": True, "keto_friendly": False,
+                "gluten_free": False, "dairy_free": False, "high_protein": False},
+    "allergens": ["Wheat", "Dairy"],
+}
+
+
+def test_free_from_question_uses_the_flag():
+    assert answer_locally("is it gluten free?", DATA) == "No, it isn't gluten-free."
+
+
+def test_contains_question_uses_containment_wording():
+    assert answer_locally("does it contain gluten?", DATA).startswith("Yes, it likely contains **gluten**")
+    assert answer_locally("does it have dairy?", DATA).startswith("Yes, it likely contains **dairy**")
+
+
+def test_contains_question_on_free_dish():
+    data = dict(DATA, dietary=dict(DATA["dietary"], gluten_free=True))
+    assert answer_locally("does it contain gluten?", data).startswith("No, it's marked gluten-free.")
+
+
+def test_quantities_go_to_the_model():
+    assert classify_intent("how many calories in 300g?") is None
+    assert classify_intent("how much protein for 250 grams?") is None
+    assert classify_intent("calories in two servings") is None
+
+
+def test_plain_macro_question_is_local():
+    assert answer_locally("how much protein?", DATA) == "Per 100g it has **11 g** protein."
+
+
+@pytest.mark.parametrize("allergens, question, present", [
+    (["Shellfish"], "is there fish?", False),
+    (["Shellfish"], "any shellfish?", True),
+    (["Eggplant"], "does it contain egg?", False),
+    (["Anchovies"], "is there fish?", True),
+    (["Molluscs"], "any shellfish?", True),
+    (["Tree nuts"], "does it have nuts?", True),
+    (["Coconut", "Nutmeg"], "does it have nuts?", False),
+])
+def test_allergens_match_whole_words_and_synonyms(allergens, question, present):
+    answer = answer_locally(question, dict(DATA, allergens=allergens))
+    assert answer.startswith("Yes, it may contain") is present
+    assert ("isn't among its detected allergens" in answer) is not present
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+from utils.phash import HashIndex
+
+SCOPE = "v1:model"
+
+
+def test_candidates_rank_by_distance_and_skip_discarded_keys():
+    index = HashIndex(segments=4)
+    index.add(0b0000, "exact", SCOPE)
+    index.add(0b0011, "two-bits", SCOPE)
+    index.add(0b0001, "one-bit", SCOPE)
+    index.add(0b0001, "other-scope", "v2:model")
+
+    assert index.candidates(0b0000, 6, SCOPE) == [("exact", 0), ("one-bit", 1), ("two-bits", 2)]
+    index.discard("exact")
+    index.discard("one-bit")
+    assert index.search(0b0000, 6, SCOPE) == ("two-bits", 2)
+    assert index.search(0b0000, 6, "v2:model") == ("other-scope", 1)
+    assert len(index) == 2
+
+
+def test_index_is_capped_and_its_file_compacted(tmp_path):
+    path = tmp_path / "phash.idx"
+    index = HashIndex(segments=4, path=str(path), max_entries=10)
+    for i in range(1500):
+        index.add(i << 8, f"key{i}", SCOPE)
+
+    assert len(index) == 10
+    assert index.search(1499 << 8, 0, SCOPE) == ("key1499", 0)
+    assert index.search(0, 0, SCOPE) is None
+    assert len(path.read_text().splitlines()) < 1500
+
+    reloaded = HashIndex(segments=4, path=str(path), max_entries=10)
+    assert [key for key, _ in reloaded.candidates(1499 << 8, 0, SCOPE)] == ["key1499"]
+    assert len(reloaded) == 10
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+from utils.session_store import SessionStore
+
+TRANSCRIPT = [{"role": "user", "content": "Is it vegan?"}, {"role": "assistant", "content": "No, it has egg."}]
+
+
+def test_json_values_survive_a_spill_to_disk(tmp_path):
+    store = SessionStore(str(tmp_path), memory_bytes=0, spill_min_bytes=0)
+    store.put_json("s1", "messages", TRANSCRIPT)
+    store.put_json("s1", "nutrition", {"dish_name": "Ramen", "calories": 436})
+
+    assert store.get_stats()["memory_bytes"] == 0     # Both went to disk
+    assert store.get_json("s1", "messages") == TRANSCRIPT
+    assert store.get_json("s1", "missing", []) == []
+    store.drop("s1")
+    assert store.get_json("s1", "nutrition") is None
+
+
+def test_spill_dirs_of_dead_processes_are_removed_at_startup(tmp_path):
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                              capture_output=True, text=True, check=True)
+    dead = tmp_path / "sessions" / finished.stdout.strip()
+    live = tmp_path / "sessions" / str(os.getppid())
+    for directory in (dead, live):
+        directory.mkdir(parents=True)
+        (directory / "blob.bin").write_bytes(b"x")
+
+    SessionStore(str(tmp_path))
+
+    assert not dead.exists()
+    assert live.exists()
@@ -1,23 +1,87 @@
-"""Utils package initialization"""
-from .api_client import call_qubrid_api, call_qubrid_api_stream
-from .image_processor import encode_image_to_base64
-from .parser import parse_nutrition_data
-from .ui_components import (
-    display_macro_row, 
-    display_health_bar, 
-    display_metrics_footer, 
-    format_analysis_report
-)
-from .styles import get_custom_css
+"""
+Utils package initialization
 
-__all__ = [
-    'call_qubrid_api',
-    'call_qubrid_api_stream',
-    'encode_image_to_base64',
-    'parse_nutrition_data',
-    'display_macro_row',
-    'display_health_bar',
-    'display_metrics_footer',
-    'format_analysis_report',
-    'get_custom_css'
-]
+Exports are resolved lazily (PEP 562): importing utils, or a core module such
+as utils.api_client or utils.parser, never pulls in Streamlit. The UI helpers
+import it only when one of them is first accessed.
+"""
+from importlib import import_module
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'call_qubrid_api': 'api_client',
+    'call_qubrid_api_stream': 'api_client',
+    'QubridClient': 'api_client',
+    'QubridAPIError': 'retry',
+    'get_client': 'api_client',
+    'AsyncQubridClient': 'async_client',
+    'call_qubrid_api_async': 'async_client',
+    'call_qubrid_api_stream_async': 'async_client',
+    'encode_image_to_base64': 'image_processor',
+    'encode_image': 'image_processor',
+    'encode_upload': 'image_processor',
+    'open_thumbnail': 'image_processor',
+    'encode_preview': 'image_processor',
+    'parse_nutrition_data': 'parser',
+    'repair_json': 'parser',
+    'get_parse_stats': 'parser',
+    'NutritionData': 'schemas',
+    'DietaryCheck': 'schemas',
+    'nutrition_json_schema': 'schemas',
+    'FoodReference': 'food_reference',
+    'get_food_reference': 'food_reference',
+    'lookup_macros': 'food_reference',
+    'AnalysisCache': 'cache',
+    'get_analysis_cache': 'cache',
+    'dhash': 'phash',
+    'HashIndex': 'phash',
+    'get_hash_index': 'phash',
+    'IncrementalJSONParser': 'stream_parser',
+    'analyze_image': 'analysis',
+    'ChatContext': 'chat_context',
+    'answer_locally': 'intent_router',
+    'classify_intent': 'intent_router',
+    'get_routing_stats': 'intent_router',
+    'AnswerCache': 'answer_cache',
+    'get_answer_cache': 'answer_cache',
+    'replay_stream': 'answer_cache',
+    'HistoryStore': 'history_store',
+    'get_history_store': 'history_store',
+    'SessionStore': 'session_store',
+    'get_session_store': 'session_store',
+    'SingleFlight': 'single_flight',
+    'get_single_flight': 'single_flight',
+    'RateLimiter': 'rate_limiter',
+    'get_rate_limiter': 'rate_limiter',
+    'request_context': 'rate_limiter',
+    'SSEDecoder': 'sse',
+    'event_delta': 'sse',
+    'StreamTimer': 'metrics',
+    'MetricsRegistry': 'metrics',
+    'get_metrics': 'metrics',
+    'start_metrics_server': 'metrics',
+    'display_macro_row': 'ui_components',
+    'display_health_bar': 'ui_components',
+    'display_metrics_footer': 'ui_components',
+    'format_analysis_report': 'ui_components',
+    'content_key': 'ui_components',
+    'dish_title_html': 'ui_components',
+    'macro_row_html': 'ui_components',
+    'health_bar_html': 'ui_components',
+    'get_custom_css': 'styles',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module_name}", __name__), name)
+    globals()[name] = value     # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
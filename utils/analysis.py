@@ -0,0 +1,203 @@
+"""Food image analysis pipeline: cache lookup, API call, parsing"""
+from typing import Any, Callable, Dict, Optional, Tuple
+from PIL import Image
+from config import Config
+from prompts import (
+    DETAILED_NUTRITION_PROMPT,
+    STRUCTURED_NUTRITION_PROMPT,
+    MISSING_FIELDS_PROMPT,
+    ANALYSIS_PROMPT_VERSION,
+    STRUCTURED_PROMPT_VERSION,
+)
+from .api_client import call_qubrid_api, call_qubrid_api_stream, QubridAPIError
+from .parser import parse_nutrition_data, merge_missing_fields, fill_missing_fields
+from .schemas import NutritionData, nutrition_json_schema
+from .cache import get_analysis_cache, make_cache_key, make_cache_scope
+from .phash import dhash, get_hash_index
+from .stream_parser import IncrementalJSONParser
+from .metrics import get_metrics
+from .food_reference import get_food_reference
+from .single_flight import get_single_flight
+
+
+def analyze_image(
+    image_base64: str,
+    image: Optional[Image.Image] = None,
+    use_cache: Optional[bool] = None,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[Dict, Optional[str]]:
+    """
+    Analyze a food image, reusing a previous analysis of identical or near-identical content
+
+    Args:
+        image_base64: Normalized image as produced by encode_image_to_base64
+        image: Decoded PIL image, enables the perceptual near-duplicate lookup
+        use_cache: Override Config.CACHE_ENABLED
+        on_field: If given, the response is streamed and on_field(key, value) is
+                  called as each top-level field completes (cache hits skip it)
+
+    Returns:
+        (nutrition data dict, raw model response text, or None on a cache hit
+        or when an identical in-flight analysis was joined)
+    """
+    if use_cache is None:
+        use_cache = Config.CACHE_ENABLED
+
+    prompt_version = STRUCTURED_PROMPT_VERSION if _use_structured() else ANALYSIS_PROMPT_VERSION
+    flight_key = make_cache_key(image_base64, prompt_version, Config.MODEL_NAME)
+    scope = make_cache_scope(prompt_version, Config.MODEL_NAME)
+    key = None
+    image_hash = None
+    if use_cache:
+        cache = get_analysis_cache()
+        key = flight_key
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, None
+
+        # Re-shot or re-compressed photo of a meal we already analyzed with this prompt and model
+        if image is not None and Config.PHASH_ENABLED:
+            image_hash = dhash(image)
+            index = get_hash_index()
+            for match_key, _ in index.candidates(image_hash, Config.PHASH_THRESHOLD, scope):
+                cached = cache.get(match_key)
+                if cached is not None:
+                    return cached, None
+                index.discard(match_key)     # Evicted or expired from the cache: try the next closest
+
+    if not Config.SINGLE_FLIGHT_ENABLED:
+        return _analyze_uncached(image_base64, on_field, use_cache, image_hash)
+
+    # Identical analyses already in flight (other sessions, tabs or workers) are joined, not repeated.
+    # Joiners get the leader's result at once; only the leader's on_field sees the stream.
+    def recheck():
+        cached = cache.get(key) if key is not None else None
+        return (cached, None) if cached is not None else None
+
+    (data, response_text), shared = get_single_flight().do(
+        flight_key,
+        lambda: _analyze_uncached(image_base64, on_field, use_cache, image_hash),
+        recheck=recheck,
+    )
+    # A joined analysis cost this caller nothing, like a cache hit
+    return data, None if shared else response_text
+
+
+def _analyze_uncached(
+    image_base64: str,
+    on_field: Optional[Callable[[str, Any], None]],
+    use_cache: bool,
+    image_hash: Optional[int],
+) -> Tuple[Dict, str]:
+    """Model call, parsing, repair and validation; caches the result if use_cache is set"""
+    response_text, prompt_version = _run_analysis(image_base64, on_field)
+
+    # Full Pydantic validation always runs on the complete text
+    with get_metrics().span("parse"):
+        data = parse_nutrition_data(response_text)
+
+    # Partially recovered: macros of a known dish come from the reference table,
+    # the API is asked only for whatever is still missing
+    missing = data.get("missing_fields")
+    if missing and "dish_name" not in missing and Config.REFERENCE_ENABLED:
+        data = _fill_from_reference(data)
+    missing = data.get("missing_fields")
+    if missing and len(missing) < len(NutritionData.model_fields) and Config.PARSE_FOLLOWUP_ENABLED:
+        data = _request_missing_fields(image_base64, data)
+
+    # Sanity check against typical values for the same dish
+    if "error" not in data and Config.REFERENCE_ENABLED:
+        check = get_food_reference().validate(data)
+        if check is not None and check["flags"]:
+            data["reference_check"] = check
+
+    # Never cache the parse-failure fallback, the next attempt may succeed. The key names the
+    # prompt actually used: an analysis that fell back from structured output is not a structured one
+    if use_cache and "error" not in data:
+        key = make_cache_key(image_base64, prompt_version, Config.MODEL_NAME)
+        get_analysis_cache().put(key, data)
+        if image_hash is not None:
+            get_hash_index().add(image_hash, key, make_cache_scope(prompt_version, Config.MODEL_NAME))
+
+    return data, response_text
+
+
+# Flipped off the first time the endpoint rejects a response_format constraint
+_structured_supported = True
+
+# An error body naming one of these is a rejected constraint, not a bad request in general
+_SCHEMA_ERROR_HINTS = ("response_format", "json_schema")
+
+def _use_structured() -> bool:
+    return Config.STRUCTURED_OUTPUT and _structured_supported
+
+def _structured_options(with_schema: bool) -> Dict:
+    options = {"temperature": Config.ANALYSIS_TEMPERATURE, "top_p": Config.ANALYSIS_TOP_P}
+    if with_schema:
+        options["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "nutrition_data", "strict": True, "schema": nutrition_json_schema()},
+        }
+    return options
+
+def _run_analysis(image_base64: str, on_field: Optional[Callable[[str, Any], None]]) -> Tuple[str, str]:
+    """
+    Call the model for an analysis, schema-constrained when Config.STRUCTURED_OUTPUT is on
+
+    Endpoints that reject response_format get the hand-written-schema prompt
+    instead (still with deterministic sampling), and are not asked again.
+    Other client errors are raised as they are.
+
+    Returns:
+        (response text, version of the prompt that produced it)
+    """
+    global _structured_supported
+
+    if _use_structured():
+        try:
+            text = _call_model(STRUCTURED_NUTRITION_PROMPT, image_base64, on_field, _structured_options(True))
+            return text, STRUCTURED_PROMPT_VERSION
+        except QubridAPIError as e:
+            message = str(e).lower()
+            if e.status_code not in (400, 404, 415, 422) or not any(h in message for h in _SCHEMA_ERROR_HINTS):
+                raise
+            _structured_supported = False
+            print(f"Structured output rejected, falling back to prompt schema: {e}")
+
+    options = _structured_options(False) if Config.STRUCTURED_OUTPUT else None
+    return _call_model(DETAILED_NUTRITION_PROMPT, image_base64, on_field, options), ANALYSIS_PROMPT_VERSION
+
+def _call_model(prompt: str, image_base64: str, on_field, options: Optional[Dict]) -> str:
+    messages = [{"role": "user", "content": prompt, "image": image_base64}]
+    if on_field is None:
+        return call_qubrid_api(messages, options=options)
+
+    parser = IncrementalJSONParser()
+    for chunk in call_qubrid_api_stream(messages, options=options):
+        for field, value in parser.feed(chunk):
+            on_field(field, value)
+    return parser.text
+
+def _fill_from_reference(data: Dict) -> Dict:
+    """Take missing macro fields from the reference table instead of the API"""
+    values = get_food_reference().fill(data, data["missing_fields"])
+    if not values:
+        return data
+    get_metrics().increment("reference_fills")
+    filled = fill_missing_fields(data, values)
+    filled["reference_filled"] = sorted(values)
+    return filled
+
+def _request_missing_fields(image_base64: str, data: Dict) -> Dict:
+    """One small follow-up call for the fields a repaired parse could not recover"""
+    fields = "\n".join(
+        f"- {name}: {NutritionData.model_fields[name].description}" for name in data["missing_fields"]
+    )
+    prompt = MISSING_FIELDS_PROMPT.format(dish_name=data.get("dish_name", "unknown"), fields=fields)
+    try:
+        response_text = call_qubrid_api([{"role": "user", "content": prompt, "image": image_base64}])
+    except Exception as e:
+        print(f"Missing-field follow-up failed: {e}")
+        return data
+    with get_metrics().span("parse"):
+        return merge_missing_fields(data, response_text or "")
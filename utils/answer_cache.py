@@ -0,0 +1,252 @@
+"""Cross-session semantic cache for chat answers"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generator, List, Optional
+from config import Config
+from .metrics import get_metrics
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "it", "its", "this", "that", "be", "are", "was", "do", "does", "did",
+    "i", "me", "my", "you", "your", "we", "to", "of", "in", "on", "for", "with", "and", "or",
+    "can", "could", "would", "will", "should", "please", "tell", "dish", "food", "meal", "so",
+}
+_WORD = re.compile(r"[a-z0-9]+")
+_SPACE = re.compile(r"\s")
+
+# Stemmed words that flip a question's meaning while leaving it lexically close:
+# "good for weight loss" and "good for weight gain" must never share an answer
+_CONTRASTS = [
+    {"los", "gain"},
+    {"good", "bad"},
+    {"high", "low"},
+    {"more", "les"},
+    {"befor", "after"},
+    {"increas", "reduc", "decreas"},
+    {"healthy", "unhealthy"},
+]
+_NEGATIONS = {"not", "no", "never", "without", "t"}
+
+
+def normalize_question(text: str) -> List[str]:
+    """Lowercase content words with a crude suffix stem ("losing weight" -> ["los", "weight"])"""
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        for suffix in ("ing", "ed", "es", "s", "e"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.append(word)
+    return words
+
+def contradicts(a: List[str], b: List[str]) -> bool:
+    """True if two normalized questions differ in a contrast word or in negation"""
+    set_a, set_b = set(a), set(b)
+    if bool(set_a & _NEGATIONS) != bool(set_b & _NEGATIONS):
+        return True
+    for group in _CONTRASTS:
+        in_a, in_b = set_a & group, set_b & group
+        if in_a and in_b and in_a != in_b:
+            return True
+    return False
+
+def question_features(words: List[str]) -> Dict[str, int]:
+    """Bag of words, adjacent word pairs and in-word character trigrams"""
+    features: Dict[str, int] = {}
+    for word in words:
+        features[word] = features.get(word, 0) + 1
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            gram = "~" + padded[i:i + 3]
+            features[gram] = features.get(gram, 0) + 1
+    for first, second in zip(words, words[1:]):
+        pair = f"{first}_{second}"
+        features[pair] = features.get(pair, 0) + 1
+    return features
+
+
+class AnswerCache:
+    """
+    Shares model answers between sessions asking about the same dish.
+
+    Entries are scoped by a hash of the nutrition payload plus the earlier
+    turns of the conversation, so an answer is only reused in an identical
+    context. Within a scope, the latest question is matched by TF-IDF cosine
+    similarity over words, word pairs and character trigrams; document
+    frequencies are kept across all cached questions. Candidates that differ
+    in negation or a contrast word (loss/gain, good/bad) are never reused.
+    Eviction is LRU by entry count plus a TTL.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ):
+        self.max_items = max_items or Config.ANSWER_CACHE_ITEMS
+        self.ttl_seconds = ttl_seconds or Config.ANSWER_CACHE_TTL_SECONDS
+        self.threshold = Config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._scopes: Dict[str, List[int]] = {}
+        self._doc_freq: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+    # ---- keys ----
+
+    @staticmethod
+    def scope_key(nutrition_data: Dict, messages: List[Dict]) -> str:
+        """Hash of the dish payload and every turn before the latest question"""
+        history = [(m["role"], " ".join(normalize_question(m["content"]))) for m in messages[:-1]]
+        payload = json.dumps([nutrition_data, history], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # ---- public API ----
+
+    def lookup(self, nutrition_data: Dict, messages: List[Dict]) -> Optional[str]:
+        """
+        Args:
+            nutrition_data: Data of the dish the chat is about
+            messages: Transcript whose last message is the user's question
+
+        Returns:
+            A cached answer to an equivalent question, or None
+        """
+        scope = self.scope_key(nutrition_data, messages)
+        words = normalize_question(messages[-1]["content"])
+        query = question_features(words)
+        now = time.time()
+
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._scopes.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                if contradicts(words, entry["words"]):
+                    continue
+                score = self._cosine(query, entry["features"])
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.metrics.increment("answer_cache_misses")
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            entry["hits"] += 1
+            self.metrics.increment("answer_cache_hits")
+            return entry["answer"]
+
+    def store(self, nutrition_data: Dict, messages: List[Dict], answer: str):
+        """Cache the model's answer to the last question of the transcript"""
+        if not answer or not answer.strip():
+            return
+        scope = self.scope_key(nutrition_data, messages)
+        words = normalize_question(messages[-1]["content"])
+        features = question_features(words)
+        if not features:
+            return
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "words": words,
+                "features": features,
+                "answer": answer,
+                "created": time.time(),
+                "hits": 0,
+            }
+            self._scopes.setdefault(scope, []).append(entry_id)
+            for feature in features:
+                self._doc_freq[feature] = self._doc_freq.get(feature, 0) + 1
+            while len(self._entries) > self.max_items:
+                self._remove(next(iter(self._entries)))
+
+    def get_stats(self) -> Dict:
+        counters = self.metrics.to_json()["counters"]
+        hits = counters.get("answer_cache_hits", 0)
+        misses = counters.get("answer_cache_misses", 0)
+        with self._lock:
+            entries = len(self._entries)
+            scopes = len(self._scopes)
+        return {
+            "entries": entries,
+            "scopes": scopes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    # ---- internals (called with the lock held) ----
+
+    def _idf(self, feature: str) -> float:
+        total = len(self._entries)
+        return math.log((total + 1) / (self._doc_freq.get(feature, 0) + 1)) + 1
+
+    def _cosine(self, a: Dict[str, int], b: Dict[str, int]) -> float:
+        weights_a = {f: count * self._idf(f) for f, count in a.items()}
+        weights_b = {f: count * self._idf(f) for f, count in b.items()}
+        dot = sum(weight * weights_b[f] for f, weight in weights_a.items() if f in weights_b)
+        norm = math.sqrt(sum(w * w for w in weights_a.values())) * math.sqrt(sum(w * w for w in weights_b.values()))
+        return dot / norm if norm else 0.0
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._scopes[entry["scope"]]
+        scope_ids.remove(entry_id)
+        if not scope_ids:
+            del self._scopes[entry["scope"]]
+        for feature in entry["features"]:
+            count = self._doc_freq[feature] - 1
+            if count:
+                self._doc_freq[feature] = count
+            else:
+                del self._doc_freq[feature]
+
+
+def replay_stream(text: str, chunks: Optional[int] = None) -> Generator[str, None, None]:
+    """
+    Yield a cached answer at once, in a few large pieces, like call_qubrid_api_stream
+
+    Args:
+        text: Complete answer
+        chunks: Number of pieces, split at word boundaries (defaults to Config.ANSWER_REPLAY_CHUNKS)
+    """
+    chunks = max(1, Config.ANSWER_REPLAY_CHUNKS if chunks is None else chunks)
+    size = -(-len(text) // chunks)
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            # Extend to the end of the word, so no piece starts mid-word
+            space = _SPACE.search(text, end)
+            end = space.start() if space else len(text)
+        yield text[start:end]
+        start = end
+
+
+_default_answer_cache: Optional[AnswerCache] = None
+_default_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Return the process-wide answer cache (shared by every Streamlit session)"""
+    global _default_answer_cache
+    if _default_answer_cache is None:
+        with _default_answer_cache_lock:
+            if _default_answer_cache is None:
+                _default_answer_cache = AnswerCache()
+    return _default_answer_cache
@@ -1,129 +1,518 @@
 """API client for Qubrid Vision Model with streaming support"""
 import requests
+import io
 import json
-from typing import List, Dict, Generator
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import List, Dict, Generator, Optional, Tuple
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from config import Config
+from .metrics import get_metrics
+from .rate_limiter import get_rate_limiter, estimate_tokens, estimate_stream_usage, current_context, notify_admitted
+from .retry import QubridAPIError, backoff_delay, is_retryable, wrap_error
+from .sse import SSEDecoder, SSE_DONE, event_delta, coalesce
 
-def call_qubrid_api(messages: List[Dict], stream: bool = False) -> str:
+
+class QubridClient:
+    """
+    Long-lived Qubrid client owning a pooled keep-alive HTTP session.
+
+    A single instance is meant to be shared by every Streamlit script thread:
+    the underlying urllib3 pool is thread-safe, and the session itself is only
+    created (and mutated) under a lock.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        model: Optional[str] = None,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        pool_block: Optional[bool] = None,
+    ):
+        self.api_key = api_key or Config.API_KEY
+        self.endpoint = endpoint or Config.API_ENDPOINT
+        self.model = model or Config.MODEL_NAME
+        self.pool_connections = pool_connections or Config.POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or Config.POOL_MAXSIZE
+        self.pool_block = Config.POOL_BLOCK if pool_block is None else pool_block
+
+        self._session: Optional[requests.Session] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # Recent successful latencies drive the hedging delay
+        self._latencies = deque(maxlen=Config.HEDGE_WINDOW)
+        self._latency_lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+        self.metrics = get_metrics()
+        self._local = threading.local()
+
+    @property
+    def last_usage(self) -> Optional[Dict]:
+        """Token usage reported for the calling thread's last non-streaming request"""
+        return getattr(self._local, "last_usage", None)
+
+    @property
+    def session(self) -> requests.Session:
+        """Lazily build the pooled session (headers are prepared only once)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        })
+        return session
+
+    def warm_up(self, connections: Optional[int] = None) -> int:
+        """
+        Open keep-alive connections to the API host ahead of the first request
+
+        Args:
+            connections: Number of sockets to open in parallel (defaults to Config.POOL_WARMUP)
+
+        Returns:
+            Number of connections that were successfully established
+        """
+        count = Config.POOL_WARMUP if connections is None else connections
+        count = min(max(count, 0), self.pool_maxsize)
+        if count == 0 or not self.endpoint:
+            return 0
+
+        parts = urlsplit(self.endpoint)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+
+        def _touch(_):
+            try:
+                # Any response (even 404/405) leaves a TLS-established socket in the pool. Short timeout:
+                # this runs once at startup, and a slow or unreachable host must not hold the app up
+                self.session.head(origin, timeout=Config.CONNECT_TIMEOUT).close()
+                return True
+            except requests.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            return sum(pool.map(_touch, range(count)))
+
+    def close(self):
+        """Release all pooled connections"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def complete(self, messages: List[Dict], options: Optional[Dict] = None) -> str:
+        """
+        Call Qubrid API without streaming
+
+        Retries retryable failures with jittered exponential backoff inside
+        Config.OVERALL_DEADLINE, optionally hedging each attempt.
+
+        Args:
+            messages: List of message dictionaries
+            options: Extra/overriding payload fields (e.g. response_format, temperature)
+
+        Returns:
+            Complete response text
+        """
+        with self.metrics.span("payload_build"):
+            body = _serialize(build_payload(messages, stream=False, model=self.model, options=options))
+        self._local.last_usage = None
+
+        try:
+            reserved = self._admit(messages, options)
+            # The deadline covers the call itself, not the time spent queued for quota
+            deadline = time.monotonic() + Config.OVERALL_DEADLINE
+            # Every attempt is charged: a retry queues for quota again, a hedge is only sent if quota is free now
+            with self.metrics.span("api_call"):
+                text, usage = self._retrying(
+                    lambda: self._hedged(body, deadline, lambda: self._admit_hedge(messages, options)),
+                    deadline,
+                    before_retry=lambda: self._admit(messages, options),
+                )
+            # Kept per calling thread: hedged attempts run on executor threads
+            self._local.last_usage = usage
+            self.metrics.record_usage(usage)
+            if reserved is not None and usage:
+                get_rate_limiter().settle(reserved, usage.get("total_tokens"))
+            return text
+        except Exception as e:
+            raise wrap_error("API call failed", e)
+
+    def stream(self, messages: List[Dict], options: Optional[Dict] = None) -> Generator[str, None, None]:
+        """
+        Call Qubrid API with streaming enabled
+
+        The request is retried only until the first chunk arrives; after that
+        a stall longer than Config.STREAM_IDLE_TIMEOUT aborts the stream.
+
+        Args:
+            messages: List of message dictionaries
+            options: Extra/overriding payload fields (e.g. response_format, temperature)
+
+        Yields:
+            Text chunks as they arrive
+        """
+        with self.metrics.span("payload_build"):
+            body = _serialize(build_payload(messages, stream=True, model=self.model, options=options))
+
+        # Streams report no usage: each reservation is settled from the prompt and the text received
+        reservations = []
+        received = 0
+        try:
+            reservations.append(self._admit(messages, options))
+            deadline = time.monotonic() + Config.OVERALL_DEADLINE
+            start = time.perf_counter()
+            response = self._retrying(
+                lambda: self._open_stream(body, deadline), deadline,
+                before_retry=lambda: reservations.append(self._admit(messages, options)),
+            )
+            self.metrics.observe("ttfb", time.perf_counter() - start)
+            first_token = True
+            # The context manager hands the socket back to the pool even if
+            # the consumer stops iterating early
+            with response:
+                deltas = coalesce(
+                    self._iter_deltas(response, deadline),
+                    Config.STREAM_COALESCE_CHARS,
+                    Config.STREAM_COALESCE_MS / 1000,
+                )
+                for content in deltas:
+                    if first_token:
+                        self.metrics.observe("ttft", time.perf_counter() - start)
+                        first_token = False
+                    received += len(content)
+                    yield content
+            self.metrics.observe("stream_total", time.perf_counter() - start)
+
+        except Exception as e:
+            raise wrap_error("Streaming API call failed", e)
+        finally:
+            for attempt, reserved in enumerate(reservations, 1):
+                if reserved is not None:
+                    # Only the last attempt can have streamed any output
+                    output = received if attempt == len(reservations) else 0
+                    get_rate_limiter().settle(reserved, estimate_stream_usage(messages, output))
+
+    def _iter_deltas(self, response: requests.Response, deadline: float) -> Generator[str, None, None]:
+        """
+        Decode the raw SSE body into delta texts, up to the [DONE] event
+
+        The deadline only applies until the first token: a long answer that
+        keeps streaming is bounded by the idle (read) timeout instead.
+        """
+        # Chunked bodies are handed over one HTTP chunk at a time as they arrive; anything
+        # else is read in small blocks, since a large fixed read would wait for the block to fill
+        chunked = "chunked" in response.headers.get("Transfer-Encoding", "").lower()
+        decoder = SSEDecoder()
+        waiting = True
+        for raw in response.iter_content(chunk_size=None if chunked else Config.STREAM_READ_BYTES):
+            if waiting and time.monotonic() > deadline:
+                raise QubridAPIError(f"No token within the {Config.OVERALL_DEADLINE}s deadline")
+            for event in decoder.feed(raw):
+                try:
+                    content = event_delta(event)
+                except ValueError as e:
+                    if event.event == "error":
+                        raise QubridAPIError(f"Stream error event: {e}")
+                    # One bad chunk should not end the answer, but it must not vanish unnoticed
+                    self.metrics.increment("sse_malformed_events")
+                    print(f"Skipping malformed stream event (id={event.id}): {event.data[:120]!r}")
+                    continue
+                if content is SSE_DONE:
+                    return
+                if content:
+                    waiting = False
+                    yield content
+
+    # ---- rate limiting ----
+
+    def _admit(self, messages: List[Dict], options: Optional[Dict]) -> Optional[int]:
+        """Wait for the shared quota (priority and wait callback from request_context); returns the reservation"""
+        if not Config.RATE_LIMIT_ENABLED:
+            return None
+        priority, on_wait = current_context(messages)
+        start = time.monotonic()
+        reserved = get_rate_limiter().acquire(estimate_tokens(messages, options), priority, on_wait)
+        notify_admitted(time.monotonic() - start)
+        return reserved
+
+    def _admit_hedge(self, messages: List[Dict], options: Optional[Dict]) -> bool:
+        """Charge a hedged duplicate, but only if the quota has room for it right now"""
+        if not Config.RATE_LIMIT_ENABLED:
+            return True
+        priority, _ = current_context(messages)
+        return get_rate_limiter().try_acquire(estimate_tokens(messages, options), priority) is not None
+
+    def _observe_limits(self, response: requests.Response):
+        if Config.RATE_LIMIT_ENABLED:
+            get_rate_limiter().observe(response.headers, response.status_code)
+
+    # ---- single attempts ----
+
+    def _timeout(self, deadline: float, read: float):
+        """(connect, read) tuple, never extending past the overall deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise QubridAPIError(f"Deadline of {Config.OVERALL_DEADLINE}s exceeded")
+        return (min(Config.CONNECT_TIMEOUT, remaining), min(read, remaining))
+
+    def _post_once(self, body: bytes, deadline: float) -> Tuple[Optional[str], Optional[Dict]]:
+        start = time.monotonic()
+        # stream=True returns once headers arrive, which splits TTFB from body download
+        response = self._send(body, self._timeout(deadline, Config.READ_TIMEOUT))
+        headers_at = time.monotonic()
+        self.metrics.observe("ttfb", headers_at - start)
+        self._observe_limits(response)
+        with response:
+            content = response.content
+            self.metrics.observe("body_receive", time.monotonic() - headers_at)
+            if response.status_code != 200:
+                raise QubridAPIError.from_response(response)
+            result_json = json.loads(content)
+        self._record_latency(time.monotonic() - start)
+        return extract_content(result_json), result_json.get("usage")
+
+    def _open_stream(self, body: bytes, deadline: float) -> requests.Response:
+        # For streamed bodies the read timeout is the gap allowed between chunks
+        response = self._send(body, self._timeout(deadline, Config.STREAM_IDLE_TIMEOUT))
+        self._observe_limits(response)
+        if response.status_code != 200:
+            error = QubridAPIError.from_response(response)
+            response.close()
+            raise error
+        return response
+
+    def _send(self, body: bytes, timeout) -> requests.Response:
+        """
+        POST the body and return once the response headers arrive
+
+        Records "send" (connect + request upload, until the transport has read
+        the whole body) and "model_wait" (from there to the response headers).
+        """
+        start = time.monotonic()
+        upload = _UploadBody(body)
+        response = self.session.post(self.endpoint, data=upload, timeout=timeout, stream=True)
+        headers_at = time.monotonic()
+        sent_at = upload.sent_at or headers_at
+        self.metrics.observe("send", sent_at - start)
+        self.metrics.observe("model_wait", headers_at - sent_at)
+        return response
+
+    # ---- retries ----
+
+    def _retrying(self, attempt, deadline: float, before_retry=None):
+        """
+        Run attempt() until it succeeds, fails permanently, or the deadline/retry budget is spent
+
+        before_retry() runs after each backoff sleep, before the next attempt (e.g. to wait for quota)
+        """
+        retries = 0
+        while True:
+            try:
+                return attempt()
+            except Exception as e:
+                if not is_retryable(e, _TRANSIENT_ERRORS) or retries >= Config.MAX_RETRIES:
+                    raise
+                delay = backoff_delay(retries, getattr(e, "retry_after", None))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                retries += 1
+                time.sleep(delay)
+                if before_retry is not None:
+                    before_retry()
+
+    # ---- hedging ----
+
+    def _hedged(self, body: bytes, deadline: float, admit_hedge=None) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Send the request, and if it is slower than the observed p95 send a
+        duplicate and take whichever succeeds first
+
+        admit_hedge() is asked before the duplicate is sent; if it returns False
+        only the first request is awaited
+        """
+        if not Config.HEDGE_ENABLED:
+            return self._post_once(body, deadline)
+
+        executor = self._hedge_executor()
+        primary = executor.submit(self._post_once, body, deadline)
+        done, _ = wait([primary], timeout=self._hedge_delay())
+        if done:
+            return primary.result()
+        if admit_hedge is not None and not admit_hedge():
+            self.metrics.increment("hedge_rate_limited")
+            return primary.result()
+
+        self.hedges_sent += 1
+        futures = [primary, executor.submit(self._post_once, body, deadline)]
+        error = None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                if future is not primary:
+                    self.hedges_won += 1
+                # The losing request cannot be aborted mid-flight, it finishes in the background
+                return result
+            except Exception as e:
+                error = e
+        raise error
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.pool_maxsize, thread_name_prefix="qubrid-hedge"
+                    )
+        return self._executor
+
+    def _record_latency(self, seconds: float):
+        with self._latency_lock:
+            self._latencies.append(seconds)
+
+    def _hedge_delay(self) -> float:
+        """Delay before hedging: the observed latency quantile once enough samples exist"""
+        with self._latency_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < Config.HEDGE_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * Config.HEDGE_QUANTILE))
+        return max(Config.HEDGE_MIN_DELAY, samples[index])
+
+
+# Failures worth another attempt besides retryable HTTP statuses
+_TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+_default_client: Optional[QubridClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> QubridClient:
+    """Return the process-wide shared QubridClient"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = QubridClient()
+    return _default_client
+
+
+def call_qubrid_api(messages: List[Dict], stream: bool = False, options: Optional[Dict] = None) -> str:
     """
     Call Qubrid API without streaming (default)
-    
+
     Args:
         messages: List of message dictionaries
         stream: Enable streaming (not used in default call)
-        
+        options: Extra/overriding payload fields (e.g. response_format, temperature)
+
     Returns:
         Complete response text
     """
-    headers = {
-        "Authorization": f"Bearer {Config.API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    api_messages = _format_messages(messages)
-    
-    payload = {
-        "model": Config.MODEL_NAME,
-        "messages": api_messages,
-        "max_tokens": Config.MAX_TOKENS,
-        "temperature": Config.TEMPERATURE,
-        "stream": False,
-        "top_p": Config.TOP_P,
-        "presence_penalty": Config.PRESENCE_PENALTY
-    }
-    
-    try:
-        response = requests.post(
-            Config.API_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=Config.TIMEOUT
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if "content" in result:
-                return result["content"]
-            elif "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0].get("message", {}).get("content")
-        else:
-            raise Exception(f"API Error {response.status_code}: {response.text}")
-            
-    except Exception as e:
-        raise Exception(f"API call failed: {str(e)}")
+    return get_client().complete(messages, options=options)
 
-def call_qubrid_api_stream(messages: List[Dict]) -> Generator[str, None, None]:
+def call_qubrid_api_stream(messages: List[Dict], options: Optional[Dict] = None) -> Generator[str, None, None]:
     """
     Call Qubrid API with streaming enabled
-    
+
     Args:
         messages: List of message dictionaries
-        
+        options: Extra/overriding payload fields (e.g. response_format, temperature)
+
     Yields:
         Text chunks as they arrive
     """
-    headers = {
-        "Authorization": f"Bearer {Config.API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    api_messages = _format_messages(messages)
-    
+    yield from get_client().stream(messages, options=options)
+
+def build_payload(
+    messages: List[Dict], stream: bool, model: Optional[str] = None, options: Optional[Dict] = None
+) -> Dict:
+    """Build the chat-completions request body shared by every client"""
     payload = {
-        "model": Config.MODEL_NAME,
-        "messages": api_messages,
+        "model": model or Config.MODEL_NAME,
+        "messages": _format_messages(messages),
         "max_tokens": Config.MAX_TOKENS,
         "temperature": Config.TEMPERATURE,
-        "stream": True,
+        "stream": stream,
         "top_p": Config.TOP_P,
         "presence_penalty": Config.PRESENCE_PENALTY
     }
-    
-    try:
-        response = requests.post(
-            Config.API_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=Config.TIMEOUT,
-            stream=True
-        )
-        
-        for line in response.iter_lines():
-            if line:
-                decoded_line = line.decode("utf-8")
-                if decoded_line.startswith("data: "):
-                    json_str = decoded_line[6:]
-                    if json_str.strip() == "[DONE]":
-                        break
-                    try:
-                        chunk = json.loads(json_str)
-                        if "choices" in chunk and len(chunk["choices"]) > 0:
-                            content = chunk["choices"][0].get("delta", {}).get("content", "")
-                            if content:
-                                yield content
-                    except json.JSONDecodeError:
-                        continue
-                        
-    except Exception as e:
-        raise Exception(f"Streaming API call failed: {str(e)}")
+    if options:
+        payload.update(options)
+    return payload
+
+def _serialize(payload: Dict) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+class _UploadBody(io.BytesIO):
+    """Request body that notes when the transport has read the last byte (the upload is on the wire)"""
+
+    def __init__(self, body: bytes):
+        super().__init__(body)
+        self.sent_at: Optional[float] = None
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = super().read(size)
+        if not chunk and self.sent_at is None:
+            self.sent_at = time.monotonic()
+        return chunk
+
+def extract_content(result: Dict) -> Optional[str]:
+    """Pull the response text out of a non-streaming response body"""
+    if "content" in result:
+        return result["content"]
+    elif "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0].get("message", {}).get("content")
+    return None
 
 def _format_messages(messages: List[Dict]) -> List[Dict]:
     """Format messages for API"""
     api_messages = []
-    
+
     for msg in messages:
         if msg["role"] == "user":
             content = [{"type": "text", "text": msg["content"]}]
             if "image" in msg:
                 content.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{msg['image']}"}
+                    "image_url": {"url": f"data:{_image_mime(msg['image'])};base64,{msg['image']}"}
                 })
             api_messages.append({"role": "user", "content": content})
         else:
+            # System turns (instructions, conversation summary) keep their role; anything else is the model's
             api_messages.append({
-                "role": "assistant",
+                "role": "system" if msg["role"] == "system" else "assistant",
                 "content": [{"type": "text", "text": msg["content"]}]
             })
-    
+
     return api_messages
+
+def _image_mime(image_base64: str) -> str:
+    """Sniff the MIME type from the base64-encoded magic bytes"""
+    if image_base64.startswith("UklGR"):
+        return "image/webp"
+    if image_base64.startswith("iVBOR"):
+        return "image/png"
+    return "image/jpeg"
@@ -0,0 +1,343 @@
+"""asyncio-native API client for Qubrid Vision Model"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Dict, List, Optional
+from config import Config
+import time
+from .api_client import build_payload, extract_content
+from .retry import QubridAPIError, backoff_delay, is_retryable, retry_after, wrap_error
+from .rate_limiter import (
+    get_rate_limiter, estimate_tokens, estimate_stream_usage, PRIORITY_BATCH_ANALYSIS, PRIORITY_BATCH_CHAT,
+)
+from .sse import SSEDecoder, SSE_DONE, event_delta
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency, only needed for async/batch workloads
+    aiohttp = None
+
+# Failures worth another attempt besides retryable HTTP statuses
+_TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError) if aiohttp is not None else ()
+
+
+class AsyncQubridClient:
+    """
+    Async counterpart of QubridClient.
+
+    One instance owns one aiohttp session and a semaphore bounding how many
+    requests may be in flight at once. Cancelling a task that is awaiting
+    ``complete`` or iterating ``stream`` releases both the connection and the
+    semaphore slot.
+
+    Every attempt is admitted by the shared rate limiter at batch priority, so
+    interactive calls in the same process are served first.
+
+    Usage:
+        async with AsyncQubridClient(max_concurrency=32) as client:
+            text = await client.complete(messages)
+            async for chunk in client.stream(messages):
+                ...
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        api_key: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        model: Optional[str] = None,
+    ):
+        if aiohttp is None:
+            raise ImportError("AsyncQubridClient requires aiohttp (pip install aiohttp)")
+
+        self.api_key = api_key or Config.API_KEY
+        self.endpoint = endpoint or Config.API_ENDPOINT
+        self.model = model or Config.MODEL_NAME
+        self.max_concurrency = max_concurrency or Config.ASYNC_MAX_CONCURRENCY
+
+        # Created on first use so it binds to the running loop (Python 3.9)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._admit_pool: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+
+    async def __aenter__(self) -> "AsyncQubridClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=Config.POOL_MAXSIZE,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                timeout=aiohttp.ClientTimeout(
+                    total=Config.OVERALL_DEADLINE,
+                    sock_connect=Config.CONNECT_TIMEOUT,
+                    sock_read=Config.READ_TIMEOUT,
+                ),
+            )
+        return self._session
+
+    async def close(self):
+        """Close the session and every pooled connection"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._admit_pool is not None:
+            self._admit_pool.shutdown(wait=False)
+            self._admit_pool = None
+
+    async def _admit(self, tokens: int, priority: int) -> Optional[int]:
+        """Wait for the shared quota on a worker thread, so the event loop keeps running"""
+        if not Config.RATE_LIMIT_ENABLED:
+            return None
+        if self._admit_pool is None:
+            # Called with a semaphore slot held, so max_concurrency threads never block each other
+            self._admit_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="qubrid-admit")
+        future = self._admit_pool.submit(get_rate_limiter().acquire, tokens, priority)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The worker cannot be interrupted: if it still gets the quota, give it straight back
+            future.add_done_callback(_release_unused)
+            raise
+
+    def _observe_limits(self, response: "aiohttp.ClientResponse"):
+        if Config.RATE_LIMIT_ENABLED:
+            get_rate_limiter().observe(response.headers, response.status)
+
+    async def complete(self, messages: List[Dict], options: Optional[Dict] = None) -> str:
+        """
+        Call Qubrid API without streaming
+
+        Retries retryable failures (honouring Retry-After) with jittered
+        backoff; all attempts together stay within Config.OVERALL_DEADLINE.
+
+        Args:
+            messages: List of message dictionaries
+            options: Extra/overriding payload fields (e.g. response_format, temperature)
+
+        Returns:
+            Complete response text
+        """
+        payload = build_payload(messages, stream=False, model=self.model, options=options)
+        tokens = estimate_tokens(messages, options)
+        priority = _batch_priority(messages)
+        deadline = time.monotonic() + Config.OVERALL_DEADLINE
+        retries = 0
+
+        while True:
+            try:
+                return await self._post_once(payload, tokens, priority, deadline)
+            except Exception as e:
+                delay = backoff_delay(retries, getattr(e, "retry_after", None))
+                if not is_retryable(e, _TRANSIENT_ERRORS) or retries >= Config.MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    raise wrap_error("API call failed", e)
+                retries += 1
+                # Sleep outside the semaphore so waiting retries don't hold a slot
+                await asyncio.sleep(delay)
+
+    async def _post_once(self, payload: Dict, tokens: int, priority: int, deadline: float) -> str:
+        async with self._get_semaphore():
+            reserved = await self._admit(tokens, priority)
+            self.in_flight += 1
+            try:
+                timeout = _timeout(deadline, Config.READ_TIMEOUT)
+                async with self._get_session().post(self.endpoint, json=payload, timeout=timeout) as response:
+                    self._observe_limits(response)
+                    if response.status == 200:
+                        result_json = await response.json(content_type=None)
+                        usage = result_json.get("usage")
+                        if reserved is not None and usage:
+                            get_rate_limiter().settle(reserved, usage.get("total_tokens"))
+                        return extract_content(result_json)
+                    raise await _error_from_response(response)
+            finally:
+                self.in_flight -= 1
+
+    async def stream(self, messages: List[Dict], options: Optional[Dict] = None) -> AsyncGenerator[str, None]:
+        """
+        Call Qubrid API with streaming enabled
+
+        Opening the stream is retried like complete(); once a response is
+        streaming it is not retried. Config.OVERALL_DEADLINE bounds the time
+        to the first token, after that a stall longer than
+        Config.STREAM_IDLE_TIMEOUT aborts the stream.
+
+        Args:
+            messages: List of message dictionaries
+            options: Extra/overriding payload fields (e.g. response_format, temperature)
+
+        Yields:
+            Text chunks as they arrive
+        """
+        payload = build_payload(messages, stream=True, model=self.model, options=options)
+        tokens = estimate_tokens(messages, options)
+        priority = _batch_priority(messages)
+        deadline = time.monotonic() + Config.OVERALL_DEADLINE
+        semaphore = self._get_semaphore()
+        limiter = get_rate_limiter()
+        retries = 0
+        received = 0
+
+        try:
+            while True:
+                await semaphore.acquire()
+                reserved = None
+                try:
+                    reserved = await self._admit(tokens, priority)
+                    response = await self._open_stream(payload, deadline)
+                    break
+                except BaseException as e:
+                    semaphore.release()
+                    if reserved is not None:
+                        # Sent, but nothing was generated: only the prompt counts
+                        limiter.settle(reserved, estimate_stream_usage(messages, 0))
+                    delay = backoff_delay(retries, getattr(e, "retry_after", None))
+                    if (not isinstance(e, Exception) or not is_retryable(e, _TRANSIENT_ERRORS)
+                            or retries >= Config.MAX_RETRIES or time.monotonic() + delay >= deadline):
+                        raise
+                retries += 1
+                await asyncio.sleep(delay)     # Outside the semaphore, like complete()
+
+            # The slot is held until the stream ends, also if the consumer stops early
+            self.in_flight += 1
+            try:
+                async with response:
+                    decoder = SSEDecoder()
+                    waiting = True
+                    async for raw in response.content.iter_any():
+                        if waiting and time.monotonic() > deadline:
+                            raise QubridAPIError(f"No token within the {Config.OVERALL_DEADLINE}s deadline")
+                        for event in decoder.feed(raw):
+                            try:
+                                content = event_delta(event)
+                            except ValueError as e:
+                                if event.event == "error":
+                                    raise QubridAPIError(f"Stream error event: {e}")
+                                print(f"Skipping malformed stream event (id={event.id}): {event.data[:120]!r}")
+                                continue
+                            if content is SSE_DONE:
+                                return
+                            if content:
+                                waiting = False
+                                received += len(content)
+                                yield content
+            finally:
+                self.in_flight -= 1
+                semaphore.release()
+                if reserved is not None:
+                    limiter.settle(reserved, estimate_stream_usage(messages, received))
+        except Exception as e:
+            raise wrap_error("Streaming API call failed", e)
+
+    async def _open_stream(self, payload: Dict, deadline: float) -> "aiohttp.ClientResponse":
+        # For streamed bodies the read timeout is the gap allowed between chunks
+        timeout = _timeout(deadline, Config.STREAM_IDLE_TIMEOUT, streaming=True)
+        response = await self._get_session().post(self.endpoint, json=payload, timeout=timeout)
+        self._observe_limits(response)
+        if response.status != 200:
+            try:
+                raise await _error_from_response(response)
+            finally:
+                response.release()
+        return response
+
+    async def complete_many(self, batch: List[List[Dict]], return_exceptions: bool = True) -> List:
+        """
+        Run many non-streaming calls concurrently (bounded by max_concurrency)
+
+        Args:
+            batch: One message list per request
+            return_exceptions: Return failures in place instead of raising the first one
+
+        Returns:
+            Response texts (or exceptions) in input order
+        """
+        tasks = [asyncio.ensure_future(self.complete(messages)) for messages in batch]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+def _timeout(deadline: float, read: float, streaming: bool = False) -> "aiohttp.ClientTimeout":
+    """Per-attempt timeout that never extends past the overall deadline (streams have no total, only idle gaps)"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise QubridAPIError(f"Deadline of {Config.OVERALL_DEADLINE}s exceeded")
+    return aiohttp.ClientTimeout(
+        total=None if streaming else remaining,
+        sock_connect=min(Config.CONNECT_TIMEOUT, remaining),
+        sock_read=min(read, remaining),
+    )
+
+async def _error_from_response(response: "aiohttp.ClientResponse") -> QubridAPIError:
+    return QubridAPIError(
+        f"API Error {response.status}: {await response.text()}",
+        status_code=response.status,
+        retry_after=retry_after(response.headers),
+    )
+
+def _release_unused(future):
+    """Done callback for an admission whose caller was cancelled while it waited"""
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        get_rate_limiter().release(future.result())
+
+def _batch_priority(messages: List[Dict]) -> int:
+    """Async calls are batch work: image analyses ahead of chat, both behind interactive calls"""
+    return PRIORITY_BATCH_ANALYSIS if any(m.get("image") for m in messages) else PRIORITY_BATCH_CHAT
+
+
+async def call_qubrid_api_async(messages: List[Dict], client: Optional[AsyncQubridClient] = None) -> str:
+    """
+    Async equivalent of call_qubrid_api
+
+    Args:
+        messages: List of message dictionaries
+        client: Client to reuse; a short-lived one is created if omitted
+
+    Returns:
+        Complete response text
+    """
+    if client is not None:
+        return await client.complete(messages)
+    async with AsyncQubridClient() as own_client:
+        return await own_client.complete(messages)
+
+async def call_qubrid_api_stream_async(
+    messages: List[Dict], client: Optional[AsyncQubridClient] = None
+) -> AsyncGenerator[str, None]:
+    """
+    Async equivalent of call_qubrid_api_stream
+
+    Args:
+        messages: List of message dictionaries
+        client: Client to reuse; a short-lived one is created if omitted
+
+    Yields:
+        Text chunks as they arrive
+    """
+    if client is not None:
+        async for chunk in client.stream(messages):
+            yield chunk
+        return
+    async with AsyncQubridClient() as own_client:
+        async for chunk in own_client.stream(messages):
+            yield chunk
@@ -0,0 +1,244 @@
+"""Content-addressed cache for validated nutrition analyses"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+
+
+def make_cache_key(image_base64: str, prompt_version: str, model_name: str) -> str:
+    """
+    Build the content address for an analysis
+
+    Args:
+        image_base64: Normalized (re-encoded JPEG) image as base64
+        prompt_version: Version tag of the analysis prompt
+        model_name: Model that produced the analysis
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    digest.update(image_base64.encode("ascii"))
+    digest.update(b"\0")
+    digest.update(prompt_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((model_name or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def make_cache_scope(prompt_version: str, model_name: str) -> str:
+    """Short tag for analyses of any image made with this prompt version and model"""
+    digest = hashlib.sha256(f"{prompt_version}\0{model_name or ''}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of NutritionData dicts.
+
+    Tier 1 is an in-process LRU; tier 2 is a directory of JSON files with a
+    TTL and a total-size budget (least recently used files are evicted first).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        memory_items: Optional[int] = None,
+        disk_max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+    ):
+        self.cache_dir = os.path.join(cache_dir or Config.CACHE_DIR, "analysis")
+        self.memory_items = Config.CACHE_MEMORY_ITEMS if memory_items is None else memory_items
+        self.disk_max_bytes = Config.CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self.ttl_seconds = Config.CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    # ---- public API ----
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached analysis for ``key`` or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, data = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return data
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        data = self._disk_get(key, now)
+        with self._lock:
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._memory_put(key, data, now)
+        return data
+
+    def put(self, key: str, data: Dict):
+        """Store a validated analysis in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, data, now)
+            self.stats["stores"] += 1
+        self._disk_put(key, data)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".json"):
+                        _silent_remove(os.path.join(self.cache_dir, name))
+            self._disk_bytes = 0
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters plus derived hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes or 0
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    # ---- memory tier ----
+
+    def _memory_put(self, key: str, data: Dict, now: float):
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = (now, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # ---- disk tier ----
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict]:
+        if self.disk_max_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        # mtime records the last access, atime is unreliable on noatime mounts
+        if now - stat.st_mtime > self.ttl_seconds:
+            _silent_remove(path)
+            with self._lock:
+                self.stats["expired"] += 1
+                if self._disk_bytes is not None:
+                    self._disk_bytes -= stat.st_size
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path, None)
+            return data
+        except (OSError, ValueError):
+            _silent_remove(path)
+            return None
+
+    def _disk_put(self, key: str, data: Dict):
+        if self.disk_max_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            blob = json.dumps(data, separators=(",", ":")).encode("utf-8")
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(blob)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        for entry in _iter_cache_files(self.cache_dir):
+            total += entry.stat().st_size
+        return total
+
+    def _evict_disk(self):
+        """Remove least recently used files until the tier is at 90% of its budget"""
+        entries = []
+        for entry in _iter_cache_files(self.cache_dir):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            _silent_remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+        self._disk_bytes = total
+
+
+def _iter_cache_files(directory: str):
+    if not os.path.isdir(directory):
+        return
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".json") and entry.is_file():
+                yield entry
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_default_cache: Optional[AnalysisCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Return the process-wide shared AnalysisCache"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = AnalysisCache()
+    return _default_cache
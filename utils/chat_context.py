@@ -0,0 +1,103 @@
+"""Token-budgeted conversation context for follow-up chat"""
+import json
+import re
+from typing import Callable, Dict, List, Optional
+from config import Config
+from prompts import CHAT_SYSTEM_PROMPT
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), same heuristic as the usage footer"""
+    return len(text) // 4 + 1
+
+def extractive_summary(message: Dict) -> str:
+    """Default summarizer: one short line per evicted message, no model call"""
+    text = re.sub(r"\s+", " ", message["content"]).strip()
+    # First sentence is usually the answer itself, the rest is elaboration
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(sentence) > 160:
+        sentence = sentence[:157] + "..."
+    speaker = "User asked" if message["role"] == "user" else "You answered"
+    return f"- {speaker}: {sentence}"
+
+
+class ChatContext:
+    """
+    Builds the API message list for one analyzed dish under a token budget.
+
+    The system prompt (with the nutrition data serialized compactly, once)
+    is a byte-identical prefix on every turn so provider-side prefix caching
+    can hit. When the transcript outgrows the budget, the oldest messages are
+    folded into a rolling summary. Eviction is done in batches down to a low
+    watermark, so the summary, and therefore the cached prefix, stays
+    unchanged for several turns at a time.
+    """
+
+    def __init__(
+        self,
+        nutrition_data: Dict,
+        budget_tokens: Optional[int] = None,
+        summary_tokens: Optional[int] = None,
+        min_recent: Optional[int] = None,
+        summarizer: Callable[[Dict], str] = extractive_summary,
+    ):
+        self.budget_tokens = budget_tokens or Config.CHAT_CONTEXT_TOKENS
+        self.summary_tokens = summary_tokens or Config.CHAT_SUMMARY_TOKENS
+        self.min_recent = Config.CHAT_MIN_RECENT_MESSAGES if min_recent is None else min_recent
+        self.summarizer = summarizer
+
+        data_context = json.dumps(nutrition_data, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+        self.system_prompt = CHAT_SYSTEM_PROMPT.format(nutrition_data=data_context)
+        self.system_tokens = estimate_tokens(self.system_prompt)
+
+        self.summary_lines: List[str] = []
+        self.summarized_upto = 0    # Messages before this index live only in the summary
+        self._token_cache: List[int] = []
+
+    def _tokens(self, messages: List[Dict], index: int) -> int:
+        # Transcript messages never change once appended, so estimates are memoized by position
+        while len(self._token_cache) <= index:
+            self._token_cache.append(estimate_tokens(messages[len(self._token_cache)]["content"]))
+        return self._token_cache[index]
+
+    def _summary_text(self) -> str:
+        return "Summary of the earlier conversation:\n" + "\n".join(self.summary_lines)
+
+    def build_messages(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Args:
+            messages: Full transcript ({"role", "content"} dicts, oldest first)
+
+        Returns:
+            Messages to send: system prefix, optional summary, most recent turns
+        """
+        if len(messages) < len(self._token_cache):
+            # Transcript was reset or replaced
+            self._token_cache = []
+            self.summary_lines = []
+            self.summarized_upto = 0
+
+        total = self.system_tokens + sum(self._tokens(messages, i) for i in range(self.summarized_upto, len(messages)))
+        if self.summary_lines:
+            total += estimate_tokens(self._summary_text())
+
+        if total > self.budget_tokens:
+            low_watermark = int(self.budget_tokens * 0.6)
+            last_evictable = len(messages) - self.min_recent
+            while total > low_watermark and self.summarized_upto < last_evictable:
+                message = messages[self.summarized_upto]
+                total -= self._tokens(messages, self.summarized_upto)
+                line = self.summarizer(message)
+                self.summary_lines.append(line)
+                total += estimate_tokens(line)
+                self.summarized_upto += 1
+
+            # The summary itself is bounded: oldest lines fall off first
+            while self.summary_lines and estimate_tokens(self._summary_text()) > self.summary_tokens:
+                self.summary_lines.pop(0)
+
+        api_messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary_lines:
+            api_messages.append({"role": "system", "content": self._summary_text()})
+        api_messages.extend(messages[self.summarized_upto:])
+        return api_messages
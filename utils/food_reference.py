@@ -0,0 +1,190 @@
+"""Embedded nutrition reference table with a trigram fuzzy name index"""
+import csv
+import re
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+MACRO_FIELDS = ("calories", "protein", "carbs", "fat", "fiber", "sugar")
+
+# Differences below these are never flagged, whatever the ratio (small values swing wildly)
+ABSOLUTE_SLACK = {"calories": 60, "protein": 5, "carbs": 8, "fat": 5, "fiber": 3, "sugar": 5}
+
+_STOPWORDS = {"a", "an", "the", "with", "and", "of", "in", "on", "fresh", "homemade", "served", "some",
+              "slice", "slices", "piece", "pieces", "portion", "serving", "plate"}
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip punctuation and filler words: "The Grilled-Chicken Salad!" -> "grilled chicken salad" """
+    words = re.sub(r"[^a-z0-9]+", " ", name.lower()).split()
+    return " ".join(word for word in words if word not in _STOPWORDS)
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodReference:
+    """
+    Read-only per-100g macro table for common dishes.
+
+    Values live in one array('f') per macro (row-aligned with the names).
+    Every name and alias is a key in an inverted trigram index whose
+    posting lists are array('H') of key ids, so a lookup only touches keys
+    that share at least one trigram with the query.
+
+    Usage:
+        reference = get_food_reference()
+        match = reference.lookup("Grilled Chicken Caesar Salad")
+        report = reference.validate(nutrition_data)
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.REFERENCE_PATH
+        self.names: List[str] = []
+        self.values: Dict[str, array] = {field: array("f") for field in MACRO_FIELDS}
+
+        self._key_row = array("H")       # Key id -> row
+        self._key_size = array("H")      # Key id -> number of distinct trigrams
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            rows = csv.DictReader(line for line in f if not line.startswith("#"))
+            for row in rows:
+                index = len(self.names)
+                self.names.append(row["name"])
+                for field in MACRO_FIELDS:
+                    self.values[field].append(float(row[field]))
+                aliases = [alias for alias in (row.get("aliases") or "").split("|") if alias]
+                for key in [row["name"], *aliases]:
+                    self._add_key(normalize_name(key), index)
+
+    def _add_key(self, key: str, row: int):
+        if not key or key in self._exact:
+            return
+        key_id = len(self._key_row)
+        grams = trigrams(key)
+        self._key_row.append(row)
+        self._key_size.append(len(grams))
+        self._exact[key] = key_id
+        for gram in grams:
+            self._postings.setdefault(gram, array("H")).append(key_id)
+
+    def match(self, name: str, threshold: Optional[float] = None) -> Optional[Tuple[int, float]]:
+        """
+        Find the reference row best matching a dish name
+
+        The score is the smaller of the two trigram coverages (query by
+        reference, reference by query), so both names must mostly consist of
+        the other: a short reference name inside a longer query is a different
+        dish ("banana bread" is not "banana", "sweet potato fries" is not
+        "sweet potato"). Portion words are dropped first, so "Pepperoni Pizza
+        Slice" is still "pepperoni pizza".
+
+        Returns:
+            (row index, score in 0-1) or None below the threshold
+        """
+        if threshold is None:
+            threshold = Config.REFERENCE_MATCH_THRESHOLD
+        key = normalize_name(name or "")
+        if not key:
+            return None
+        key_id = self._exact.get(key)
+        if key_id is not None:
+            return self._key_row[key_id], 1.0
+
+        grams = trigrams(key)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best = None
+        best_rank = (threshold, 0)
+        for candidate, count in shared.items():
+            size = self._key_size[candidate]
+            score = count / max(len(grams), size)
+            rank = (score, count)       # Ties go to the longer shared name
+            if rank >= best_rank:
+                best, best_rank = candidate, rank
+        if best is None:
+            return None
+        return self._key_row[best], best_rank[0]
+
+    def lookup(self, name: str, threshold: Optional[float] = None) -> Optional[Dict]:
+        """
+        Per-100g macros for a dish name, without any API call
+
+        Returns:
+            {"name", "score", "per_100g": {field: value}} or None if nothing matches
+        """
+        found = self.match(name, threshold)
+        if found is None:
+            return None
+        row, score = found
+        return {
+            "name": self.names[row],
+            "score": round(score, 3),
+            "per_100g": {field: round(self.values[field][row], 1) for field in MACRO_FIELDS},
+        }
+
+    def validate(self, data: Dict, tolerance: Optional[float] = None) -> Optional[Dict]:
+        """
+        Compare model macros with the reference entry for the same dish
+
+        A value is flagged when it is more than `tolerance` times above or
+        below the reference and also differs by more than ABSOLUTE_SLACK.
+
+        Returns:
+            {"match", "score", "flags": [message, ...]} or None if the dish is not in the table
+        """
+        if tolerance is None:
+            tolerance = Config.REFERENCE_TOLERANCE
+        reference = self.lookup(data.get("dish_name", ""))
+        if reference is None:
+            return None
+
+        flags = []
+        for field in MACRO_FIELDS:
+            value = data.get(field)
+            if not isinstance(value, (int, float)):
+                continue
+            expected = reference["per_100g"][field]
+            if abs(value - expected) <= ABSOLUTE_SLACK[field]:
+                continue
+            if expected <= 0 or not (expected / tolerance <= value <= expected * tolerance):
+                unit = " kcal" if field == "calories" else "g"
+                flags.append(f"{field} {value:g}{unit} vs ~{expected:g}{unit} typical for {reference['name']}")
+        return {"match": reference["name"], "score": reference["score"], "flags": flags}
+
+    def fill(self, data: Dict, fields: List[str]) -> Dict:
+        """Reference values for the requested macro fields of a dish (empty if it is unknown)"""
+        reference = self.lookup(data.get("dish_name", ""))
+        if reference is None:
+            return {}
+        return {field: reference["per_100g"][field] for field in fields if field in MACRO_FIELDS}
+
+
+_default_reference: Optional[FoodReference] = None
+_default_reference_lock = threading.Lock()
+
+
+def get_food_reference() -> FoodReference:
+    """Return the process-wide reference table (loaded on first use)"""
+    global _default_reference
+    if _default_reference is None:
+        with _default_reference_lock:
+            if _default_reference is None:
+                _default_reference = FoodReference()
+    return _default_reference
+
+def lookup_macros(name: str) -> Optional[Dict]:
+    """Local fast path: per-100g macros for a dish name, or None if it is not in the table"""
+    return get_food_reference().lookup(name)
@@ -0,0 +1,215 @@
+"""Persistent meal history (SQLite, WAL) with incrementally maintained daily/weekly totals"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+MACRO_COLUMNS = ("calories", "protein", "carbs", "fat", "fiber", "sugar")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meals (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    week TEXT NOT NULL,
+    dish_name TEXT NOT NULL,
+    {", ".join(f"{column} REAL NOT NULL" for column in MACRO_COLUMNS)},
+    health_score INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meals_user_time ON meals (user_id, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    meals INTEGER NOT NULL,
+    {", ".join(f"{column} REAL NOT NULL" for column in MACRO_COLUMNS)},
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS weekly_totals (
+    user_id TEXT NOT NULL,
+    week TEXT NOT NULL,
+    meals INTEGER NOT NULL,
+    {", ".join(f"{column} REAL NOT NULL" for column in MACRO_COLUMNS)},
+    PRIMARY KEY (user_id, week)
+) WITHOUT ROWID;
+"""
+
+
+def _upsert_totals(table: str, period: str) -> str:
+    columns = ", ".join(MACRO_COLUMNS)
+    placeholders = ", ".join("?" for _ in MACRO_COLUMNS)
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in MACRO_COLUMNS)
+    return (
+        f"INSERT INTO {table} (user_id, {period}, meals, {columns}) VALUES (?, ?, 1, {placeholders}) "
+        f"ON CONFLICT (user_id, {period}) DO UPDATE SET meals = meals + 1, {updates}"
+    )
+
+_UPSERT_DAILY = _upsert_totals("daily_totals", "day")
+_UPSERT_WEEKLY = _upsert_totals("weekly_totals", "week")
+
+
+def period_keys(timestamp: float) -> Tuple[str, str]:
+    """Local calendar day ("2024-05-31") and ISO week ("2024-W22") of a timestamp"""
+    moment = datetime.fromtimestamp(timestamp)
+    year, week, _ = moment.isocalendar()
+    return moment.date().isoformat(), f"{year}-W{week:02d}"
+
+
+class HistoryStore:
+    """
+    Meal history for any number of users in one SQLite database.
+
+    Each analysis is stored with its full validated NutritionData. Daily
+    and weekly macro totals are updated in the same transaction as the
+    insert, so summaries are single-row primary-key reads and never rescan
+    the meals table. Values are the analyzed per-100g figures, so totals
+    compare meals on that basis rather than measuring portions.
+
+    One connection is kept per thread; WAL mode lets the Streamlit script
+    threads read while another session writes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.path.expanduser(path or Config.HISTORY_DB)
+        if self.path == ":memory:":
+            # Each thread opens its own connection, so ":memory:" would give every thread its own empty
+            # database (and a shared-cache one fails concurrent writers with "table is locked"). A private
+            # temporary file gets the same WAL locking and busy timeout as a real history, and is removed
+            # with the store.
+            temp_dir = tempfile.mkdtemp(prefix="nutrivision-history-")
+            weakref.finalize(self, shutil.rmtree, temp_dir, ignore_errors=True)
+            self.path = os.path.join(temp_dir, "history.db")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)     # Idempotent; whichever thread connects first creates the tables
+            self._local.conn = conn
+        return conn
+
+    def add(self, user_id: str, data: Dict, timestamp: Optional[float] = None) -> int:
+        """
+        Record one validated analysis and fold it into the running totals
+
+        Args:
+            user_id: Owner of the entry
+            data: NutritionData app dict (must not carry an "error")
+            timestamp: Unix time of the meal (defaults to now)
+
+        Returns:
+            Id of the new meal row
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        day, week = period_keys(timestamp)
+        macros = [float(data.get(column) or 0) for column in MACRO_COLUMNS]
+        conn = self._conn()
+        with conn:   # One transaction: the meal and both totals, or nothing
+            cursor = conn.execute(
+                f"INSERT INTO meals (user_id, created_at, day, week, dish_name, {', '.join(MACRO_COLUMNS)}, "
+                f"health_score, data) VALUES (?, ?, ?, ?, ?, {', '.join('?' for _ in MACRO_COLUMNS)}, ?, ?)",
+                (user_id, timestamp, day, week, data.get("dish_name", "Unknown"), *macros,
+                 int(data.get("health_score") or 0), json.dumps(data, separators=(",", ":"))),
+            )
+            conn.execute(_UPSERT_DAILY, (user_id, day, *macros))
+            conn.execute(_UPSERT_WEEKLY, (user_id, week, *macros))
+        return cursor.lastrowid
+
+    def recent(
+        self, user_id: str, limit: int = 10, before: Optional[Tuple[float, int]] = None
+    ) -> Tuple[List[Dict], Optional[Tuple[float, int]]]:
+        """
+        One page of meals, newest first (keyset pagination on the user/time index)
+
+        Args:
+            user_id: Owner
+            limit: Page size
+            before: Cursor returned by the previous page
+
+        Returns:
+            (meals without the full payload, cursor for the next page or None)
+        """
+        columns = f"id, created_at, dish_name, {', '.join(MACRO_COLUMNS)}, health_score"
+        if before is None:
+            rows = self._conn().execute(
+                f"SELECT {columns} FROM meals WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit + 1),
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                f"SELECT {columns} FROM meals WHERE user_id = ? AND (created_at, id) < (?, ?) "
+                f"ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, before[0], before[1], limit + 1),
+            ).fetchall()
+        # One extra row tells whether an older page exists
+        meals = [dict(row) for row in rows[:limit]]
+        cursor = (meals[-1]["created_at"], meals[-1]["id"]) if len(rows) > limit else None
+        return meals, cursor
+
+    def meals_between(self, user_id: str, start: float, end: float) -> List[Dict]:
+        """Full entries (with the NutritionData payload) eaten in [start, end)"""
+        rows = self._conn().execute(
+            "SELECT id, created_at, data FROM meals WHERE user_id = ? AND created_at >= ? AND created_at < ? "
+            "ORDER BY created_at",
+            (user_id, start, end),
+        ).fetchall()
+        return [{"id": row["id"], "created_at": row["created_at"], **json.loads(row["data"])} for row in rows]
+
+    def daily_totals(self, user_id: str, days: int = 7, until: Optional[float] = None) -> List[Dict]:
+        """Totals for the last `days` calendar days that have meals, oldest first"""
+        until = time.time() if until is None else until
+        last_day, _ = period_keys(until)
+        first_day = (datetime.fromtimestamp(until) - timedelta(days=days - 1)).date().isoformat()
+        rows = self._conn().execute(
+            "SELECT * FROM daily_totals WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (user_id, first_day, last_day),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def totals(self, user_id: str, timestamp: Optional[float] = None) -> Dict[str, Optional[Dict]]:
+        """Running totals of the day and the ISO week containing `timestamp` (default: now)"""
+        day, week = period_keys(time.time() if timestamp is None else timestamp)
+        conn = self._conn()
+        today = conn.execute(
+            "SELECT * FROM daily_totals WHERE user_id = ? AND day = ?", (user_id, day)
+        ).fetchone()
+        this_week = conn.execute(
+            "SELECT * FROM weekly_totals WHERE user_id = ? AND week = ?", (user_id, week)
+        ).fetchone()
+        return {"day": dict(today) if today else None, "week": dict(this_week) if this_week else None}
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_default_store: Optional[HistoryStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Return the process-wide HistoryStore"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = HistoryStore()
+    return _default_store
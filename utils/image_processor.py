@@ -1,26 +1,212 @@
 """Image processing utilities"""
 import base64
+import time
 from io import BytesIO
+from typing import Dict, Optional
 from PIL import Image
+from config import Config
+from .metrics import get_metrics
 
-def encode_image_to_base64(image: Image.Image) -> str:
+def encode_image_to_base64(image: Image.Image, mode: Optional[str] = None) -> str:
     """
     Convert PIL Image to base64 string for API transmission
-    
+
     Args:
         image: PIL Image object
-        
+        mode: "adaptive" (downsample + byte budget) or "lossless" (full size, quality 95).
+              Defaults to Config.IMAGE_ENCODE_MODE
+
     Returns:
         Base64 encoded string
     """
-    buffered = BytesIO()
-    
+    return encode_image(image, mode=mode)["base64"]
+
+def encode_image(
+    image: Image.Image,
+    mode: Optional[str] = None,
+    max_edge: Optional[int] = None,
+    target_bytes: Optional[int] = None,
+    image_format: Optional[str] = None,
+) -> Dict:
+    """
+    Encode an image for the vision model and report what was chosen
+
+    Args:
+        image: PIL Image object
+        mode: "adaptive" or "lossless" (defaults to Config.IMAGE_ENCODE_MODE)
+        max_edge: Longest edge after downsampling (defaults to Config.IMAGE_MAX_EDGE)
+        target_bytes: Encoded size budget (defaults to Config.IMAGE_TARGET_BYTES)
+        image_format: "JPEG" or "WEBP" (defaults to Config.IMAGE_FORMAT)
+
+    Returns:
+        Dict with base64, format, quality, width, height, bytes and encode_ms
+    """
+    start = time.perf_counter()
+    mode = mode or Config.IMAGE_ENCODE_MODE
+
     # Convert to RGB if needed
     if image.mode in ('RGBA', 'LA', 'P'):
         image = image.convert('RGB')
-    
-    # Save as JPEG with high quality
-    image.save(buffered, format="JPEG", quality=95)
-    
-    # Encode to base64
-    return base64.b64encode(buffered.getvalue()).decode()
+
+    if mode == "lossless":
+        # Original behaviour: full resolution JPEG with high quality
+        blob = _save(image, "JPEG", 95)
+        fmt, quality = "JPEG", 95
+    else:
+        max_edge = max_edge or Config.IMAGE_MAX_EDGE
+        target_bytes = target_bytes or Config.IMAGE_TARGET_BYTES
+        fmt = (image_format or Config.IMAGE_FORMAT).upper()
+
+        image = _downsample(image, max_edge)
+        blob, quality = _fit_to_budget(image, fmt, target_bytes)
+
+    return {
+        "base64": base64.b64encode(blob).decode(),
+        "format": fmt,
+        "quality": quality,
+        "width": image.width,
+        "height": image.height,
+        "bytes": len(blob),
+        "encode_ms": (time.perf_counter() - start) * 1000,
+    }
+
+def encode_upload(raw_bytes: bytes, mode: Optional[str] = None) -> Dict:
+    """
+    Encode uploaded file bytes, avoiding a full-resolution decode whenever possible
+
+    - Passthrough: a JPEG that already fits the edge and byte limits is sent as-is
+    - Draft decode: an oversized JPEG is decoded directly at 1/2, 1/4 or 1/8 scale
+    - Anything else goes through the regular encode_image path
+
+    Args:
+        raw_bytes: Original uploaded file contents
+        mode: "adaptive" or "lossless" (defaults to Config.IMAGE_ENCODE_MODE)
+
+    The pixel decode and the encoding are recorded as the "decode" and "encode"
+    stages (a passthrough records neither: nothing is decoded).
+
+    Returns:
+        Same dict as encode_image, plus "path" naming the strategy used
+    """
+    start = time.perf_counter()
+    mode = mode or Config.IMAGE_ENCODE_MODE
+
+    # Image.open only parses the header here, pixels are decoded on first access
+    image = Image.open(BytesIO(raw_bytes))
+
+    if mode == "lossless":
+        result = _decode_and_encode(image, mode=mode)
+        result["encode_ms"] = (time.perf_counter() - start) * 1000
+        result["path"] = "full"
+        return result
+
+    max_edge = Config.IMAGE_MAX_EDGE
+    if (
+        image.format == "JPEG"
+        and image.mode in ("RGB", "L")
+        and max(image.size) <= max_edge
+        and len(raw_bytes) <= Config.IMAGE_TARGET_BYTES
+    ):
+        return {
+            "base64": base64.b64encode(raw_bytes).decode(),
+            "format": "JPEG",
+            "quality": None,
+            "width": image.width,
+            "height": image.height,
+            "bytes": len(raw_bytes),
+            "encode_ms": (time.perf_counter() - start) * 1000,
+            "path": "passthrough",
+        }
+
+    path = "full"
+    if image.format == "JPEG" and max(image.size) > max_edge:
+        # Let libjpeg's DCT scaling pick the smallest scale still >= the target size
+        scale = max_edge / max(image.size)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+        path = "draft"
+
+    result = _decode_and_encode(image, mode=mode, max_edge=max_edge)
+    result["encode_ms"] = (time.perf_counter() - start) * 1000
+    result["path"] = path
+    return result
+
+def _decode_and_encode(image: Image.Image, **options) -> Dict:
+    """encode_image, with the pixel decode and the encoding timed as separate stages"""
+    metrics = get_metrics()
+    with metrics.span("decode"):
+        image.load()
+    with metrics.span("encode"):
+        return encode_image(image, **options)
+
+def open_thumbnail(raw_bytes: bytes, max_edge: int = 256) -> Image.Image:
+    """
+    Decode a small preview of the upload (JPEGs are decoded at reduced scale)
+
+    Args:
+        raw_bytes: Original uploaded file contents
+        max_edge: Longest edge of the returned image
+
+    Returns:
+        Loaded PIL Image no larger than max_edge on either side
+    """
+    image = Image.open(BytesIO(raw_bytes))
+    if image.format == "JPEG":
+        image.draft("RGB", (max_edge, max_edge))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image
+
+def encode_preview(thumbnail: Image.Image, quality: int = 80) -> bytes:
+    """
+    JPEG bytes for the sidebar preview, built once per upload from the thumbnail
+
+    Args:
+        thumbnail: Image returned by open_thumbnail
+
+    Returns:
+        JPEG-encoded bytes (a few tens of KB instead of the full upload)
+    """
+    if thumbnail.mode != "RGB":
+        thumbnail = thumbnail.convert("RGB")
+    return _save(thumbnail, "JPEG", quality)
+
+def _downsample(image: Image.Image, max_edge: int) -> Image.Image:
+    """Shrink so the longest edge is at most max_edge (never upscales)"""
+    longest = max(image.size)
+    if longest <= max_edge:
+        return image
+    scale = max_edge / longest
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    # reducing_gap does a cheap integer reduce() first, then LANCZOS on the small image
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+def _fit_to_budget(image: Image.Image, fmt: str, target_bytes: int):
+    """Binary search the highest quality whose encoding fits the byte budget"""
+    low, high = Config.IMAGE_MIN_QUALITY, Config.IMAGE_MAX_QUALITY
+
+    best = _save(image, fmt, high)
+    if len(best) <= target_bytes:
+        return best, high
+    best_quality = low
+    best = _save(image, fmt, low)
+
+    low += 1
+    high -= 1
+    while low <= high:
+        quality = (low + high) // 2
+        blob = _save(image, fmt, quality)
+        if len(blob) <= target_bytes:
+            best, best_quality = blob, quality
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    # If even the minimum quality overshoots we still send it rather than fail
+    return best, best_quality
+
+def _save(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffered = BytesIO()
+    if fmt == "WEBP":
+        image.save(buffered, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    return buffered.getvalue()
@@ -0,0 +1,248 @@
+"""Local intent router: answers factual follow-up questions from the analysis data"""
+import re
+from typing import Dict, List, Optional, Tuple
+from .metrics import get_metrics
+
+MACRO_TERMS = {
+    "calories": ("calorie", "calories", "kcal", "cal", "cals", "energy"),
+    "protein": ("protein", "proteins"),
+    "carbs": ("carb", "carbs", "carbohydrate", "carbohydrates"),
+    "fat": ("fat", "fats"),
+    "fiber": ("fiber", "fibre"),
+    "sugar": ("sugar", "sugars"),
+}
+ALL_MACROS_TERMS = ("macro", "macros", "macronutrients", "nutrition", "nutrients")
+
+DIETARY_TERMS = {
+    "vegan": ("vegan",),
+    "vegetarian": ("vegetarian", "veggie"),
+    "keto_friendly": ("keto", "ketogenic"),
+    "gluten_free": ("gluten", "celiac", "coeliac"),
+    "dairy_free": ("dairy", "lactose"),
+}
+# Ingredient named by a dietary term: "does it contain gluten?" asks the opposite of "is it gluten-free?"
+FREE_FROM_INGREDIENTS = {
+    "gluten_free": {"gluten": "gluten"},
+    "dairy_free": {"dairy": "dairy", "lactose": "lactose"},
+}
+DIETARY_LABELS = {
+    "vegan": "vegan",
+    "vegetarian": "vegetarian",
+    "keto_friendly": "keto-friendly",
+    "gluten_free": "gluten-free",
+    "dairy_free": "dairy-free",
+    "high_protein": "high in protein",
+}
+
+ALLERGEN_TERMS = ("allergen", "allergens", "allergy", "allergies", "allergic")
+ALLERGEN_ITEMS = {
+    "nuts": ("nut", "nuts", "peanut", "peanuts", "almond", "almonds", "cashew", "cashews",
+             "walnut", "walnuts", "pecan", "pecans", "hazelnut", "hazelnuts", "pistachio", "pistachios"),
+    "eggs": ("egg", "eggs"),
+    "soy": ("soy", "soya"),
+    "shellfish": ("shellfish", "shrimp", "prawn", "prawns", "crab", "lobster"),
+    "fish": ("fish",),
+    "sesame": ("sesame",),
+    "wheat": ("wheat",),
+    "milk": ("milk",),
+}
+# Other names the model uses in the allergen list for the same thing (whole words or phrases)
+ALLERGEN_ALIASES = {
+    "milk": ("dairy", "lactose", "cheese", "cream", "whey", "casein", "yogurt", "yoghurt"),
+    "wheat": ("gluten", "spelt"),
+    "nuts": ("tree nut", "tree nuts", "macadamia", "macadamias", "brazil nut", "brazil nuts"),
+    "soy": ("soybean", "soybeans", "soya bean", "soya beans", "tofu", "edamame", "miso"),
+    "sesame": ("tahini",),
+    "shellfish": ("shrimps", "crabs", "lobsters", "crustacean", "crustaceans", "mollusc", "molluscs",
+                  "mollusk", "mollusks", "clam", "clams", "mussel", "mussels", "oyster", "oysters",
+                  "scallop", "scallops", "squid", "octopus"),
+    "fish": ("anchovy", "anchovies", "salmon", "tuna", "cod", "sardine", "sardines", "mackerel",
+             "trout", "tilapia", "haddock", "pollock"),
+}
+SCORE_TERMS = ("score", "rating")
+
+# Words that carry no intent of their own. Any other word sends the question to the model,
+# which keeps "how can I make it vegan?" or "is it good for weight loss?" off the local path.
+FILLER = {
+    "a", "an", "the", "is", "it", "its", "s", "this", "that", "dish", "food", "meal", "plate",
+    "does", "do", "has", "have", "had", "contain", "contains", "containing", "include", "includes",
+    "any", "there", "what", "whats", "how", "much", "many", "are", "in", "of", "per",
+    "amount", "content", "level", "total", "value", "values", "free", "friendly", "suitable", "for",
+    "ok", "okay", "safe", "me", "i", "im", "am", "my", "someone", "with", "and", "or", "also",
+    "tell", "please", "can", "you", "give", "show", "know", "need", "to", "about", "health",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _lookup_table():
+    table = {}
+    for field, terms in MACRO_TERMS.items():
+        table.update({term: ("macro", field) for term in terms})
+    table.update({term: ("macro", "*") for term in ALL_MACROS_TERMS})
+    for field, terms in DIETARY_TERMS.items():
+        table.update({term: ("dietary", field) for term in terms})
+    table.update({term: ("allergens", "*") for term in ALLERGEN_TERMS})
+    for item, terms in ALLERGEN_ITEMS.items():
+        table.update({term: ("allergens", item) for term in terms})
+    table.update({term: ("health_score", "*") for term in SCORE_TERMS})
+    return table
+
+_TERMS = _lookup_table()
+
+# Item -> word sequences naming it in an allergen list
+_ALLERGEN_PHRASES = {
+    item: tuple(tuple(term.split()) for term in terms + ALLERGEN_ALIASES.get(item, ()))
+    for item, terms in ALLERGEN_ITEMS.items()
+}
+
+def _names_allergen(allergen: str, item: str) -> bool:
+    """Whether a listed allergen names the item as a whole word ("Shellfish" is not fish, "Eggplant" not egg)"""
+    words = _WORD.findall(str(allergen).lower())
+    for phrase in _ALLERGEN_PHRASES[item]:
+        size = len(phrase)
+        if any(tuple(words[i:i + size]) == phrase for i in range(len(words) - size + 1)):
+            return True
+    return False
+
+
+def classify_intent(question: str) -> Optional[List[Tuple[str, str]]]:
+    """
+    Map a question onto locally answerable (intent, target) pairs
+
+    Returns:
+        e.g. [("macro", "protein"), ("dietary", "vegan")], or None when the
+        question needs the model (open-ended, or mentions anything unknown)
+    """
+    words = _WORD.findall(question.lower())
+    # Answers are per 100g: any amount ("in 300g", "two servings") needs the model to scale them
+    if any(any(ch.isdigit() for ch in word) for word in words):
+        return None
+    free_from = "free" in words
+    intents: List[Tuple[str, str]] = []
+    for i, word in enumerate(words):
+        if word == "high" and "protein" in words[i + 1:i + 3]:
+            intents.append(("dietary", "high_protein"))
+            continue
+        if word == "protein" and "high" in words[max(0, i - 2):i]:
+            continue
+        match = _TERMS.get(word)
+        if match is not None and match[0] == "dietary" and not free_from:
+            ingredient = FREE_FROM_INGREDIENTS.get(match[1], {}).get(word)
+            if ingredient is not None:
+                match = ("contains", f"{match[1]}:{ingredient}")
+        if match is not None:
+            if match not in intents:
+                intents.append(match)
+        elif word not in FILLER:
+            return None
+    return intents or None
+
+def answer_locally(question: str, data: Dict) -> Optional[str]:
+    """
+    Answer a follow-up question from the nutrition data, without calling the model
+
+    Every decision is counted (chat_routed_local / chat_routed_model and
+    chat_intent_<name>), so get_routing_stats() reports how many calls were saved.
+
+    Args:
+        question: The user's chat message
+        data: Nutrition data of the analyzed dish
+
+    Returns:
+        Markdown answer, or None if the question should go to the model
+    """
+    metrics = get_metrics()
+    intents = classify_intent(question)
+    answer = _render(intents, data) if intents else None
+    if answer is None:
+        metrics.increment("chat_routed_model")
+        return None
+    metrics.increment("chat_routed_local")
+    for intent, _ in intents:
+        metrics.increment(f"chat_intent_{intent}")
+    return answer
+
+def get_routing_stats() -> Dict:
+    """Chat questions answered locally vs by the model"""
+    counters = get_metrics().to_json()["counters"]
+    local = counters.get("chat_routed_local", 0)
+    model = counters.get("chat_routed_model", 0)
+    total = local + model
+    return {
+        "local": local,
+        "model": model,
+        "local_rate": local / total if total else 0.0,
+        "intents": {k[len("chat_intent_"):]: v for k, v in counters.items() if k.startswith("chat_intent_")},
+    }
+
+
+def _render(intents: List[Tuple[str, str]], data: Dict) -> Optional[str]:
+    # "protein and fat" becomes one sentence listing both
+    macros = [target for intent, target in intents if intent == "macro"]
+    fields = list(MACRO_TERMS) if "*" in macros else macros
+    parts = []
+    for intent, target in intents:
+        if intent == "macro":
+            if target != macros[0]:
+                continue
+            part = _render_macros(fields, data)
+        else:
+            part = _RENDERERS[intent](target, data)
+        if part is None:
+            return None     # Field missing from this analysis: let the model handle it
+        parts.append(part)
+    return " ".join(parts)
+
+def _render_macros(fields: List[str], data: Dict) -> Optional[str]:
+    if any(not isinstance(data.get(f), (int, float)) for f in fields):
+        return None
+    values = [f"**{data[f]:g} kcal**" if f == "calories" else f"**{data[f]:g} g** {f}" for f in fields]
+    listed = values[0] if len(values) == 1 else ", ".join(values[:-1]) + " and " + values[-1]
+    return f"Per 100g it has {listed}."
+
+def _render_dietary(field: str, data: Dict) -> Optional[str]:
+    flag = (data.get("dietary") or {}).get(field)
+    if not isinstance(flag, bool):
+        return None
+    label = DIETARY_LABELS[field]
+    return f"Yes, it's {label}." if flag else f"No, it isn't {label}."
+
+def _render_contains(target: str, data: Dict) -> Optional[str]:
+    field, ingredient = target.split(":")
+    flag = (data.get("dietary") or {}).get(field)
+    if not isinstance(flag, bool):
+        return None
+    if not flag:
+        return f"Yes, it likely contains **{ingredient}** (it isn't {DIETARY_LABELS[field]})."
+    return (f"No, it's marked {DIETARY_LABELS[field]}. "
+            f"If the intolerance is severe, confirm the ingredients with whoever prepared it.")
+
+def _render_allergens(item: str, data: Dict) -> Optional[str]:
+    allergens = data.get("allergens")
+    if not isinstance(allergens, list):
+        return None
+    listed = ", ".join(allergens) if allergens else "none"
+    if item == "*":
+        if not allergens:
+            return "No common allergens were detected."
+        return f"Potential allergens: **{listed}**."
+    if any(_names_allergen(allergen, item) for allergen in allergens):
+        return f"Yes, it may contain **{item}** (listed allergens: {listed})."
+    return (f"**{item.capitalize()}** isn't among its detected allergens ({listed}). "
+            f"If the allergy is severe, confirm the ingredients with whoever prepared it.")
+
+def _render_health_score(_: str, data: Dict) -> Optional[str]:
+    score = data.get("health_score")
+    if not isinstance(score, int):
+        return None
+    # Same bands as the health bar
+    label = "Excellent" if score >= 80 else "Good" if score >= 60 else "Fair" if score >= 40 else "Poor"
+    return f"Its health score is **{score}/100** ({label})."
+
+_RENDERERS = {
+    "dietary": _render_dietary,
+    "contains": _render_contains,
+    "allergens": _render_allergens,
+    "health_score": _render_health_score,
+}
@@ -0,0 +1,223 @@
+"""Latency measurement, per-stage histograms and metrics export"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class StreamTimer:
+    """
+    Records time-to-first-token and inter-token gaps of a streamed response.
+
+    Usage:
+        timer = StreamTimer()
+        for chunk in call_qubrid_api_stream(messages):
+            timer.tick()
+        stats = timer.summary()
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.chunks = 0
+        self.gaps: List[float] = []
+
+    def tick(self) -> float:
+        """Mark the arrival of a chunk; returns the current timestamp"""
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+        self.chunks += 1
+        return now
+
+    def exclude(self, seconds: float):
+        """Leave a pause before the first chunk (e.g. queueing for quota) out of TTFT and duration"""
+        if self.first is None:
+            self.start += seconds
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first is None else self.first - self.start
+
+    def summary(self) -> Dict:
+        """TTFT, mean/p95 inter-token latency and total duration, in seconds"""
+        end = self.last if self.last is not None else time.perf_counter()
+        gaps = sorted(self.gaps)
+        return {
+            "ttft": self.ttft,
+            "itl_mean": sum(gaps) / len(gaps) if gaps else None,
+            "itl_p95": gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))] if gaps else None,
+            "chunks": self.chunks,
+            "duration": end - self.start,
+        }
+
+
+# Seconds; covers sub-millisecond parsing up to minute-long model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets + (float("inf"),), self.counts):
+            if seen + count >= rank and count:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+
+class MetricsRegistry:
+    """
+    Process-wide latency histograms per pipeline stage plus token counters.
+
+    Usage:
+        with get_metrics().span("thumbnail"):
+            open_thumbnail(raw_bytes)
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block into the ``stage`` histogram (failures included)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_usage(self, usage: Optional[Dict]):
+        """Count real token usage reported by the API"""
+        if not usage:
+            return
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if isinstance(usage.get(key), (int, float)):
+                self.increment(f"tokens_{key}", usage[key])
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.50),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for stage, h in self._histograms.items()
+            }
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP nutrivision_stage_seconds Latency of each analysis/chat pipeline stage",
+            "# TYPE nutrivision_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for upper, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'nutrivision_stage_seconds_bucket{{stage="{stage}",le="{upper}"}} {cumulative}')
+                lines.append(f'nutrivision_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'nutrivision_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'nutrivision_stage_seconds_count{{stage="{stage}"}} {h.count}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE nutrivision_{name}_total counter")
+                lines.append(f"nutrivision_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry"""
+    return _registry
+
+
+def _metrics_handler():
+    # http.server (and the email package behind it) is only imported when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(_registry.to_json()).encode("utf-8")
+                content_type = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = _registry.to_prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the console
+
+    return _MetricsHandler
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread
+
+    Args:
+        port: TCP port to listen on
+        host: Interface to bind (loopback by default; the endpoint has no authentication)
+
+    Returns:
+        The running http.server.ThreadingHTTPServer
+    """
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _metrics_handler())
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
@@ -1,42 +1,286 @@
 """Parse AI responses using Pydantic Schemas"""
 import json
 import re
+from typing import Annotated, Any, Dict, List, Tuple
+from pydantic import TypeAdapter, ValidationError
 from .schemas import NutritionData
+from .stream_parser import IncrementalJSONParser
+from .metrics import get_metrics
+
+# Built once: validating straight from bytes skips the json.loads -> dict -> model hop
+NUTRITION_ADAPTER = TypeAdapter(NutritionData)
+
+def _field_adapter(field) -> TypeAdapter:
+    # Constraints such as health_score's ge/le live in field.metadata
+    if field.metadata:
+        return TypeAdapter(Annotated[(field.annotation, *field.metadata)])
+    return TypeAdapter(field.annotation)
+
+FIELD_ADAPTERS = {name: _field_adapter(field) for name, field in NutritionData.model_fields.items()}
+
+# Placeholder values for fields that could not be recovered
+FIELD_DEFAULTS = {
+    'dish_name': 'Error Parsing Food',
+    'calories': 0,
+    'protein': 0,
+    'carbs': 0,
+    'fat': 0,
+    'fiber': 0,
+    'sugar': 0,
+    'health_score': 0,
+    'dietary': {},
+    'health_insights': [],
+    'allergens': [],
+}
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
 
 def parse_nutrition_data(response_text: str) -> dict:
     """
     Parses AI response into strict Pydantic model and returns dictionary.
-    Handles cleanup of markdown formatting if present.
+    Handles cleanup of markdown formatting if present, and repairs common
+    JSON defects (prose around the object, single quotes, trailing commas,
+    Python literals, truncation). Fields that still cannot be recovered are
+    listed under 'missing_fields' so only those need to be requested again.
     """
+    metrics = get_metrics()
+    metrics.increment("parse_total")
+
+    # 1. Clean the response (remove ```json ... ``` wrappers if AI adds them)
+    clean_text = _strip_fences(response_text or "")
+
+    # 2. Fast path: validate straight from bytes (This fixes types, e.g., "200" string -> 200 int)
     try:
-        # 1. Clean the response (remove ```json ... ``` wrappers if AI adds them)
-        clean_text = response_text.strip()
-        if "```" in clean_text:
-            # Extract content inside code blocks
-            match = re.search(r"```(?:json)?(.*?)```", clean_text, re.DOTALL)
-            if match:
-                clean_text = match.group(1).strip()
-        
-        # 2. Parse JSON
-        # Handle common JSON errors (like trailing commas) loosely if needed
-        data_dict = json.loads(clean_text)
-        
-        # 3. Validate with Pydantic (This fixes types, e.g., "200" string -> 200 int)
-        validated_data = NutritionData(**data_dict)
-        
-        # 4. Return compatible dictionary for your UI
+        validated_data = NUTRITION_ADAPTER.validate_json(clean_text.encode("utf-8"))
+        metrics.increment("parse_clean")
+        # 3. Return compatible dictionary for your UI
         return validated_data.to_app_dict()
+    except ValidationError as e:
+        first_error = e
+
+    # 4. Repair and recover whatever fields are valid
+    repaired = repair_json(clean_text)
+    try:
+        candidate = json.loads(repaired)
+        if not isinstance(candidate, dict):
+            candidate = {}
+    except json.JSONDecodeError:
+        # Still broken (e.g. cut mid-number): keep every member that did complete
+        parser = IncrementalJSONParser()
+        parser.feed(repaired)
+        candidate = parser.fields
+
+    valid, missing = recover_fields(candidate)
+
+    if not missing:
+        metrics.increment("parse_repaired")
+        return NutritionData(**valid).to_app_dict()
+
+    if valid:
+        metrics.increment("parse_partial")
+    else:
+        metrics.increment("parse_failed")
+    print(f"Parsing Error: {first_error}")
+
+    # Fallback: Return a "safe" structure so the app doesn't crash
+    data = dict(FIELD_DEFAULTS)
+    data.update(valid)
+    data['missing_fields'] = missing
+    data['error'] = f"Could not recover fields: {', '.join(missing)}"
+    return data
+
+def recover_fields(candidate: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Validate each NutritionData field independently
+
+    Returns:
+        (valid field values in app-dict form, names of missing/invalid fields)
+    """
+    valid = {}
+    missing = []
+    for name, adapter in FIELD_ADAPTERS.items():
+        if name not in candidate:
+            missing.append(name)
+            continue
+        try:
+            value = adapter.validate_python(candidate[name])
+            valid[name] = adapter.dump_python(value)
+        except ValidationError:
+            missing.append(name)
+    return valid, missing
+
+def merge_missing_fields(data: dict, response_text: str) -> dict:
+    """
+    Fill the missing fields of a partial parse from a follow-up response
+
+    Args:
+        data: Partial result from parse_nutrition_data (has 'missing_fields')
+        response_text: Model output containing just the requested fields
+
+    Returns:
+        Complete validated dictionary, or an updated partial result
+    """
+    merged = fill_missing_fields(data, parse_nutrition_fragment(response_text))
+    if 'missing_fields' not in merged:
+        get_metrics().increment("parse_completed_by_followup")
+    return merged
+
+def fill_missing_fields(data: dict, values: Dict[str, Any]) -> dict:
+    """
+    Fill the missing fields of a partial parse from already-decoded values
+
+    Args:
+        data: Partial result from parse_nutrition_data (has 'missing_fields')
+        values: Candidate values by field name; only missing fields are taken
+
+    Returns:
+        Complete validated dictionary, or an updated partial result
+    """
+    recovered, _ = recover_fields(values)
+    merged = {k: v for k, v in data.items() if k not in ('missing_fields', 'error')}
+    merged.update({k: v for k, v in recovered.items() if k in data.get('missing_fields', [])})
+
+    valid, missing = recover_fields(merged)
+    if not missing:
+        complete = NutritionData(**valid).to_app_dict()
+        # Keep annotations that are not schema fields (e.g. reference_filled)
+        complete.update({k: v for k, v in merged.items() if k not in complete})
+        return complete
+    merged['missing_fields'] = missing
+    merged['error'] = f"Could not recover fields: {', '.join(missing)}"
+    return merged
+
+def parse_nutrition_fragment(response_text: str) -> dict:
+    """Best-effort dict from a (possibly malformed) JSON object, without validation"""
+    repaired = repair_json(_strip_fences(response_text or ""))
+    try:
+        candidate = json.loads(repaired)
+        return candidate if isinstance(candidate, dict) else {}
+    except json.JSONDecodeError:
+        parser = IncrementalJSONParser()
+        parser.feed(repaired)
+        return parser.fields
+
+def repair_json(text: str) -> str:
+    """
+    Rewrite almost-JSON into JSON in a single pass
+
+    Handles prose around the object, single-quoted strings, Python
+    True/False/None, unquoted keys, trailing commas, and truncation. A
+    truncated output keeps only top-level members that were provably complete
+    (followed by a separator, or a closed object/array); the cut-off one is
+    dropped rather than trusted, since "calories": 2 may really have been 266.
+    """
+    start = text.find("{")
+    if start == -1:
+        return "{}"
+    text = text[start:]
+
+    out: List[str] = []
+    stack: List[str] = []
+    # Output length up to which top-level members are known to be complete
+    safe = 0
+    quote = None        # Active string delimiter
+    escape = False
+    i = 0
+    n = len(text)
+
+    while i < n:
+        ch = text[i]
+        if quote:
+            if escape:
+                escape = False
+                # \' is not a JSON escape
+                if ch == "'" and out and out[-1] == "\\":
+                    out[-1] = "'"
+                    i += 1
+                    continue
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')     # Double quote inside a single-quoted string
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            if len(stack) == 1:
+                safe = len(out)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break                # End of the object: ignore trailing prose
+            if len(stack) == 1:
+                safe = len(out)      # A nested value just closed
+        elif ch == ",":
+            if len(stack) == 1:
+                safe = len(out)
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k].isspace():
+                k += 1
+            if k < n and text[k] == ":" and stack and stack[-1] == "}":
+                out.append(f'"{word}"')     # Unquoted key
+            else:
+                out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if not stack:
+        return "".join(out)
+
+    # Truncated output: drop the unfinished top-level member, then close the object
+    del out[safe:]
+    _drop_trailing_comma(out)
+    return "".join(out) + "}"
+
+def get_parse_stats() -> dict:
+    """Parse outcome counts with failure and repair rates"""
+    counters = get_metrics().to_json()["counters"]
+    total = counters.get("parse_total", 0)
+    stats = {
+        key: counters.get(f"parse_{key}", 0)
+        for key in ("total", "clean", "repaired", "partial", "failed", "completed_by_followup")
+    }
+    stats["failure_rate"] = stats["failed"] / total if total else 0.0
+    stats["repair_rate"] = (stats["repaired"] + stats["partial"]) / total if total else 0.0
+    return stats
+
+def _strip_fences(response_text: str) -> str:
+    clean_text = response_text.strip()
+    if "```" in clean_text:
+        # Extract content inside code blocks
+        match = re.search(r"```(?:json)?(.*?)(?:```|$)", clean_text, re.DOTALL)
+        if match:
+            clean_text = match.group(1).strip()
+    return clean_text
 
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Parsing Error: {e}")
-        # Fallback: Return a "safe" empty structure so the app doesn't crash
-        return {
-            'dish_name': 'Error Parsing Food',
-            'calories': 0,
-            'protein': 0,
-            'carbs': 0,
-            'fat': 0,
-            'health_score': 0,
-            'dietary': {},
-            'error': str(e)
-        }
+def _drop_trailing_comma(out: List[str]):
+    k = len(out) - 1
+    while k >= 0 and out[k].isspace():
+        k -= 1
+    if k >= 0 and out[k] == ",":
+        del out[k]
@@ -0,0 +1,234 @@
+"""Perceptual hashing and near-duplicate lookup for food photos"""
+import os
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from config import Config
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute a 64-bit difference hash of an image
+
+    Args:
+        image: PIL Image object (any mode)
+        hash_size: Side of the comparison grid (8 -> 64 bits)
+
+    Returns:
+        Hash as an unsigned integer
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+if hasattr(int, "bit_count"):
+    def hamming(a: int, b: int) -> int:
+        """Number of differing bits between two hashes"""
+        return (a ^ b).bit_count()
+else:  # Python < 3.10
+    def hamming(a: int, b: int) -> int:
+        """Number of differing bits between two hashes"""
+        return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    """
+    Multi-index hash table for Hamming-radius search.
+
+    Each 64-bit hash is split into ``segments`` disjoint chunks, and each chunk
+    is indexed in its own table. By the pigeonhole principle, two hashes within
+    distance r agree to within r // segments bits on at least one chunk, so a
+    query only probes the few buckets around its own chunks instead of
+    scanning every stored hash.
+
+    Each hash keeps one key per scope (e.g. prompt version and model), and a
+    search only matches entries of its own scope.
+
+    The index holds at most ``max_entries`` keys (the oldest are dropped first),
+    and keys whose cache entry turned out to be gone are removed with discard().
+    The append-only file is rewritten once most of its lines are dead.
+    """
+
+    def __init__(self, segments: int = 4, path: Optional[str] = None, max_entries: Optional[int] = None):
+        if HASH_BITS % segments:
+            raise ValueError("segments must divide 64")
+        self.segments = segments
+        self.chunk_bits = HASH_BITS // segments
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.path = path
+        self.max_entries = Config.PHASH_MAX_ENTRIES if max_entries is None else max_entries
+
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(segments)]
+        self._values: Dict[int, Dict[str, str]] = {}     # hash -> scope -> key
+        self._keys: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()     # key -> (hash, scope), oldest first
+        self._file_lines = 0
+        self._flip_masks: Dict[int, List[int]] = {}
+        self._lock = threading.RLock()
+
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _chunks(self, value: int):
+        for i in range(self.segments):
+            yield (value >> (i * self.chunk_bits)) & self.chunk_mask
+
+    def _masks(self, radius: int) -> List[int]:
+        """All chunk-sized bit masks with at most ``radius`` bits set"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for bits in combinations(range(self.chunk_bits), r):
+                    mask = 0
+                    for bit in bits:
+                        mask |= 1 << bit
+                    masks.append(mask)
+            self._flip_masks[radius] = masks
+        return masks
+
+    def add(self, value: int, key: str, scope: str, persist: bool = True):
+        """Index a hash, pointing it at ``key`` within ``scope`` (replaces any previous key there)"""
+        with self._lock:
+            if key in self._keys:
+                self._remove(key)
+            previous = self._values.get(value, {}).get(scope)
+            if previous is not None:
+                self._remove(previous)
+            keys = self._values.get(value)
+            if keys is None:
+                keys = self._values[value] = {}
+                for table, chunk in zip(self._tables, self._chunks(value)):
+                    table.setdefault(chunk, []).append(value)
+            keys[scope] = key
+            self._keys[key] = (value, scope)
+            while len(self._keys) > self.max_entries:
+                self._remove(next(iter(self._keys)))
+            if persist and self.path:
+                self._append(value, key, scope)
+                self._file_lines += 1
+                self._maybe_compact()
+
+    def discard(self, key: str):
+        """Forget a key, e.g. once its cache entry has been evicted"""
+        with self._lock:
+            if key in self._keys:
+                self._remove(key)
+                self._maybe_compact()
+
+    def search(self, value: int, max_distance: int, scope: str) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest hash within ``max_distance`` bits that has a key in ``scope``
+
+        Returns:
+            (key, distance) of the best match, or None
+        """
+        matches = self.candidates(value, max_distance, scope)
+        return matches[0] if matches else None
+
+    def candidates(self, value: int, max_distance: int, scope: str) -> List[Tuple[str, int]]:
+        """
+        Every hash within ``max_distance`` bits that has a key in ``scope``
+
+        Returns:
+            (key, distance) pairs, closest first, so a caller can fall back to
+            the next one when a key's cache entry is gone
+        """
+        with self._lock:
+            masks = self._masks(max_distance // self.segments)
+            found: Dict[int, int] = {}
+            for table, chunk in zip(self._tables, self._chunks(value)):
+                for mask in masks:
+                    for candidate in table.get(chunk ^ mask, ()):
+                        if candidate in found or scope not in self._values[candidate]:
+                            continue
+                        distance = hamming(value, candidate)
+                        if distance <= max_distance:
+                            found[candidate] = distance
+            ranked = sorted(found.items(), key=lambda item: item[1])
+            return [(self._values[candidate][scope], distance) for candidate, distance in ranked]
+
+    def _remove(self, key: str):
+        value, scope = self._keys.pop(key)
+        keys = self._values[value]
+        del keys[scope]
+        if keys:
+            return
+        del self._values[value]
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.remove(value)
+            if not bucket:
+                del table[chunk]
+
+    # ---- persistence (append-only "hash key scope" lines, compacted when mostly dead) ----
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._file_lines += 1
+                parts = line.split()
+                # Older two-field lines have no scope: the key's prompt and model are unknown, skip them
+                if len(parts) != 3:
+                    continue
+                try:
+                    self.add(int(parts[0], 16), parts[1], parts[2], persist=False)
+                except ValueError:
+                    continue
+        self._maybe_compact()
+
+    def _append(self, value: int, key: str, scope: str):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{value:016x} {key} {scope}\n")
+        except OSError as e:
+            print(f"Hash index write failed: {e}")
+
+    def _maybe_compact(self):
+        if not self.path or self._file_lines <= 2 * len(self._keys) + 1000:
+            return
+        # Lines other processes appended since this one loaded the file are dropped: it is only a cache index
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, (value, scope) in self._keys.items():
+                    f.write(f"{value:016x} {key} {scope}\n")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Hash index compaction failed: {e}")
+            return
+        self._file_lines = len(self._keys)
+
+
+_default_index: Optional[HashIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_hash_index() -> HashIndex:
+    """Return the process-wide near-duplicate index (persisted next to the analysis cache)"""
+    global _default_index
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = HashIndex(
+                    segments=Config.PHASH_SEGMENTS,
+                    path=os.path.join(Config.CACHE_DIR, "phash.idx"),
+                    max_entries=Config.PHASH_MAX_ENTRIES,
+                )
+    return _default_index
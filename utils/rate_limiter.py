@@ -0,0 +1,370 @@
+"""Client-side rate limiting: token buckets in front of the API with a priority queue"""
+import heapq
+import itertools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from config import Config
+from .metrics import get_metrics
+
+# Lower runs first: image analysis ahead of chat, interactive ahead of batch
+PRIORITY_ANALYSIS = 0
+PRIORITY_CHAT = 1
+PRIORITY_BATCH_ANALYSIS = 2
+PRIORITY_BATCH_CHAT = 3
+PRIORITY_NAMES = {0: "analysis", 1: "chat", 2: "batch_analysis", 3: "batch_chat"}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds from a rate-limit reset header: "1.5", "20ms", "6m0s", "1h2m3s" """
+    value = (value or "").strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+def estimate_tokens(messages: List[Dict], options: Optional[Dict] = None) -> int:
+    """Rough quota cost of a request: ~4 chars per prompt token, a flat cost per image, expected output"""
+    output = (options or {}).get("max_tokens") or Config.RATE_LIMIT_OUTPUT_ESTIMATE
+    return estimate_prompt_tokens(messages) + min(output, Config.RATE_LIMIT_OUTPUT_ESTIMATE)
+
+def estimate_prompt_tokens(messages: List[Dict]) -> int:
+    """The prompt part of estimate_tokens"""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    images = sum(1 for m in messages if m.get("image"))
+    return chars // 4 + images * Config.RATE_LIMIT_IMAGE_TOKENS
+
+def estimate_stream_usage(messages: List[Dict], output_chars: int) -> int:
+    """Tokens a streamed call used, from the prompt and the text received (streams report no usage)"""
+    return estimate_prompt_tokens(messages) + output_chars // 4
+
+
+class TokenBucket:
+    """Continuously refilling bucket; a rate of 0 means unlimited"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (requests above capacity wait for a full bucket)"""
+        if self.rate <= 0:
+            return 0.0
+        deficit = min(amount, self.capacity) - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float):
+        if self.rate > 0:
+            self.level -= amount     # May go negative: the debt delays later requests
+
+    def reset(self, rate: float, capacity: float):
+        """Change limits, keeping the current level within the new capacity (a formerly unlimited bucket starts full)"""
+        self.level = capacity if self.rate <= 0 else min(self.level, capacity)
+        self.rate = rate
+        self.capacity = capacity
+
+
+class RateLimiter:
+    """
+    Requests-per-second and tokens-per-minute buckets shared by every API call.
+
+    Callers queue by priority (then arrival). Only the head of the queue may
+    take from the buckets, so an analysis never waits behind chat, and
+    interactive calls never wait behind batch work. A caller that has to wait
+    is told the estimated wait first (on_wait), so the UI can show it instead
+    of surfacing a 429.
+
+    Limits start from Config and are re-learned from x-ratelimit-* response
+    headers; a 429 pauses every caller until its Retry-After has passed.
+
+    Usage:
+        limiter = get_rate_limiter()
+        reservation = limiter.acquire(tokens=1200, priority=PRIORITY_CHAT)
+        ...
+        limiter.settle(reservation, actual_tokens)    # or release(reservation) if never sent
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        rps = Config.RATE_LIMIT_RPS if requests_per_second is None else requests_per_second
+        tpm = Config.RATE_LIMIT_TPM if tokens_per_minute is None else tokens_per_minute
+        self._requests = TokenBucket(rps, max(1.0, rps * Config.RATE_LIMIT_BURST_SECONDS))
+        self._tokens = TokenBucket(tpm / 60.0, tpm)
+        self._paused_until = 0.0
+        self._queue: list = []     # heap of [priority, seq, tokens, cancelled]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.metrics = get_metrics()
+
+    # ---- admission ----
+
+    def acquire(
+        self,
+        tokens: int,
+        priority: int = PRIORITY_CHAT,
+        on_wait: Optional[Callable[[float], None]] = None,
+    ) -> int:
+        """
+        Block until the request may be sent
+
+        Args:
+            tokens: Estimated quota cost (see estimate_tokens)
+            priority: One of the PRIORITY_* constants
+            on_wait: Called with the estimated wait in seconds whenever it changes noticeably
+
+        Returns:
+            The reserved token count, to pass to settle()
+
+        Raises:
+            RateLimitExceeded: If the estimated wait is above Config.RATE_LIMIT_MAX_WAIT
+        """
+        start = time.monotonic()
+        waiter = [priority, next(self._seq), tokens, False]
+        with self._cond:
+            self._refresh(start)
+            estimate = self._estimate(waiter)
+            if estimate > Config.RATE_LIMIT_MAX_WAIT:
+                self.metrics.increment("rate_limit_rejected")
+                raise RateLimitExceeded(estimate)
+            heapq.heappush(self._queue, waiter)
+
+        reported = None
+        try:
+            while True:
+                if on_wait is not None and estimate > 0 and (reported is None or abs(estimate - reported) >= 1):
+                    on_wait(estimate)    # Outside the lock: UI callbacks may be slow
+                    reported = estimate
+                with self._cond:
+                    now = time.monotonic()
+                    self._refresh(now)
+                    if self._queue[0] is waiter:
+                        wait = max(self._paused_until - now,
+                                   self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                        if wait <= 0:
+                            heapq.heappop(self._queue)
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            self._cond.notify_all()
+                            break
+                    else:
+                        wait = Config.RATE_LIMIT_MAX_WAIT     # Woken when the head is served
+                    self._cond.wait(min(wait, 1.0))
+                    estimate = self._estimate(waiter)
+        except BaseException:
+            with self._cond:
+                waiter[3] = True     # Dropped lazily when it reaches the head
+                self._refresh(time.monotonic())
+                self._cond.notify_all()
+            raise
+
+        waited = time.monotonic() - start
+        self.metrics.observe("rate_limit_wait", waited)
+        self.metrics.increment(f"rate_limit_admitted_{PRIORITY_NAMES.get(priority, priority)}")
+        return tokens
+
+    def try_acquire(self, tokens: int, priority: int = PRIORITY_CHAT) -> Optional[int]:
+        """
+        Take from the buckets only if that needs no wait and no one of the same
+        or higher priority is queued (for optional extra requests such as hedges)
+
+        Returns:
+            The reserved token count, or None if the request should not be sent
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._queue and self._queue[0][0] <= priority:
+                return None
+            if max(self._paused_until - now, self._requests.wait_time(1), self._tokens.wait_time(tokens)) > 0:
+                return None
+            self._requests.take(1)
+            self._tokens.take(tokens)
+        self.metrics.increment(f"rate_limit_admitted_{PRIORITY_NAMES.get(priority, priority)}")
+        return tokens
+
+    def settle(self, reserved: int, actual: Optional[int]):
+        """Correct the token bucket once the real usage is known"""
+        if actual is None:
+            return
+        with self._cond:
+            self._tokens.take(actual - reserved)
+            self._cond.notify_all()
+
+    def release(self, reserved: int):
+        """Give back a reservation whose request was never sent"""
+        with self._cond:
+            self._refresh(time.monotonic())
+            for bucket, amount in ((self._requests, 1), (self._tokens, reserved)):
+                if bucket.rate > 0:
+                    bucket.level = min(bucket.capacity, bucket.level + amount)
+            self._cond.notify_all()
+
+    def estimate_wait(self, tokens: int, priority: int = PRIORITY_CHAT) -> float:
+        """Seconds a new request would currently wait (for display before submitting)"""
+        with self._cond:
+            self._refresh(time.monotonic())
+            return self._estimate([priority, next(self._seq), tokens, False])
+
+    # ---- learning from responses ----
+
+    def observe(self, headers, status_code: int):
+        """
+        Adopt limits advertised by the server (OpenAI-style x-ratelimit-* headers)
+
+        limit-requests / limit-tokens are per minute; remaining-* caps the
+        current bucket level, so quota used by other clients is accounted for.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refresh(now)
+            limit_requests = _number(headers.get("x-ratelimit-limit-requests"))
+            if limit_requests:
+                rps = limit_requests / 60.0
+                self._requests.reset(rps, max(1.0, rps * Config.RATE_LIMIT_BURST_SECONDS))
+            limit_tokens = _number(headers.get("x-ratelimit-limit-tokens"))
+            if limit_tokens:
+                self._tokens.reset(limit_tokens / 60.0, limit_tokens)
+            remaining_requests = _number(headers.get("x-ratelimit-remaining-requests"))
+            if remaining_requests is not None and self._requests.rate > 0:
+                self._requests.level = min(self._requests.level, remaining_requests)
+            remaining_tokens = _number(headers.get("x-ratelimit-remaining-tokens"))
+            if remaining_tokens is not None and self._tokens.rate > 0:
+                self._tokens.level = min(self._tokens.level, remaining_tokens)
+
+            if status_code == 429:
+                self.metrics.increment("rate_limit_429")
+                pause = _number(headers.get("Retry-After"))
+                if pause is None:
+                    resets = [parse_duration(headers.get(h) or "")
+                              for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+                    pause = max((r for r in resets if r is not None), default=Config.RETRY_BACKOFF_BASE)
+                self._paused_until = max(self._paused_until, now + min(pause, Config.RATE_LIMIT_MAX_WAIT))
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            self._refresh(time.monotonic())
+            queued: Dict[str, int] = {}
+            for priority, _, _, cancelled in self._queue:
+                if not cancelled:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    queued[name] = queued.get(name, 0) + 1
+            return {
+                "requests_per_second": self._requests.rate,
+                "tokens_per_minute": self._tokens.rate * 60,
+                "request_level": round(self._requests.level, 2),
+                "token_level": round(self._tokens.level),
+                "paused_for": max(0.0, self._paused_until - time.monotonic()),
+                "queued": queued,
+            }
+
+    # ---- internals (called with the lock held) ----
+
+    def _refresh(self, now: float):
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        while self._queue and self._queue[0][3]:
+            heapq.heappop(self._queue)
+
+    def _estimate(self, waiter: list) -> float:
+        """Time for the buckets to serve every live waiter ahead of (and including) this one"""
+        ahead = [w for w in self._queue if not w[3] and w[:2] < waiter[:2]]
+        requests = len(ahead) + 1
+        tokens = sum(w[2] for w in ahead) + waiter[2]
+        pause = max(0.0, self._paused_until - time.monotonic())
+        wait_requests = 0.0
+        if self._requests.rate > 0:
+            wait_requests = max(0.0, requests - self._requests.level) / self._requests.rate
+        wait_tokens = 0.0
+        if self._tokens.rate > 0:
+            wait_tokens = max(0.0, tokens - self._tokens.level) / self._tokens.rate
+        return pause + max(wait_requests, wait_tokens)
+
+
+class RateLimitExceeded(Exception):
+    """The queue is so long that waiting would exceed Config.RATE_LIMIT_MAX_WAIT"""
+
+    status_code = 429
+
+    def __init__(self, estimated_wait: float):
+        super().__init__(f"Service is busy, estimated wait {estimated_wait:.0f}s. Please try again shortly.")
+        self.retry_after = estimated_wait
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# ---- per-thread request context ----
+
+_context = threading.local()
+
+@contextmanager
+def request_context(
+    priority: Optional[int] = None,
+    on_wait: Optional[Callable[[float], None]] = None,
+    on_admitted: Optional[Callable[[float], None]] = None,
+):
+    """
+    Set the priority and callbacks for API calls made by this thread
+
+    on_wait gets the estimated wait while a call is queued; on_admitted gets the
+    seconds actually spent queued, once the call is admitted (e.g. to keep queueing
+    out of a latency measurement).
+
+    Usage:
+        with request_context(PRIORITY_ANALYSIS, on_wait=lambda s: slot.info(f"Queued, ~{s:.0f}s")):
+            analyze_image(...)
+    """
+    previous = (getattr(_context, "priority", None), getattr(_context, "on_wait", None),
+                getattr(_context, "on_admitted", None))
+    _context.priority, _context.on_wait, _context.on_admitted = priority, on_wait, on_admitted
+    try:
+        yield
+    finally:
+        _context.priority, _context.on_wait, _context.on_admitted = previous
+
+def current_context(messages: List[Dict]):
+    """(priority, on_wait) for a call from this thread; image requests default to analysis priority"""
+    priority = getattr(_context, "priority", None)
+    if priority is None:
+        priority = PRIORITY_ANALYSIS if any(m.get("image") for m in messages) else PRIORITY_CHAT
+    return priority, getattr(_context, "on_wait", None)
+
+def notify_admitted(waited: float):
+    """Report the seconds a call from this thread spent queued to its request_context"""
+    on_admitted = getattr(_context, "on_admitted", None)
+    if on_admitted is not None:
+        on_admitted(waited)
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter shared by every API call"""
+    global _default_limiter
+    if _default_limiter is None:
+        with _default_limiter_lock:
+            if _default_limiter is None:
+                _default_limiter = RateLimiter()
+    return _default_limiter
@@ -0,0 +1,65 @@
+"""Retry and error helpers shared by the sync and async API clients"""
+import random
+from typing import Optional, Tuple, Type
+from config import Config
+
+
+class QubridAPIError(Exception):
+    """API failure carrying the HTTP status and whether a retry may help"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in Config.RETRY_STATUS_CODES
+
+    @classmethod
+    def from_response(cls, response) -> "QubridAPIError":
+        """Build from a requests.Response (anything with status_code, text and headers)"""
+        return cls(
+            f"API Error {response.status_code}: {response.text}",
+            status_code=response.status_code,
+            retry_after=retry_after(response.headers),
+        )
+
+
+def retry_after(headers) -> Optional[float]:
+    """Seconds from a Retry-After header, or None if absent or in HTTP-date form"""
+    header = headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass  # HTTP-date form, fall back to our own backoff
+    return None
+
+def is_retryable(error: Exception, transient: Tuple[Type[BaseException], ...] = ()) -> bool:
+    """
+    Whether another attempt may succeed
+
+    Args:
+        error: The failure of the last attempt
+        transient: The HTTP library's connection and timeout errors (connection
+                   resets, DNS blips and timeouts are worth another try)
+    """
+    if isinstance(error, QubridAPIError):
+        return error.retryable
+    return isinstance(error, transient)
+
+def backoff_delay(retries: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when the server sends it"""
+    if retry_after is not None:
+        return min(retry_after, Config.RETRY_BACKOFF_MAX)
+    ceiling = min(Config.RETRY_BACKOFF_MAX, Config.RETRY_BACKOFF_BASE * (2 ** retries))
+    return random.uniform(0, ceiling)
+
+def wrap_error(prefix: str, error: Exception) -> QubridAPIError:
+    """Keep the historical message prefix while preserving status information"""
+    return QubridAPIError(
+        f"{prefix}: {str(error)}",
+        status_code=getattr(error, "status_code", None),
+        retry_after=getattr(error, "retry_after", None),
+    )
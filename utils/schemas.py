@@ -31,3 +31,27 @@ class NutritionData(BaseModel):
         data = self.model_dump()
         # Flatten dietary for the existing UI components
         return data
+
+def nutrition_json_schema() -> dict:
+    """
+    JSON Schema for NutritionData in the strict form structured-output
+    endpoints expect: nested models inlined (no $ref), every property
+    required and no additional properties.
+    """
+    schema = NutritionData.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def _strict(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                node = dict(definitions[node["$ref"].split("/")[-1]])
+            node = {k: _strict(v) for k, v in node.items() if k != "title"}
+            if node.get("type") == "object" and "properties" in node:
+                node["required"] = list(node["properties"])
+                node["additionalProperties"] = False
+            return node
+        if isinstance(node, list):
+            return [_strict(item) for item in node]
+        return node
+
+    return _strict(schema)
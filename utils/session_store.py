@@ -0,0 +1,295 @@
+"""Memory-bounded store for per-session payloads (images, analysis results, chat transcripts)"""
+import base64
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from config import Config
+from .metrics import get_metrics
+
+
+class SessionStore:
+    """
+    Holds each session's large values outside st.session_state.
+
+    Blobs are content-addressed and reference counted, so an image uploaded
+    in several sessions is kept once. Only compressed bytes are stored (the
+    normalized JPEG sent to the model and the sidebar preview); the base64
+    string and the decoded thumbnail are rebuilt on demand and never kept.
+    Analysis results, the chat transcript and the rendered report are stored
+    as compact JSON through put_json/get_json.
+
+    All resident blobs share one memory budget. When it is exceeded, the
+    least recently used blobs of at least SESSION_SPILL_MIN_BYTES are written
+    to a disk directory and read back (and made resident again) on access.
+    Sessions idle for longer than SESSION_IDLE_SECONDS are dropped, together
+    with every blob no other session references.
+
+    Usage:
+        store = get_session_store()
+        store.put(session_id, "encoded", jpeg_bytes)
+        image_base64 = store.get_base64(session_id, "encoded")
+        store.put_json(session_id, "messages", transcript)
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        memory_bytes: Optional[int] = None,
+        idle_seconds: Optional[int] = None,
+        spill_min_bytes: Optional[int] = None,
+    ):
+        # Per process: spill files are only meaningful to the store that wrote them
+        sessions_dir = os.path.join(cache_dir or Config.CACHE_DIR, "sessions")
+        self.spill_dir = os.path.join(sessions_dir, str(os.getpid()))
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        _remove_stale_spill_dirs(sessions_dir)
+        self.memory_bytes = Config.SESSION_MEMORY_BYTES if memory_bytes is None else memory_bytes
+        self.idle_seconds = Config.SESSION_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.spill_min_bytes = Config.SESSION_SPILL_MIN_BYTES if spill_min_bytes is None else spill_min_bytes
+
+        # digest -> {"data": bytes or None when spilled, "size", "refs"}; order is recency of use
+        self._blobs: "OrderedDict[str, Dict]" = OrderedDict()
+        # session id -> {"names": {name: digest}, "seen": last access time}
+        self._sessions: Dict[str, Dict] = {}
+        self._resident = 0
+        self._spilled = 0
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+    # ---- public API ----
+
+    def put(self, session_id: str, name: str, blob: bytes):
+        """Store (or replace) a named blob of a session"""
+        digest = hashlib.sha1(blob).hexdigest()
+        with self._lock:
+            session = self._touch(session_id)
+            previous = session["names"].get(name)
+            if previous == digest:
+                self._blobs.move_to_end(digest)
+                return
+            entry = self._blobs.get(digest)
+            if entry is None:
+                self._blobs[digest] = {"data": blob, "size": len(blob), "refs": 1}
+                self._resident += len(blob)
+            else:
+                entry["refs"] += 1
+                self._blobs.move_to_end(digest)
+            session["names"][name] = digest
+            if previous is not None:
+                self._release(previous)
+            self._enforce_budget()
+        self._maybe_sweep()
+
+    def get(self, session_id: str, name: str) -> Optional[bytes]:
+        """Blob bytes, read back from disk if spilled; None if absent or its session was evicted"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            digest = session["names"].get(name) if session else None
+            if digest is None:
+                return None
+            self._touch(session_id)
+            entry = self._blobs[digest]
+            self._blobs.move_to_end(digest)
+            if entry["data"] is None:
+                entry["data"] = self._load(digest)
+                if entry["data"] is None:
+                    # Spill file vanished (cache dir cleaned): forget the blob
+                    del session["names"][name]
+                    self._release(digest)
+                    return None
+                self._resident += entry["size"]
+                self._spilled -= entry["size"]
+                self.metrics.increment("session_blob_loads")
+                self._enforce_budget(keep=digest)
+            return entry["data"]
+
+    def get_base64(self, session_id: str, name: str) -> Optional[str]:
+        """Blob as a base64 string (built per call, not kept)"""
+        blob = self.get(session_id, name)
+        return base64.b64encode(blob).decode() if blob is not None else None
+
+    def put_json(self, session_id: str, name: str, value: Any):
+        """Store a JSON-serializable value as a blob"""
+        self.put(session_id, name, json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+    def get_json(self, session_id: str, name: str, default: Any = None) -> Any:
+        """Value stored with put_json (a fresh copy per call), or default if absent or evicted"""
+        blob = self.get(session_id, name)
+        return json.loads(blob) if blob is not None else default
+
+    def has(self, session_id: str, name: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return bool(session) and name in session["names"]
+
+    def drop(self, session_id: str):
+        """Forget a session and every blob only it referenced"""
+        with self._lock:
+            self._drop(session_id)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop sessions idle for longer than idle_seconds; returns how many were dropped"""
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [sid for sid, s in self._sessions.items() if now - s["seen"] > self.idle_seconds]
+            for session_id in idle:
+                self._drop(session_id)
+            self._last_sweep = now
+        if idle:
+            self.metrics.increment("session_evictions", len(idle))
+        return len(idle)
+
+    def clear(self):
+        """Drop every session and remove the spill directory"""
+        with self._lock:
+            self._blobs.clear()
+            self._sessions.clear()
+            self._resident = self._spilled = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def session_usage(self, session_id: str) -> Dict:
+        """Bytes referenced by one session (shared blobs count fully in each session)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            usage = {"blobs": 0, "memory_bytes": 0, "disk_bytes": 0}
+            for digest in (session["names"].values() if session else ()):
+                entry = self._blobs[digest]
+                usage["blobs"] += 1
+                usage["memory_bytes" if entry["data"] is not None else "disk_bytes"] += entry["size"]
+            return usage
+
+    def get_stats(self) -> Dict:
+        """Totals across every session"""
+        counters = self.metrics.to_json()["counters"]
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "blobs": len(self._blobs),
+                "memory_bytes": self._resident,
+                "memory_cap": self.memory_bytes,
+                "disk_bytes": self._spilled,
+                "spills": counters.get("session_blob_spills", 0),
+                "loads": counters.get("session_blob_loads", 0),
+                "evicted_sessions": counters.get("session_evictions", 0),
+            }
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep > min(60, self.idle_seconds):
+            self.evict_idle()
+
+    # ---- internals (called with the lock held) ----
+
+    def _touch(self, session_id: str) -> Dict:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {"names": {}, "seen": 0.0}
+        session["seen"] = time.time()
+        return session
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        for digest in session["names"].values():
+            self._release(digest)
+
+    def _release(self, digest: str):
+        entry = self._blobs[digest]
+        entry["refs"] -= 1
+        if entry["refs"] > 0:
+            return
+        del self._blobs[digest]
+        if entry["data"] is not None:
+            self._resident -= entry["size"]
+        else:
+            self._spilled -= entry["size"]
+            _silent_remove(self._path(digest))
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        """Spill least recently used large blobs until resident bytes fit the budget"""
+        if self._resident <= self.memory_bytes:
+            return
+        for digest, entry in list(self._blobs.items()):
+            if self._resident <= self.memory_bytes:
+                break
+            if digest == keep or entry["data"] is None or entry["size"] < self.spill_min_bytes:
+                continue
+            if not self._spill(digest, entry["data"]):
+                break    # Disk unavailable: stay over budget rather than lose data
+            entry["data"] = None
+            self._resident -= entry["size"]
+            self._spilled += entry["size"]
+            self.metrics.increment("session_blob_spills")
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.spill_dir, f"{digest}.bin")
+
+    def _spill(self, digest: str, blob: bytes) -> bool:
+        path = self._path(digest)
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"Session spill failed: {e}")
+            return False
+
+    def _load(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._path(digest), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        _silent_remove(self._path(digest))
+        return blob
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _remove_stale_spill_dirs(sessions_dir: str):
+    """Delete spill directories left behind by processes that are no longer running"""
+    try:
+        names = os.listdir(sessions_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+            shutil.rmtree(os.path.join(sessions_dir, name), ignore_errors=True)
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True     # Signal 0 would terminate the process on Windows: keep the directory
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True     # Exists, owned by another user
+    return True
+
+
+_default_store: Optional[SessionStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide store shared by every Streamlit session"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = SessionStore()
+    return _default_store
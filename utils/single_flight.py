@@ -0,0 +1,164 @@
+"""Single-flight coalescing of identical in-flight work"""
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import Config
+from .metrics import get_metrics
+
+try:
+    import fcntl
+except ImportError:     # Windows: coalescing stays within the process
+    fcntl = None
+
+
+class SingleFlight:
+    """
+    Runs a function once per key while earlier calls with that key are still running.
+
+    Within a process, the first caller (the leader) executes the function and
+    every concurrent caller with the same key waits on the leader's Future and
+    receives the same result, or the same exception.
+
+    Across worker processes, the leader also holds an exclusive flock on a
+    per-key file under lock_dir. A leader that had to wait for another
+    process calls `recheck` first, so work that process already finished
+    (e.g. an analysis now in the shared disk cache) is not repeated.
+
+    Usage:
+        result, shared = get_single_flight().do(key, compute, recheck=lookup_cache)
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, cross_process: Optional[bool] = None):
+        if cross_process is None:
+            cross_process = Config.SINGLE_FLIGHT_CROSS_PROCESS
+        self.lock_dir = os.path.join(lock_dir or Config.CACHE_DIR, "inflight")
+        self.cross_process = cross_process and fcntl is not None
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        recheck: Optional[Callable[[], Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """
+        Args:
+            key: Identity of the work (same key, same result)
+            fn: Produces the result; only the leader calls it
+            recheck: Returns a result another process already produced, or None
+
+        Returns:
+            (result, shared) where shared is True if this caller did not run fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            self.metrics.increment("single_flight_coalesced")
+            return call.result(), True
+
+        self.metrics.increment("single_flight_leaders")
+        try:
+            result, shared = self._run(key, fn, recheck)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, shared
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict:
+        counters = self.metrics.to_json()["counters"]
+        leaders = counters.get("single_flight_leaders", 0)
+        coalesced = counters.get("single_flight_coalesced", 0)
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": leaders,
+            "coalesced": coalesced,
+            "cross_process_waits": counters.get("single_flight_process_waits", 0),
+            "cross_process_shared": counters.get("single_flight_process_shared", 0),
+            "coalesce_rate": coalesced / (leaders + coalesced) if leaders + coalesced else 0.0,
+        }
+
+    # ---- cross-process lock ----
+
+    def _run(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+        if not self.cross_process:
+            return fn(), False
+
+        fd, waited = self._acquire(key)
+        if fd is None:
+            return fn(), False
+        try:
+            if waited and recheck is not None:
+                result = recheck()
+                if result is not None:
+                    self.metrics.increment("single_flight_process_shared")
+                    return result, True
+            return fn(), False
+        finally:
+            self._release(key, fd)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key}.lock")
+
+    def _acquire(self, key: str) -> Tuple[Optional[int], bool]:
+        """Exclusive flock on the key's file; (fd, whether another process held it) or (None, False)"""
+        path = self._path(key)
+        waited = False
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            while True:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if not waited:
+                        self.metrics.increment("single_flight_process_waits")
+                    waited = True
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                # The previous holder unlinks the file before unlocking: if we locked
+                # a stale inode, start over on the file now at that path
+                try:
+                    if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                        return fd, waited
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+        except OSError as e:
+            print(f"Single-flight lock unavailable, running uncoordinated: {e}")
+            return None, False
+
+    def _release(self, key: str, fd: int):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        os.close(fd)     # Closing the descriptor drops the flock
+
+
+_default_single_flight: Optional[SingleFlight] = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide SingleFlight shared by every Streamlit session"""
+    global _default_single_flight
+    if _default_single_flight is None:
+        with _default_single_flight_lock:
+            if _default_single_flight is None:
+                _default_single_flight = SingleFlight()
+    return _default_single_flight
@@ -0,0 +1,203 @@
+"""Incremental Server-Sent Events decoder for streaming chat completions"""
+import json
+import re
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+# Returned by event_delta for the terminating "data: [DONE]" event
+SSE_DONE = object()
+
+_BOM = b"\xef\xbb\xbf"
+
+
+class SSEEvent(NamedTuple):
+    event: str             # "message" unless an event: field named it
+    data: str              # data: lines joined with "\n"
+    id: Optional[str]      # Last event id seen so far on the stream
+    retry: Optional[int]   # Reconnection time in ms, if this event set one
+
+
+class SSEDecoder:
+    """
+    Turns raw response bytes into complete events, following the WHATWG
+    event-stream rules: lines end in LF, CRLF or CR (also when split across
+    reads), a leading BOM is skipped, ":" starts a comment, one space after
+    the colon is dropped, multi-line data is joined with "\\n", and an event
+    is dispatched on a blank line only if it carried data.
+
+    Bytes are buffered until a line is complete and each line is decoded
+    once, so multi-byte UTF-8 split between reads is handled.
+
+    Usage:
+        decoder = SSEDecoder()
+        for raw in response.iter_content(chunk_size=None):
+            for event in decoder.feed(raw):
+                ...
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip_lf = False       # Last read ended in CR; a leading LF completes that CRLF
+        self._started = False
+        self._data: List[str] = []
+        self._event = ""
+        self._retry: Optional[int] = None
+        self.last_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Consume a read from the socket and return the events it completed"""
+        if not chunk:
+            return []
+        if self._skip_lf:
+            self._skip_lf = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+                if not chunk:
+                    return []
+        buffer = self._buffer
+        if not self._started:
+            buffer += chunk
+            if len(buffer) < len(_BOM) and _BOM.startswith(bytes(buffer)):
+                return []
+            if buffer.startswith(_BOM):
+                del buffer[:len(_BOM)]
+            self._started = True
+            chunk = bytes(buffer)
+            buffer.clear()
+            if not chunk:
+                return []
+
+        # Only the new bytes are searched: the buffer never holds a line break
+        if chunk[-1] in (10, 13):
+            end = len(chunk) - 1
+        else:
+            end = max(chunk.rfind(b"\n"), chunk.rfind(b"\r"))
+            if end < 0:
+                buffer += chunk
+                return []
+        complete = chunk[:end + 1] if end + 1 < len(chunk) else chunk
+        if buffer:
+            complete = bytes(buffer) + complete
+            buffer.clear()
+        if end + 1 < len(chunk):
+            buffer += chunk[end + 1:]
+        elif chunk[end] == 13:
+            self._skip_lf = True
+
+        events = []
+        # bytes.splitlines breaks on exactly LF, CRLF and CR
+        for line in complete.splitlines():
+            if not line:
+                data = self._data
+                if data:
+                    events.append(SSEEvent(self._event or "message", data[0] if len(data) == 1 else "\n".join(data),
+                                           self.last_id, self._retry))
+                    self._data = []
+                    self._event = ""
+                    self._retry = None
+                continue
+            if line.startswith(b"data:"):     # Hot path: nearly every line is data
+                value = line[6:] if line[5:6] == b" " else line[5:]
+                self._data.append(value.decode("utf-8", "replace"))
+                continue
+            if line[:1] == b":":
+                continue
+            name, colon, value = line.partition(b":")
+            if colon and value[:1] == b" ":
+                value = value[1:]
+            self._field(name, value.decode("utf-8", "replace"))
+        return events
+
+    def _field(self, name: bytes, value: str):
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event = value
+        elif name == b"id":
+            if "\0" not in value:
+                self.last_id = value
+        elif name == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        # Unknown fields are ignored
+
+
+def event_delta(event: SSEEvent):
+    """
+    Text carried by a chat-completion chunk
+
+    Returns:
+        The delta text, SSE_DONE at the end of the stream, or None for chunks without text
+
+    Raises:
+        ValueError: For malformed JSON, or the message of an "error" event
+    """
+    data = event.data
+    if event.event == "error":
+        raise ValueError(data)
+    if data == "[DONE]" or data.strip() == "[DONE]":
+        return SSE_DONE
+    content = _fast_delta(data)
+    if content is not None:
+        return content or None
+    chunk = json.loads(data)
+    if isinstance(chunk, dict) and chunk.get("error"):
+        raise ValueError(str(chunk["error"]))
+    choices = chunk.get("choices") if isinstance(chunk, dict) else None
+    if choices:
+        return (choices[0].get("delta") or {}).get("content") or None
+    return None
+
+# delta.content of the first choice when it is a plain string; the literal is matched with the
+# unrolled-loop pattern for JSON strings. choices[0] is also the first "delta" in the text.
+_FAST_DELTA = re.compile(
+    r'"delta"\s*:\s*\{\s*(?:"role"\s*:\s*"[a-z]*"\s*,\s*)?'
+    r'"content"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"\s*[,}]'
+)
+
+def _fast_delta(data: str) -> Optional[str]:
+    """
+    Pull delta.content out of a chunk without parsing the whole object; only
+    the string literal is decoded, and only if it has escapes. None means
+    "not the common shape", so the caller parses the JSON fully.
+    """
+    match = _FAST_DELTA.search(data)
+    if match is None:
+        return None
+    literal = match.group(1)
+    if "\\" in literal:
+        return json.loads(f'"{literal}"')
+    return literal
+
+
+def coalesce(deltas: Iterable[str], max_chars: int = 0, max_delay: float = 0.0) -> Iterator[str]:
+    """
+    Merge small deltas into larger chunks
+
+    A chunk is released once it reaches max_chars or max_delay seconds have
+    passed since the last release (checked as deltas arrive). The first delta
+    is always released at once so time to first token is unchanged, and
+    whatever is buffered is flushed when the stream ends.
+
+    Args:
+        deltas: Text pieces in arrival order
+        max_chars: Size threshold (0 disables it)
+        max_delay: Age threshold in seconds (0 disables it)
+    """
+    if max_chars <= 0 and max_delay <= 0:
+        yield from deltas
+        return
+    pending: List[str] = []
+    size = 0
+    released = None
+    for delta in deltas:
+        pending.append(delta)
+        size += len(delta)
+        now = time.monotonic()
+        if (released is None
+                or (max_chars > 0 and size >= max_chars)
+                or (max_delay > 0 and now - released >= max_delay)):
+            yield "".join(pending)
+            pending, size, released = [], 0, now
+    if pending:
+        yield "".join(pending)
@@ -0,0 +1,113 @@
+"""Incremental JSON parser for streamed analysis responses"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Emits the top-level fields of a JSON object as soon as each one is complete.
+
+    Text is fed in arbitrary chunks (as produced by call_qubrid_api_stream).
+    A small state machine tracks string/escape state and nesting depth, so
+    every character is inspected exactly once; a field is only handed to
+    json.loads when its value has fully closed. Anything before the first
+    '{' (prose, a ```json fence) is ignored.
+
+    Usage:
+        parser = IncrementalJSONParser()
+        for chunk in call_qubrid_api_stream(messages):
+            for key, value in parser.feed(chunk):
+                ...
+        full_text = parser.text
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._buffer = ""          # Text of the object from its opening '{'
+        self._pos = 0              # Next character of _buffer to scan
+        self._member_start = 0     # Start of the current top-level member
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.done = False
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far, for final validation with parse_nutrition_data"""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of text
+
+        Returns:
+            (key, value) pairs for fields that completed within this chunk
+        """
+        self._chunks.append(chunk)
+        if self.done:
+            return []
+
+        if not self._started:
+            start = chunk.find("{")
+            if start == -1:
+                return []
+            chunk = chunk[start:]
+            self._started = True
+        self._buffer += chunk
+
+        events = []
+        buffer = self._buffer
+        depth, in_string, escape = self._depth, self._in_string, self._escape
+        i = self._pos
+        end = len(buffer)
+
+        while i < end:
+            ch = buffer[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+                if depth == 1:
+                    self._member_start = i + 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    self._emit(buffer[self._member_start:i], events)
+                    self.done = True
+                    i += 1
+                    break
+            elif ch == "," and depth == 1:
+                self._emit(buffer[self._member_start:i], events)
+                self._member_start = i + 1
+            i += 1
+
+        self._depth, self._in_string, self._escape = depth, in_string, escape
+        self._pos = i
+        return events
+
+    def _emit(self, member: str, events: List[Tuple[str, Any]]):
+        if not member.strip():
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return  # Malformed member; final validation reports it
+        for key, value in parsed.items():
+            self.fields[key] = value
+            events.append((key, value))
+
+
+def iter_fields(chunks: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+    """Convenience generator: (key, value) for each completed top-level field"""
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
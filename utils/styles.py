@@ -1,7 +1,10 @@
 """
 Dynamic CSS Manager for Light/Dark Themes
 """
+from functools import lru_cache
 
+# The stylesheet only depends on the theme, so each one is built once per process
+@lru_cache(maxsize=4)
 def get_custom_css(theme_mode):
     # Define Color Palettes
     if theme_mode == "Dark":
@@ -1,15 +1,33 @@
 """UI display components"""
+import hashlib
+import json
+from functools import lru_cache
 import streamlit as st
 
+def content_key(data: dict) -> str:
+    """Stable hash of an analysis result; computed once per analysis to key memoized renders"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+def dish_title_html(dish_name: str) -> str:
+    return f"""
+    <div class="dish-title-card">
+        <h2 class="dish-name">🍽️ {dish_name}</h2>
+    </div>
+    """
+
 def display_macro_row(data: dict):
     """Displays the horizontal nutrition bar with icons"""
-    calories = data.get('calories', 0)
-    protein = data.get('protein', 0)
-    carbs = data.get('carbs', 0)
-    fat = data.get('fat', 0)
+    st.markdown(macro_row_html(data), unsafe_allow_html=True)
+
+def macro_row_html(data: dict) -> str:
+    # Stringified first: streamed partial values are not guaranteed to be hashable
+    return _macro_row_html(*(str(data.get(key, 0)) for key in ('calories', 'protein', 'carbs', 'fat')))
 
+@lru_cache(maxsize=256)
+def _macro_row_html(calories, protein, carbs, fat) -> str:
     # Uses the CSS classes defined in styles.py for dynamic theming
-    html_content = f"""
+    return f"""
     <div class="glass-card">
         <div style="display: flex; align-items: center; gap: 1rem; margin-bottom: 0.5rem;">
             <span style="font-size: 1.2rem;">📊</span>
@@ -42,10 +60,13 @@ def display_macro_row(data: dict):
         </div>
     </div>
     """
-    st.markdown(html_content, unsafe_allow_html=True)
 
 def display_health_bar(score: int):
     """Displays the health score progress bar"""
+    st.markdown(health_bar_html(score), unsafe_allow_html=True)
+
+@lru_cache(maxsize=128)
+def health_bar_html(score: int) -> str:
     if score is None: score = 0
     
     if score >= 80:
@@ -65,7 +86,7 @@ def display_health_bar(score: int):
         text = "Poor"
         icon = "🛑"
 
-    html_content = f"""
+    return f"""
     <div class="glass-card">
         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.8rem;">
             <div style="display: flex; align-items: center; gap: 0.5rem;">
@@ -82,14 +103,20 @@ def display_health_bar(score: int):
         </div>
     </div>
     """
-    st.markdown(html_content, unsafe_allow_html=True)
 
-def display_metrics_footer(tokens, time_sec, tps):
-    """Displays the usage stats"""
+def display_metrics_footer(tokens, time_sec, tps, chat_stats: dict = None):
+    """Displays the usage stats, plus streaming latency of the last chat turn if available"""
+    chat_html = ""
+    if chat_stats and chat_stats.get('ttft') is not None:
+        chat_html += f'<span style="font-size: 0.85rem;">💬 <b>{chat_stats["ttft"]*1000:.0f}ms</b> First Token</span>'
+        if chat_stats.get('itl_mean') is not None:
+            chat_html += f'<span style="font-size: 0.85rem;">🔁 <b>{chat_stats["itl_mean"]*1000:.0f}ms</b> Inter-Token</span>'
+    
     st.markdown(f"""
     <div style="display: flex; justify-content: center; gap: 2rem; padding: 1rem; margin-top: 3rem; opacity: 0.6; color: inherit;">
         <span style="font-size: 0.85rem;">⚡ <b>{tokens}</b> Tokens</span>
         <span style="font-size: 0.85rem;">⏱️ <b>{time_sec:.2f}s</b> Response</span>
+        {chat_html}
     </div>
     """, unsafe_allow_html=True)
 
@@ -112,6 +139,15 @@ def format_analysis_report(data: dict) -> str:
         insights_str += f"- {insight}\n"
     
     allergens_str = ", ".join(allergens) if allergens else "None detected"
+    
+    # Notes from the local reference table, if it was consulted
+    reference_str = ""
+    check = data.get('reference_check')
+    if check:
+        reference_str += f"\n**⚖️ Reference Check** (vs. typical {check['match']}):\n"
+        reference_str += "".join(f"- {flag}\n" for flag in check['flags'])
+    if data.get('reference_filled'):
+        reference_str += f"\n_{', '.join(data['reference_filled']).title()} taken from the reference table._\n"
 
     return f"""
 ### 🍽️ {dish}
@@ -134,4 +170,4 @@ def format_analysis_report(data: dict) -> str:
 - **Fat:** {data.get('fat', 0)}g
 - **Fiber:** {data.get('fiber', 0)}g
 - **Sugar:** {data.get('sugar', 0)}g
-"""
+{reference_str}"""